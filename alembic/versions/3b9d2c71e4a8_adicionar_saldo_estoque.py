@@ -0,0 +1,59 @@
+"""Adicionar tabela de saldo de estoque
+
+Revision ID: 3b9d2c71e4a8
+Revises: f7639c07bd65
+Create Date: 2026-10-17 10:12:40.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9d2c71e4a8"
+down_revision: Union[str, Sequence[str], None] = "f7639c07bd65"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "saldoestoque",
+        sa.Column("produto_id", sa.Integer(), nullable=False),
+        sa.Column("quantidade_barris", sa.Float(), nullable=False),
+        sa.Column("volume_litros", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["produto_id"],
+            ["produto.id"],
+        ),
+        sa.PrimaryKeyConstraint("produto_id"),
+    )
+    # Popula os saldos a partir do histórico de movimentos já existente
+    op.execute(
+        """
+        INSERT INTO saldoestoque (produto_id, quantidade_barris, volume_litros)
+        SELECT p.id,
+               COALESCE(m.saldo, 0),
+               COALESCE(m.saldo, 0) * p.volume_litros
+        FROM produto p
+        LEFT JOIN (
+            SELECT produto_id,
+                   SUM(CASE WHEN tipo_movimento = 'entrada'
+                            THEN quantidade ELSE -quantidade END) AS saldo
+            FROM movimentoestoque
+            WHERE tipo_movimento IN (
+                'entrada', 'saida_manual', 'saida_venda', 'saida_venda_barril'
+            )
+            GROUP BY produto_id
+        ) m ON m.produto_id = p.id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("saldoestoque")
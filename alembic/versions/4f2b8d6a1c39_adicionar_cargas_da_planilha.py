@@ -0,0 +1,38 @@
+"""Adicionar registro das cargas da planilha do ETL
+
+Revision ID: 4f2b8d6a1c39
+Revises: 9a4c6e1d2b73
+Create Date: 2026-10-17 21:40:27.508113
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4f2b8d6a1c39"
+down_revision: Union[str, Sequence[str], None] = "9a4c6e1d2b73"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "cargaplanilha",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "sha256", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False
+        ),
+        sa.Column("concluida_em", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("cargaplanilha")
@@ -0,0 +1,44 @@
+"""Adicionar índices para as consultas mais frequentes
+
+Revision ID: 5d0e7b3f96a1
+Revises: c57a9e2b10f4
+Create Date: 2026-10-17 13:40:52.204718
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5d0e7b3f96a1"
+down_revision: Union[str, Sequence[str], None] = "c57a9e2b10f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filtros por período (data é a primeira coluna) e DELETE do ETL por
+    # (data, produto_id)
+    op.create_index(
+        "ix_venda_data_produto_id", "venda", ["data", "produto_id"], unique=False
+    )
+    # Saldo e custo médio por produto e tipo de movimento. No PostgreSQL o
+    # índice também cobre as colunas lidas (INCLUDE); o SQLite ignora a opção.
+    op.create_index(
+        "ix_movimentoestoque_produto_id_tipo_movimento",
+        "movimentoestoque",
+        ["produto_id", "tipo_movimento"],
+        unique=False,
+        postgresql_include=["quantidade", "custo_unitario"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_movimentoestoque_produto_id_tipo_movimento", table_name="movimentoestoque"
+    )
+    op.drop_index("ix_venda_data_produto_id", table_name="venda")
@@ -0,0 +1,71 @@
+"""Adicionar base do custo médio ao saldo de estoque
+
+Revision ID: 8e41f0a9c2d5
+Revises: 3b9d2c71e4a8
+Create Date: 2026-10-17 11:02:19.530871
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8e41f0a9c2d5"
+down_revision: Union[str, Sequence[str], None] = "3b9d2c71e4a8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("saldoestoque", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "custo_total_entradas", sa.Float(), nullable=False, server_default="0"
+            )
+        )
+        batch_op.add_column(
+            sa.Column(
+                "quantidade_entradas", sa.Float(), nullable=False, server_default="0"
+            )
+        )
+
+    # Popula a base a partir das entradas já gravadas. A soma é feita em Python,
+    # na ordem de gravação, para reproduzir exatamente o cálculo anterior.
+    conn = op.get_bind()
+    entradas = conn.execute(
+        sa.text(
+            "SELECT produto_id, quantidade, custo_unitario FROM movimentoestoque "
+            "WHERE tipo_movimento = 'entrada' ORDER BY id"
+        )
+    )
+    bases = {}
+    for produto_id, quantidade, custo_unitario in entradas:
+        custo_total, quantidade_total = bases.get(produto_id, (0.0, 0.0))
+        quantidade_total += quantidade
+        if custo_unitario is not None:
+            custo_total += quantidade * custo_unitario
+        bases[produto_id] = (custo_total, quantidade_total)
+
+    for produto_id, (custo_total, quantidade_total) in bases.items():
+        conn.execute(
+            sa.text(
+                "UPDATE saldoestoque SET custo_total_entradas = :custo, "
+                "quantidade_entradas = :quantidade WHERE produto_id = :produto_id"
+            ),
+            {
+                "custo": custo_total,
+                "quantidade": quantidade_total,
+                "produto_id": produto_id,
+            },
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("saldoestoque", schema=None) as batch_op:
+        batch_op.drop_column("quantidade_entradas")
+        batch_op.drop_column("custo_total_entradas")
@@ -0,0 +1,52 @@
+"""Adicionar hash de conteúdo e chave natural das vendas do ETL
+
+Revision ID: 9a4c6e1d2b73
+Revises: 5d0e7b3f96a1
+Create Date: 2026-10-17 16:05:12.418032
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9a4c6e1d2b73"
+down_revision: Union[str, Sequence[str], None] = "5d0e7b3f96a1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "venda",
+        sa.Column(
+            "hash_conteudo", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True
+        ),
+    )
+    op.add_column(
+        "venda",
+        sa.Column("ordem_no_dia", sa.Integer(), nullable=False, server_default="0"),
+    )
+    # Uma venda do ETL por (data, produto, linha do dia). As linhas antigas
+    # ficam sem hash e fora do índice; a próxima carga do ETL as substitui.
+    op.create_index(
+        "uq_venda_data_produto_id_ordem_etl",
+        "venda",
+        ["data", "produto_id", "ordem_no_dia"],
+        unique=True,
+        sqlite_where=sa.text("hash_conteudo IS NOT NULL"),
+        postgresql_where=sa.text("hash_conteudo IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("uq_venda_data_produto_id_ordem_etl", table_name="venda")
+    with op.batch_alter_table("venda", schema=None) as batch_op:
+        batch_op.drop_column("ordem_no_dia")
+        batch_op.drop_column("hash_conteudo")
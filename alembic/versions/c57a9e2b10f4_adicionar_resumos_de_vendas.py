@@ -0,0 +1,100 @@
+"""Adicionar resumos diários e mensais de vendas
+
+Revision ID: c57a9e2b10f4
+Revises: 8e41f0a9c2d5
+Create Date: 2026-10-17 12:25:03.671442
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c57a9e2b10f4"
+down_revision: Union[str, Sequence[str], None] = "8e41f0a9c2d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Campo do resumo -> coluna correspondente em venda
+CAMPOS_VENDA = {
+    "receita": "total",
+    "cartao": "cartao",
+    "dinheiro": "dinheiro",
+    "pix": "pix",
+    "custo_func": "custo_func",
+    "custo_copos": "custo_copos",
+    "custo_boleto": "custo_boleto",
+    "lucro": "lucro",
+}
+
+
+def _colunas_de_totais():
+    return [sa.Column(campo, sa.Float(), nullable=False) for campo in CAMPOS_VENDA] + [
+        sa.Column("num_vendas", sa.Integer(), nullable=False)
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    resumo_diario = op.create_table(
+        "resumovendadiario",
+        sa.Column("data", sa.Date(), nullable=False),
+        sa.Column("dia_semana", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        *_colunas_de_totais(),
+        sa.PrimaryKeyConstraint("data", "dia_semana"),
+    )
+    resumo_mensal = op.create_table(
+        "resumovendamensal",
+        sa.Column("ano", sa.Integer(), nullable=False),
+        sa.Column("mes", sa.Integer(), nullable=False),
+        *_colunas_de_totais(),
+        sa.PrimaryKeyConstraint("ano", "mes"),
+    )
+
+    # Popula os resumos a partir das vendas já existentes
+    venda = sa.table(
+        "venda",
+        sa.column("id"),
+        sa.column("data"),
+        sa.column("dia_semana"),
+        *(sa.column(coluna) for coluna in CAMPOS_VENDA.values()),
+    )
+    dia_semana = sa.func.coalesce(venda.c.dia_semana, "")
+    op.execute(
+        resumo_diario.insert().from_select(
+            ["data", "dia_semana", *CAMPOS_VENDA, "num_vendas"],
+            sa.select(
+                venda.c.data,
+                dia_semana,
+                *(
+                    sa.func.coalesce(sa.func.sum(venda.c[coluna]), 0.0)
+                    for coluna in CAMPOS_VENDA.values()
+                ),
+                sa.func.count(venda.c.id),
+            ).group_by(venda.c.data, dia_semana),
+        )
+    )
+
+    ano = sa.extract("year", resumo_diario.c.data)
+    mes = sa.extract("month", resumo_diario.c.data)
+    op.execute(
+        resumo_mensal.insert().from_select(
+            ["ano", "mes", *CAMPOS_VENDA, "num_vendas"],
+            sa.select(
+                sa.cast(ano, sa.Integer),
+                sa.cast(mes, sa.Integer),
+                *(sa.func.sum(resumo_diario.c[campo]) for campo in CAMPOS_VENDA),
+                sa.func.sum(resumo_diario.c.num_vendas),
+            ).group_by(ano, mes),
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("resumovendamensal")
+    op.drop_table("resumovendadiario")
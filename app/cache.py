@@ -0,0 +1,305 @@
+"""
+Cache dos relatórios do WhatsApp.
+
+`get_report_data` e `get_dias_movimento` são envolvidos por `report_cache`,
+que guarda o resultado por (consulta, início, fim, produto). Uma entrada é
+invalidada quando uma venda com data dentro do seu período é gravada pelo
+formulário ou recarregada pelo ETL; o TTL limita o tempo máximo de vida de
+qualquer entrada.
+
+O armazenamento é configurável pela variável REPORT_CACHE_BACKEND:
+    memory  - LRU em memória do processo (padrão)
+    sqlite  - arquivo SQLite compartilhado entre workers e com o ETL
+              (caminho em REPORT_CACHE_PATH)
+    none    - desativa o cache
+
+O ETL roda em outro processo: com o backend `memory` a invalidação feita por
+ele não chega à API, que continua servindo os relatórios antigos até o TTL.
+Quando o ETL carrega o banco de uma API em execução, use `sqlite` (o ETL
+avisa no log quando o cache não é compartilhado).
+"""
+
+import bisect
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Iterable, Optional
+
+# Marca um resultado ausente no cache (None é um resultado válido)
+AUSENTE = object()
+
+
+class MemoryBackend:
+    """LRU com TTL em memória do processo."""
+
+    nome = "memory"
+    # Visível só para o processo que o criou (o ETL não alcança o da API)
+    compartilhado = False
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entradas: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.despejos = 0
+
+    def get(self, chave: tuple):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return AUSENTE
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._entradas[chave]
+                return AUSENTE
+            self._entradas.move_to_end(chave)
+            return valor
+
+    def set(self, chave: tuple, valor):
+        with self._lock:
+            self._entradas[chave] = (valor, time.monotonic() + self.ttl)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maxsize:
+                self._entradas.popitem(last=False)
+                self.despejos += 1
+
+    def invalidar(self, datas: list[date], produto_id: Optional[int]) -> int:
+        with self._lock:
+            chaves = [
+                chave for chave in self._entradas if afeta(chave, datas, produto_id)
+            ]
+            for chave in chaves:
+                del self._entradas[chave]
+            return len(chaves)
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+class SQLiteBackend:
+    """
+    LRU com TTL em um arquivo SQLite, compartilhado entre processos. Os
+    valores são gravados em JSON.
+    """
+
+    nome = "sqlite"
+    compartilhado = True
+
+    def __init__(self, path: str, maxsize: int = 256, ttl: float = 600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.despejos = 0
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_relatorio (
+                    chave TEXT PRIMARY KEY,
+                    inicio TEXT NOT NULL,
+                    fim TEXT NOT NULL,
+                    produto_id INTEGER,
+                    valor TEXT NOT NULL,
+                    expira REAL NOT NULL,
+                    acesso REAL NOT NULL
+                )
+                """
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def get(self, chave: tuple):
+        agora = time.time()
+        with self._conectar() as conn:
+            linha = conn.execute(
+                "SELECT valor, expira FROM cache_relatorio WHERE chave = ?",
+                (json.dumps(chave),),
+            ).fetchone()
+            if linha is None:
+                return AUSENTE
+            if linha[1] < agora:
+                conn.execute(
+                    "DELETE FROM cache_relatorio WHERE chave = ?", (json.dumps(chave),)
+                )
+                return AUSENTE
+            conn.execute(
+                "UPDATE cache_relatorio SET acesso = ? WHERE chave = ?",
+                (agora, json.dumps(chave)),
+            )
+            return json.loads(linha[0])
+
+    def set(self, chave: tuple, valor):
+        agora = time.time()
+        _, inicio, fim, produto_id = chave
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_relatorio "
+                "(chave, inicio, fim, produto_id, valor, expira, acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    json.dumps(chave),
+                    inicio,
+                    fim,
+                    produto_id,
+                    json.dumps(valor),
+                    agora + self.ttl,
+                    agora,
+                ),
+            )
+            cursor = conn.execute(
+                "DELETE FROM cache_relatorio WHERE chave IN ("
+                "SELECT chave FROM cache_relatorio ORDER BY acesso DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self.despejos += cursor.rowcount
+
+    def invalidar(self, datas: list[date], produto_id: Optional[int]) -> int:
+        filtro_produto = (
+            "" if produto_id is None else " AND (produto_id IS NULL OR produto_id = ?)"
+        )
+        removidas = 0
+        with self._conectar() as conn:
+            for data in datas:
+                parametros = [data.isoformat(), data.isoformat()]
+                if produto_id is not None:
+                    parametros.append(produto_id)
+                cursor = conn.execute(
+                    "DELETE FROM cache_relatorio WHERE inicio <= ? AND fim > ?"
+                    + filtro_produto,
+                    parametros,
+                )
+                removidas += cursor.rowcount
+        return removidas
+
+    def clear(self):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM cache_relatorio")
+
+    def __len__(self):
+        with self._conectar() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache_relatorio").fetchone()[0]
+
+
+def afeta(chave: tuple, datas: list[date], produto_id: Optional[int]) -> bool:
+    """
+    Indica se alguma das datas (ordenadas) cai no período da entrada e se o
+    produto alterado é o da entrada (entradas sem produto valem para todos).
+    """
+    _, inicio, fim, produto_entrada = chave
+    if produto_id is not None and produto_entrada not in (None, produto_id):
+        return False
+    inicio, fim = date.fromisoformat(inicio), date.fromisoformat(fim)
+    posicao = bisect.bisect_left(datas, inicio)
+    return posicao < len(datas) and datas[posicao] < fim
+
+
+class ReportCache:
+    """Cache de relatórios com contadores de acertos, faltas e invalidações."""
+
+    def __init__(self, backend=None, carencia: float = 0.0):
+        self.backend = backend
+        # Segundos após uma invalidação em que nada é guardado. Com réplica de
+        # leitura, ela pode ainda não ter a escrita que invalidou o cache.
+        self.carencia = carencia
+        self._invalidado_em = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+        # Incrementada a cada invalidação: um resultado calculado antes dela
+        # pode conter dados antigos e não é guardado
+        self.geracao = 0
+
+    def cached(self, nome: str, decode=None):
+        """
+        Decora uma função de relatório com assinatura (inicio, fim, sess, ...).
+        `decode` converte o valor lido do cache de volta para o formato
+        original (por exemplo, listas JSON em tuplas).
+        """
+
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def wrapper(inicio: date, fim: date, *args, **kwargs):
+                if self.backend is None:
+                    return funcao(inicio, fim, *args, **kwargs)
+
+                chave = (
+                    nome,
+                    inicio.isoformat(),
+                    fim.isoformat(),
+                    kwargs.get("produto_id"),
+                )
+                valor = self.backend.get(chave)
+                if valor is not AUSENTE:
+                    self.hits += 1
+                    return decode(valor) if decode and valor is not None else valor
+
+                self.misses += 1
+                geracao = self.geracao
+                valor = funcao(inicio, fim, *args, **kwargs)
+                if self.geracao == geracao and not self._em_carencia():
+                    self.backend.set(chave, valor)
+                return valor
+
+            return wrapper
+
+        return decorador
+
+    def _em_carencia(self) -> bool:
+        return time.monotonic() - self._invalidado_em < self.carencia
+
+    def invalidar(self, datas: Iterable[date], produto_id: Optional[int] = None):
+        """Remove as entradas cujo período contém alguma das datas."""
+        if self.backend is None:
+            return 0
+        datas = sorted(set(datas))
+        if not datas:
+            return 0
+        self.geracao += 1
+        self._invalidado_em = time.monotonic()
+        removidas = self.backend.invalidar(datas, produto_id)
+        self.invalidacoes += removidas
+        return removidas
+
+    def clear(self):
+        self.geracao += 1
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.nome if self.backend else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidacoes": self.invalidacoes,
+            "despejos": self.backend.despejos if self.backend else 0,
+            "entradas": len(self.backend) if self.backend else 0,
+        }
+
+
+def criar_backend():
+    """Cria o armazenamento do cache a partir das variáveis de ambiente."""
+    tipo = os.getenv("REPORT_CACHE_BACKEND", "memory").lower()
+    maxsize = int(os.getenv("REPORT_CACHE_MAXSIZE", "256"))
+    ttl = float(os.getenv("REPORT_CACHE_TTL", "600"))
+    if tipo == "none":
+        return None
+    if tipo == "sqlite":
+        path = os.getenv("REPORT_CACHE_PATH", "./report_cache.db")
+        return SQLiteBackend(path, maxsize=maxsize, ttl=ttl)
+    if tipo == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"REPORT_CACHE_BACKEND inválido: {tipo!r}")
+
+
+report_cache = ReportCache(criar_backend())
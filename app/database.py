@@ -1,15 +1,150 @@
 import os
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Lê a URL do banco de dados da variável de ambiente
 # Se não existir, usa o SQLite local como padrão
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
 
-# O `connect_args` é específico do SQLite
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Réplica de leitura opcional, usada pelas consultas (produtos, estoque e
+# relatórios). Sem ela, as leituras vão para o banco principal.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+# Atraso máximo esperado da réplica (segundos), usado pelo cache de relatórios
+DATABASE_READ_MAX_LAG = float(os.getenv("DATABASE_READ_MAX_LAG", "30"))
 
-# Engine é criado aqui, mas a sessão será gerenciada pela aplicação
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+# Driver assíncrono usado para cada banco suportado
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """Converte a URL do banco para a variante com driver assíncrono."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Banco sem driver assíncrono configurado: {backend}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(
+        hide_password=False
+    )
+
+
+# Perfil do SQLite aplicado em cada conexão nova. WAL deixa as leituras
+# seguirem enquanto o ETL (ou outro formulário) escreve, e o busy_timeout faz
+# escritas concorrentes esperarem a vez em vez de falharem com "database is
+# locked". cache_size negativo é em KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-64000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "foreign_keys": "ON",
+}
+
+# Pool de conexões dos demais bancos (PostgreSQL)
+DB_POOL = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") != "0",
+}
+
+
+def aplicar_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, valor in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+    finally:
+        cursor.close()
+
+
+def opcoes_engine(url: str) -> dict:
+    """Argumentos de create_engine para o banco da URL."""
+    if make_url(url).get_backend_name() == "sqlite":
+        # O `connect_args` é específico do SQLite
+        return {"connect_args": {"check_same_thread": False}}
+    return dict(DB_POOL)
+
+
+def configurar_conexoes(engine, somente_leitura: bool = False):
+    """
+    Registra o perfil aplicado a cada conexão nova do engine (síncrono). Com
+    `somente_leitura`, as conexões passam a recusar escritas.
+    """
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", aplicar_pragmas)
+        comando = "PRAGMA query_only=ON"
+    else:
+        comando = "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY"
+    if somente_leitura:
+
+        @event.listens_for(engine, "connect")
+        def recusar_escritas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(comando)
+            finally:
+                cursor.close()
+
+
+def criar_engine(url: str, somente_leitura: bool = False, **kwargs):
+    """Engine síncrono com o perfil do banco (pragmas no SQLite, pool no resto)."""
+    engine = create_engine(url, echo=False, **{**opcoes_engine(url), **kwargs})
+    configurar_conexoes(engine, somente_leitura)
+    return engine
+
+
+def criar_async_engine(url: str, somente_leitura: bool = False, **kwargs):
+    """Engine assíncrono equivalente a `criar_engine`."""
+    url = async_database_url(url)
+    opcoes = opcoes_engine(url)
+    # O aiosqlite já roda cada conexão em sua própria thread
+    opcoes.pop("connect_args", None)
+    engine = create_async_engine(url, echo=False, **{**opcoes, **kwargs})
+    configurar_conexoes(engine.sync_engine, somente_leitura)
+    return engine
+
+
+# Engine é criado aqui, mas a sessão será gerenciada pela aplicação.
+# O engine síncrono é usado pelo ETL e pelos scripts de linha de comando;
+# os endpoints usam o assíncrono para não bloquear o event loop.
+engine = criar_engine(DATABASE_URL)
+async_engine = criar_async_engine(DATABASE_URL)
+
+# Engine das consultas: a réplica (somente leitura) ou o próprio principal
+if DATABASE_READ_URL:
+    async_read_engine = criar_async_engine(DATABASE_READ_URL, somente_leitura=True)
+else:
+    async_read_engine = async_engine
+
+
+def inserir_ou_somar(sess: Session, modelo, valores: dict, incrementos: dict):
+    """
+    Insere a linha com `valores` ou, se a chave primária já existir, soma
+    `incrementos` às colunas da linha existente, num único comando
+    (INSERT ... ON CONFLICT DO UPDATE). Diferente de um UPDATE seguido de
+    INSERT, duas transações criando a mesma linha ao mesmo tempo não falham
+    com chave duplicada: a segunda espera a primeira e soma.
+    """
+    dialeto = sess.get_bind().dialect.name
+    insert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}[dialeto]
+    return sess.exec(
+        insert(modelo)
+        .values(**valores)
+        .on_conflict_do_update(
+            index_elements=[coluna.name for coluna in modelo.__table__.primary_key],
+            set_={
+                campo: getattr(modelo, campo) + valor
+                for campo, valor in incrementos.items()
+            },
+        )
+    )
 
 
 def init_db():
@@ -21,3 +156,19 @@ def get_session():
     """Função de dependência para obter uma sessão do banco de dados."""
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():
+    """
+    Função de dependência para obter uma sessão assíncrona do banco de dados.
+    Os objetos continuam utilizáveis após o commit, já que não há lazy load
+    em código assíncrono.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_read_session():
+    """Sessão assíncrona para consultas, na réplica de leitura se houver uma."""
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,353 @@
+"""
+Regras de estoque compartilhadas pelos endpoints e pelos scripts.
+
+O saldo de cada produto fica materializado na tabela `SaldoEstoque` e é
+atualizado na mesma transação de cada `MovimentoEstoque` gravado. O histórico
+de movimentos continua sendo a fonte da verdade: `recalcular_saldos` e
+`verificar_saldos` reconstroem/conferem o saldo a partir dele.
+
+Uso pela linha de comando:
+    python -m app.estoque recalcular
+    python -m app.estoque verificar
+"""
+
+import argparse
+import logging
+import sys
+from typing import Optional
+
+from sqlalchemy import case, delete, func, insert, update
+from sqlmodel import Session, select
+
+from app.database import inserir_ou_somar
+from app.models import MovimentoEstoque, Produto, SaldoEstoque
+
+logger = logging.getLogger(__name__)
+
+# Tipos de movimento que somam ou subtraem do estoque
+TIPOS_ENTRADA = ["entrada"]
+TIPOS_SAIDA = ["saida_manual", "saida_venda", "saida_venda_barril"]
+
+# Diferença máxima aceita entre o saldo materializado e o histórico
+TOLERANCIA = 1e-6
+
+
+def sinal_movimento(tipo_movimento: str) -> int:
+    """Retorna +1 para entradas e -1 para saídas de estoque."""
+    if tipo_movimento in TIPOS_ENTRADA:
+        return 1
+    if tipo_movimento in TIPOS_SAIDA:
+        return -1
+    raise ValueError(f"Tipo de movimento desconhecido: {tipo_movimento!r}")
+
+
+def deltas_do_movimento(
+    movimento: MovimentoEstoque, produto: Produto
+) -> dict[str, float]:
+    """Quanto o movimento soma (ou subtrai) de cada coluna do saldo."""
+    delta = sinal_movimento(movimento.tipo_movimento) * movimento.quantidade
+    deltas = {
+        "quantidade_barris": delta,
+        "volume_litros": delta * produto.volume_litros,
+        "quantidade_entradas": 0.0,
+        "custo_total_entradas": 0.0,
+    }
+    if movimento.tipo_movimento in TIPOS_ENTRADA:
+        # Mantém a base do custo médio de forma incremental
+        deltas["quantidade_entradas"] = movimento.quantidade
+        if movimento.custo_unitario is not None:
+            deltas["custo_total_entradas"] = (
+                movimento.quantidade * movimento.custo_unitario
+            )
+    return deltas
+
+
+def somar_no_saldo(sess: Session, produto: Produto, deltas: dict[str, float]):
+    """
+    Soma os deltas ao saldo do produto com um UPDATE relativo (saldo = saldo
+    + delta), feito pelo banco. Os movimentos já devem estar na transação.
+
+    Produto sem linha de saldo (cadastrado antes da tabela de saldos existir)
+    parte do histórico já gravado, que inclui os movimentos atuais. A linha é
+    criada com upsert: se outra transação criá-la ao mesmo tempo, apenas os
+    deltas são somados, sem erro de chave duplicada.
+    """
+    result = sess.exec(
+        update(SaldoEstoque)
+        .where(SaldoEstoque.produto_id == produto.id)
+        .values(
+            **{
+                campo: getattr(SaldoEstoque, campo) + valor
+                for campo, valor in deltas.items()
+            }
+        )
+    )
+    if result.rowcount == 0:
+        sess.flush()
+        saldo = saldo_do_historico(sess, produto)
+        inserir_ou_somar(sess, SaldoEstoque, saldo.model_dump(), deltas)
+
+
+def registrar_movimento(
+    sess: Session, movimento: MovimentoEstoque, produto: Produto
+) -> MovimentoEstoque:
+    """
+    Adiciona o movimento à sessão e atualiza o saldo do produto.
+    Não faz commit: o chamador decide quando encerrar a transação.
+    """
+    sess.add(movimento)
+    somar_no_saldo(sess, produto, deltas_do_movimento(movimento, produto))
+    return movimento
+
+
+def registrar_movimentos(
+    sess: Session, movimentos: list[MovimentoEstoque], produtos: dict[int, Produto]
+):
+    """
+    Versão em lote de `registrar_movimento`: os deltas são somados por produto
+    e cada saldo recebe um único UPDATE relativo, depois do INSERT em lote dos
+    movimentos. Assim uma escrita concorrente confirmada no meio do lote não
+    é sobrescrita. Não faz commit.
+    """
+    if not movimentos:
+        return
+
+    deltas: dict[int, dict[str, float]] = {}
+    for movimento in movimentos:
+        produto = produtos[movimento.produto_id]
+        soma = deltas.setdefault(movimento.produto_id, {})
+        for campo, valor in deltas_do_movimento(movimento, produto).items():
+            soma[campo] = soma.get(campo, 0.0) + valor
+
+    # Os ids dos movimentos não são necessários: um único INSERT em lote, sem
+    # RETURNING, em vez de um INSERT por objeto. render_nulls mantém todas as
+    # linhas com as mesmas colunas, senão o lote é quebrado a cada valor nulo.
+    sess.exec(
+        insert(MovimentoEstoque).execution_options(render_nulls=True),
+        params=[movimento.model_dump(exclude={"id"}) for movimento in movimentos],
+    )
+    # Produtos em ordem de id: no PostgreSQL, lotes concorrentes bloqueiam as
+    # linhas de saldo sempre na mesma ordem
+    for produto_id, soma in sorted(deltas.items()):
+        somar_no_saldo(sess, produtos[produto_id], soma)
+
+
+def base_de_custo_do_historico(sess: Session, produto_id: int) -> tuple[float, float]:
+    """
+    Percorre as entradas do produto na ordem em que foram gravadas e retorna
+    (custo total, quantidade total). A soma é feita em Python, na mesma ordem
+    do cálculo incremental, para que os dois resultados sejam idênticos.
+    """
+    entradas = sess.exec(
+        select(MovimentoEstoque.quantidade, MovimentoEstoque.custo_unitario)
+        .where(
+            MovimentoEstoque.produto_id == produto_id,
+            MovimentoEstoque.tipo_movimento.in_(TIPOS_ENTRADA),
+        )
+        .order_by(MovimentoEstoque.id)
+    ).all()
+
+    custo_total = 0.0
+    quantidade_total = 0.0
+    for quantidade, custo_unitario in entradas:
+        quantidade_total += quantidade
+        if custo_unitario is not None:
+            custo_total += quantidade * custo_unitario
+    return custo_total, quantidade_total
+
+
+def saldo_do_historico(sess: Session, produto: Produto) -> SaldoEstoque:
+    """Monta o saldo de um único produto a partir do histórico de movimentos."""
+    barris = totais_por_produto(sess, produto.id).get(produto.id, 0.0)
+    custo_total, quantidade_total = base_de_custo_do_historico(sess, produto.id)
+    return SaldoEstoque(
+        produto_id=produto.id,
+        quantidade_barris=barris,
+        volume_litros=barris * produto.volume_litros,
+        custo_total_entradas=custo_total,
+        quantidade_entradas=quantidade_total,
+    )
+
+
+def calcular_custo_medio_barril(sess: Session, produto: Produto) -> float:
+    """
+    Custo médio ponderado do barril, lido da base mantida em `SaldoEstoque`.
+    Retorna 0.0 se o produto ainda não teve entradas.
+    """
+    saldo = sess.get(SaldoEstoque, produto.id)
+    if saldo is None:
+        custo_total, quantidade_total = base_de_custo_do_historico(sess, produto.id)
+    else:
+        custo_total = saldo.custo_total_entradas
+        quantidade_total = saldo.quantidade_entradas
+
+    if quantidade_total > 0:
+        return custo_total / quantidade_total
+    return 0.0
+
+
+def totais_por_produto(
+    sess: Session, produto_id: Optional[int] = None
+) -> dict[int, float]:
+    """
+    Soma o histórico de movimentos em uma única consulta agrupada e retorna
+    o saldo em barris de cada produto que possui movimentos.
+    """
+    entradas = func.sum(
+        case(
+            (
+                MovimentoEstoque.tipo_movimento.in_(TIPOS_ENTRADA),
+                MovimentoEstoque.quantidade,
+            ),
+            else_=0,
+        )
+    )
+    saidas = func.sum(
+        case(
+            (
+                MovimentoEstoque.tipo_movimento.in_(TIPOS_SAIDA),
+                MovimentoEstoque.quantidade,
+            ),
+            else_=0,
+        )
+    )
+    stmt = select(MovimentoEstoque.produto_id, entradas, saidas).group_by(
+        MovimentoEstoque.produto_id
+    )
+    if produto_id is not None:
+        stmt = stmt.where(MovimentoEstoque.produto_id == produto_id)
+    linhas = sess.exec(stmt).all()
+    return {produto_id: ent - sai for produto_id, ent, sai in linhas}
+
+
+def bases_de_custo(sess: Session) -> dict[int, tuple[float, float]]:
+    """
+    Calcula (custo total, quantidade total) das entradas de todos os produtos
+    em uma única passada pelo histórico, na ordem de gravação.
+    """
+    entradas = sess.exec(
+        select(
+            MovimentoEstoque.produto_id,
+            MovimentoEstoque.quantidade,
+            MovimentoEstoque.custo_unitario,
+        )
+        .where(MovimentoEstoque.tipo_movimento.in_(TIPOS_ENTRADA))
+        .order_by(MovimentoEstoque.id)
+    )
+
+    bases: dict[int, tuple[float, float]] = {}
+    for produto_id, quantidade, custo_unitario in entradas:
+        custo_total, quantidade_total = bases.get(produto_id, (0.0, 0.0))
+        quantidade_total += quantidade
+        if custo_unitario is not None:
+            custo_total += quantidade * custo_unitario
+        bases[produto_id] = (custo_total, quantidade_total)
+    return bases
+
+
+def recalcular_saldos(sess: Session) -> int:
+    """
+    Reconstrói a tabela de saldos a partir do histórico de movimentos.
+    Retorna a quantidade de produtos recalculados.
+    """
+    totais = totais_por_produto(sess)
+    bases = bases_de_custo(sess)
+    produtos = sess.exec(select(Produto)).all()
+
+    sess.exec(delete(SaldoEstoque))
+    for produto in produtos:
+        barris = totais.get(produto.id, 0.0)
+        custo_total, quantidade_total = bases.get(produto.id, (0.0, 0.0))
+        sess.add(
+            SaldoEstoque(
+                produto_id=produto.id,
+                quantidade_barris=barris,
+                volume_litros=barris * produto.volume_litros,
+                custo_total_entradas=custo_total,
+                quantidade_entradas=quantidade_total,
+            )
+        )
+    sess.commit()
+    logger.info(f"Saldos recalculados para {len(produtos)} produtos.")
+    return len(produtos)
+
+
+def verificar_saldos(sess: Session) -> list[dict]:
+    """
+    Compara o saldo materializado com o histórico de movimentos.
+    Retorna a lista de divergências (vazia se tudo estiver correto).
+    """
+    totais = totais_por_produto(sess)
+    bases = bases_de_custo(sess)
+    linhas = sess.exec(
+        select(Produto, SaldoEstoque)
+        .outerjoin(SaldoEstoque, SaldoEstoque.produto_id == Produto.id)
+        .order_by(Produto.id)
+    ).all()
+
+    divergencias = []
+    for produto, saldo in linhas:
+        esperado = totais.get(produto.id, 0.0)
+        esperado_litros = esperado * produto.volume_litros
+        esperado_base = bases.get(produto.id, (0.0, 0.0))
+        atual = saldo.quantidade_barris if saldo else 0.0
+        atual_litros = saldo.volume_litros if saldo else 0.0
+        atual_base = (
+            (saldo.custo_total_entradas, saldo.quantidade_entradas)
+            if saldo
+            else (0.0, 0.0)
+        )
+        if (
+            abs(atual - esperado) > TOLERANCIA
+            or abs(atual_litros - esperado_litros) > TOLERANCIA
+            or atual_base != esperado_base
+        ):
+            divergencias.append(
+                {
+                    "produto_id": produto.id,
+                    "produto": produto.nome,
+                    "quantidade_barris": atual,
+                    "quantidade_barris_esperada": esperado,
+                    "volume_litros": atual_litros,
+                    "volume_litros_esperado": esperado_litros,
+                    "custo_total_entradas": atual_base[0],
+                    "custo_total_entradas_esperado": esperado_base[0],
+                    "quantidade_entradas": atual_base[1],
+                    "quantidade_entradas_esperada": esperado_base[1],
+                }
+            )
+    return divergencias
+
+
+def main(argv=None) -> int:
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(
+        description="Recalcula ou verifica o saldo de estoque materializado."
+    )
+    parser.add_argument("comando", choices=["recalcular", "verificar"])
+    args = parser.parse_args(argv)
+
+    with Session(engine) as sess:
+        if args.comando == "recalcular":
+            recalcular_saldos(sess)
+            return 0
+
+        divergencias = verificar_saldos(sess)
+        for d in divergencias:
+            logger.warning(
+                f"Saldo divergente para '{d['produto']}': "
+                f"{d['quantidade_barris']} barris registrados, "
+                f"{d['quantidade_barris_esperada']} esperados pelo histórico."
+            )
+        if divergencias:
+            return 1
+        logger.info("Todos os saldos conferem com o histórico de movimentos.")
+        return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(main())
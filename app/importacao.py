@@ -0,0 +1,222 @@
+"""
+Importação de movimentos de estoque a partir de um arquivo CSV.
+
+Notas de fornecedor e baixas manuais chegam como planilhas com muitas linhas.
+O arquivo é lido linha a linha (nunca inteiro na memória) e processado em
+lotes: cada lote é validado contra o catálogo de produtos e gravado com
+`registrar_movimentos`. Linhas inválidas não interrompem a importação; elas
+voltam no resultado com o número da linha no arquivo.
+
+Colunas (cabeçalho obrigatório, sem diferença de maiúsculas/minúsculas):
+    produto          id ou nome do produto
+    quantidade       barris, número inteiro maior que zero
+    custo_unitario   custo por barril; obrigatório nas entradas
+    data_movimento   AAAA-MM-DD ou DD/MM/AAAA
+    tipo_movimento   opcional: entrada ou saida_manual (padrão do formulário)
+
+O separador pode ser vírgula ou ponto e vírgula; com ponto e vírgula, os
+valores podem usar vírgula decimal (ex.: 285,50).
+"""
+
+import csv
+import logging
+from datetime import date, datetime
+from typing import IO, Iterator, Optional
+
+from sqlalchemy import func, or_
+from sqlmodel import Session, select
+
+from app.estoque import registrar_movimentos
+from app.models import MovimentoEstoque, Produto
+
+logger = logging.getLogger(__name__)
+
+# Tipos de movimento aceitos na importação
+TIPOS_IMPORTACAO = ["entrada", "saida_manual"]
+
+COLUNAS_OBRIGATORIAS = {"produto", "quantidade", "data_movimento"}
+
+# Linhas validadas e gravadas de cada vez
+TAMANHO_LOTE = 500
+
+# Quantidade máxima de linhas rejeitadas detalhadas no resultado
+MAXIMO_REJEICOES = 200
+
+
+class LinhaInvalida(ValueError):
+    """Erro de validação de uma linha do arquivo."""
+
+
+def parse_decimal(valor: str, virgula_decimal: bool) -> float:
+    valor = valor.strip()
+    if virgula_decimal:
+        valor = valor.replace(".", "").replace(",", ".")
+    return float(valor)
+
+
+def parse_data(valor: str) -> date:
+    valor = valor.strip()
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise LinhaInvalida(f"Data inválida: {valor!r}")
+
+
+def ler_linhas(arquivo: IO[str]) -> tuple[Iterator[tuple[int, dict]], bool]:
+    """
+    Lê o cabeçalho e retorna um iterador de (número da linha, campos) e se o
+    arquivo usa vírgula decimal. O número é o da linha física onde o registro
+    termina, como em um editor de texto.
+    """
+    cabecalho = arquivo.readline()
+    delimitador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    colunas = [
+        coluna.strip().lower()
+        for coluna in next(csv.reader([cabecalho], delimiter=delimitador), [])
+    ]
+    faltando = COLUNAS_OBRIGATORIAS - set(colunas)
+    if faltando:
+        raise ValueError(
+            "Colunas obrigatórias ausentes no cabeçalho: " + ", ".join(sorted(faltando))
+        )
+
+    def linhas():
+        leitor = csv.reader(arquivo, delimiter=delimitador)
+        for valores in leitor:
+            if not any(v.strip() for v in valores):
+                continue
+            # +1 pelo cabeçalho, já lido fora do leitor
+            yield leitor.line_num + 1, dict(zip(colunas, valores))
+
+    return linhas(), delimitador == ";"
+
+
+def validar_linha(
+    campos: dict, tipo_padrao: str, virgula_decimal: bool
+) -> tuple[str, dict]:
+    """Converte os campos de uma linha. Retorna (referência do produto, valores)."""
+    produto = (campos.get("produto") or "").strip()
+    if not produto:
+        raise LinhaInvalida("Produto não informado.")
+
+    tipo = (campos.get("tipo_movimento") or "").strip().lower() or tipo_padrao
+    if tipo not in TIPOS_IMPORTACAO:
+        raise LinhaInvalida(f"Tipo de movimento inválido: {tipo!r}")
+
+    try:
+        quantidade = parse_decimal(campos.get("quantidade") or "", virgula_decimal)
+    except ValueError:
+        raise LinhaInvalida(f"Quantidade inválida: {campos.get('quantidade')!r}")
+    if quantidade < 1 or quantidade != int(quantidade):
+        raise LinhaInvalida("Quantidade deve ser um número inteiro maior que zero.")
+
+    custo_unitario = None
+    if tipo == "entrada":
+        try:
+            custo_unitario = parse_decimal(
+                campos.get("custo_unitario") or "", virgula_decimal
+            )
+        except ValueError:
+            raise LinhaInvalida(
+                f"Custo unitário inválido ou ausente: {campos.get('custo_unitario')!r}"
+            )
+
+    return produto, {
+        "tipo_movimento": tipo,
+        "quantidade": int(quantidade),
+        "custo_unitario": custo_unitario,
+        "data_movimento": parse_data(campos.get("data_movimento") or ""),
+    }
+
+
+class CatalogoProdutos:
+    """Resolve produtos por id ou nome, consultando o banco uma vez por lote."""
+
+    def __init__(self, sess: Session):
+        self.sess = sess
+        self.por_id: dict[int, Produto] = {}
+        self.por_nome: dict[str, Produto] = {}
+        self.consultados: set[str] = set()
+
+    def carregar(self, referencias: set[str]):
+        novas = referencias - self.consultados
+        if not novas:
+            return
+        ids = [int(ref) for ref in novas if ref.isdigit()]
+        nomes = [ref.lower() for ref in novas]
+        for produto in self.sess.exec(
+            select(Produto).where(
+                or_(Produto.id.in_(ids), func.lower(Produto.nome).in_(nomes))
+            )
+        ).all():
+            self.por_id[produto.id] = produto
+            self.por_nome.setdefault(produto.nome.lower(), produto)
+        self.consultados |= novas
+
+    def resolver(self, referencia: str) -> Optional[Produto]:
+        if referencia.isdigit() and int(referencia) in self.por_id:
+            return self.por_id[int(referencia)]
+        return self.por_nome.get(referencia.lower())
+
+
+def importar_movimentos_csv(
+    sess: Session,
+    arquivo: IO[str],
+    tipo_padrao: str = "entrada",
+    tamanho_lote: int = TAMANHO_LOTE,
+) -> dict:
+    """
+    Importa os movimentos do arquivo em lotes e retorna o resumo da importação
+    (linhas lidas, importadas e rejeitadas). Não faz commit.
+    """
+    linhas, virgula_decimal = ler_linhas(arquivo)
+    catalogo = CatalogoProdutos(sess)
+    resultado = {
+        "linhas": 0,
+        "importadas": 0,
+        "rejeitadas_total": 0,
+        "rejeitadas": [],
+    }
+
+    def rejeitar(numero: int, erro: str):
+        resultado["rejeitadas_total"] += 1
+        if len(resultado["rejeitadas"]) < MAXIMO_REJEICOES:
+            resultado["rejeitadas"].append({"linha": numero, "erro": erro})
+
+    def gravar(lote: list[tuple[int, str, dict]]):
+        catalogo.carregar({referencia for _, referencia, _ in lote})
+        movimentos = []
+        for numero, referencia, valores in lote:
+            produto = catalogo.resolver(referencia)
+            if produto is None:
+                rejeitar(numero, f"Produto não encontrado: {referencia!r}")
+                continue
+            movimentos.append(MovimentoEstoque(produto_id=produto.id, **valores))
+        if movimentos:
+            registrar_movimentos(sess, movimentos, catalogo.por_id)
+            resultado["importadas"] += len(movimentos)
+
+    lote = []
+    for numero, campos in linhas:
+        resultado["linhas"] += 1
+        try:
+            referencia, valores = validar_linha(campos, tipo_padrao, virgula_decimal)
+        except LinhaInvalida as e:
+            rejeitar(numero, str(e))
+            continue
+        lote.append((numero, referencia, valores))
+        if len(lote) >= tamanho_lote:
+            gravar(lote)
+            lote = []
+    if lote:
+        gravar(lote)
+    # Produtos desconhecidos só são detectados ao gravar o lote
+    resultado["rejeitadas"].sort(key=lambda rejeicao: rejeicao["linha"])
+
+    logger.info(
+        f"Importação CSV: {resultado['importadas']} movimentos importados, "
+        f"{resultado['rejeitadas_total']} linhas rejeitadas."
+    )
+    return resultado
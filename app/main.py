@@ -1,3 +1,4 @@
+import io
 import logging
 import os
 import secrets
@@ -6,16 +7,51 @@ from contextlib import asynccontextmanager
 from datetime import date
 from typing import Optional
 
+import anyio
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, Form, HTTPException, Request
-from fastapi.responses import HTMLResponse, Response
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from jinja2 import TemplateNotFound
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from twilio.request_validator import RequestValidator
 from twilio.twiml.messaging_response import MessagingResponse
 
-from app.database import get_session, init_db
-from app.models import MovimentoEstoque, Produto, Venda
+from app.cache import report_cache
+from app import metricas
+from app.database import (
+    DATABASE_READ_MAX_LAG,
+    DATABASE_READ_URL,
+    async_engine,
+    async_read_engine,
+    engine,
+    get_async_read_session,
+    get_async_session,
+    get_session,
+    init_db,
+)
+from app.estoque import (
+    calcular_custo_medio_barril,
+    registrar_movimento,
+    registrar_movimentos,
+)
+from app.importacao import TIPOS_IMPORTACAO, importar_movimentos_csv
+from app.mensagens import criar_fila
+from app.models import (
+    MovimentoEstoque,
+    Produto,
+    ResumoVendaDiario,
+    SaldoEstoque,
+    Venda,
+    VendaLoteItem,
+)
+from app.paginas import pagina_formulario
+from app.resumos import (
+    registrar_venda_nos_resumos,
+    registrar_vendas_nos_resumos,
+    totais_do_periodo,
+)
 
 # Configuração do logging
 logging.basicConfig(
@@ -32,14 +68,32 @@ async def lifespan(app: FastAPI):
     # Código a ser executado durante a inicialização
     print("Inicializando... criando tabelas do banco se necessário.")
     init_db()
+    try:
+        pagina_formulario.carregar()
+    except TemplateNotFound:
+        logger.error(f"Template não encontrado: {pagina_formulario.nome}")
     logger.debug(f"--> Usuário do .env: {os.getenv('FORM_USER')}")
     logger.debug(f"--> Senha do .env: {os.getenv('FORM_PASSWORD')}")
+    if fila_respostas is not None:
+        fila_respostas.iniciar()
     yield
+    if fila_respostas is not None:
+        await fila_respostas.parar()
     # Código a ser executado durante o desligamento (se necessário)
     print("Desligando...")
 
 
 app = FastAPI(title="API Trailer de Chopp", lifespan=lifespan)
+app.add_middleware(metricas.MiddlewareMetricas)
+
+# Os relatórios são lidos da réplica: logo após uma invalidação ela pode não
+# ter a escrita ainda, então o resultado não é guardado durante esse atraso
+if DATABASE_READ_URL:
+    report_cache.carencia = DATABASE_READ_MAX_LAG
+
+# Comandos SQL e tempo de banco por requisição, no principal e na réplica
+for _engine in (engine, async_engine.sync_engine, async_read_engine.sync_engine):
+    metricas.monitorar_engine(_engine)
 
 # --- Configuração de Segurança ---
 
@@ -72,53 +126,51 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security))
 
 
 @app.get("/", response_class=HTMLResponse)
-async def get_registration_form(username: str = Depends(get_current_username)):
+async def get_registration_form(
+    request: Request,
+    sess: AsyncSession = Depends(get_async_session),
+    username: str = Depends(get_current_username),
+):
     """
     Serve a página HTML com o formulário de registro (protegido por senha).
+    Produtos e estoque já vêm renderizados, então a primeira exibição precisa
+    de uma única requisição. A página tem ETag e variantes comprimidas.
     """
-    try:
-        with open("app/templates/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
-        raise HTTPException(
-            status_code=500, detail="Arquivo de formulário não encontrado."
-        )
+    produtos = await sess.run_sync(listar_produtos_com_saldo)
+    return pagina_formulario.resposta(request, produtos=produtos)
 
 
-@app.post("/registrar_venda", response_class=HTMLResponse)
-async def register_venda(
+def calcular_venda(
+    produto: Produto,
+    custo_medio_barril: Optional[float],
     *,
-    sess: Session = Depends(get_session),
-    data: date = Form(...),
-    produto_id: int = Form(...),
-    tipo_venda: str = Form(...),  # Novo campo para tipo de venda
-    total: Optional[float] = Form(None),  # Total pode ser None para barril_festas
-    cartao: Optional[float] = Form(None),
-    dinheiro: Optional[float] = Form(None),
-    pix: Optional[float] = Form(None),
-    custo_func: Optional[float] = Form(None),
-    custo_copos: Optional[float] = Form(None),
-    custo_boleto: Optional[float] = Form(None),
-    quantidade_barris_vendidos: Optional[float] = Form(None),  # Para barril_festas
-    username: str = Depends(get_current_username),  # Protege o endpoint
-):
+    data: date,
+    tipo_venda: str,
+    total: Optional[float] = None,
+    cartao: Optional[float] = None,
+    dinheiro: Optional[float] = None,
+    pix: Optional[float] = None,
+    custo_func: Optional[float] = None,
+    custo_copos: Optional[float] = None,
+    custo_boleto: Optional[float] = None,
+    quantidade_barris_vendidos: Optional[float] = None,
+) -> tuple[Venda, MovimentoEstoque]:
     """
-    Recebe os dados do formulário e salva no banco de dados (protegido por senha).
+    Valida uma venda e calcula o lucro e a baixa de estoque, sem acessar o
+    banco. `custo_medio_barril` só é usado nas vendas de barril_festas.
+    Retorna a venda e o movimento de saída correspondente.
     """
-    produto = sess.exec(select(Produto).where(Produto.id == produto_id)).first()
-    if not produto:
-        raise HTTPException(status_code=404, detail="Produto não encontrado.")
-
-    lucro = 0.0
-    barris_baixados = 0.0
-    venda_total_calculada = 0.0
-
     if tipo_venda == "feira":
         if total is None:
             raise HTTPException(
                 status_code=400,
                 detail="Total da venda é obrigatório para vendas de feira.",
             )
+        if not produto.preco_venda_litro:
+            raise HTTPException(
+                status_code=400,
+                detail="Produto sem preço de venda por litro cadastrado.",
+            )
         venda_total_calculada = total
         lucro = (
             total - (custo_func or 0.0) - (custo_copos or 0.0) - (custo_boleto or 0.0)
@@ -126,15 +178,14 @@ async def register_venda(
         litros_vendidos = total / produto.preco_venda_litro
         barris_baixados = litros_vendidos / produto.volume_litros
 
-        # Registra o movimento de saída por venda de feira
-        movimento_saida_venda = MovimentoEstoque(
-            produto_id=produto_id,
+        # Movimento de saída por venda de feira
+        movimento = MovimentoEstoque(
+            produto_id=produto.id,
             tipo_movimento="saida_venda",
             quantidade=barris_baixados,
             custo_unitario=None,
             data_movimento=data,
         )
-        sess.add(movimento_saida_venda)
 
     elif tipo_venda == "barril_festas":
         if quantidade_barris_vendidos is None:
@@ -148,37 +199,17 @@ async def register_venda(
         )
         barris_baixados = quantidade_barris_vendidos
 
-        # Calcular o custo médio do barril para o lucro
-        entradas_produto = sess.exec(
-            select(MovimentoEstoque.quantidade, MovimentoEstoque.custo_unitario).where(
-                MovimentoEstoque.produto_id == produto.id,
-                MovimentoEstoque.tipo_movimento == "entrada",
-            )
-        ).all()
-
-        total_custo_entradas = sum(
-            e.quantidade * e.custo_unitario
-            for e in entradas_produto
-            if e.custo_unitario is not None
-        )
-        total_quantidade_entradas = sum(e.quantidade for e in entradas_produto)
-
-        custo_medio_barril = 0.0
-        if total_quantidade_entradas > 0:
-            custo_medio_barril = total_custo_entradas / total_quantidade_entradas
-
         custo_total_venda_barril = barris_baixados * custo_medio_barril
         lucro = venda_total_calculada - custo_total_venda_barril
 
-        # Registra o movimento de saída por venda de barril_festas
-        movimento_saida_barril = MovimentoEstoque(
-            produto_id=produto_id,
+        # Movimento de saída por venda de barril_festas
+        movimento = MovimentoEstoque(
+            produto_id=produto.id,
             tipo_movimento="saida_venda_barril",
             quantidade=barris_baixados,
             custo_unitario=custo_medio_barril,  # Opcional: registrar o custo médio da baixa
             data_movimento=data,
         )
-        sess.add(movimento_saida_barril)
 
     else:
         raise HTTPException(
@@ -186,9 +217,9 @@ async def register_venda(
             detail="Tipo de venda inválido. Use 'feira' ou 'barril_festas'.",
         )
 
-    nova_venda = Venda(
+    venda = Venda(
         data=data,
-        produto_id=produto_id,
+        produto_id=produto.id,
         tipo_venda=tipo_venda,
         total=venda_total_calculada,
         cartao=cartao,
@@ -204,22 +235,168 @@ async def register_venda(
         if tipo_venda == "feira"
         else None,
     )
+    return venda, movimento
+
+
+def processar_venda(sess: Session, *, produto_id: int, **campos) -> Venda:
+    """
+    Calcula uma venda e adiciona a venda, o movimento de estoque e os resumos
+    à sessão. Não faz commit.
+    """
+    produto = sess.exec(select(Produto).where(Produto.id == produto_id)).first()
+    if not produto:
+        raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
+    # Custo médio do barril para o lucro, mantido a cada entrada de estoque
+    custo_medio_barril = (
+        calcular_custo_medio_barril(sess, produto)
+        if campos.get("tipo_venda") == "barril_festas"
+        else None
+    )
+    nova_venda, movimento = calcular_venda(produto, custo_medio_barril, **campos)
+    registrar_movimento(sess, movimento, produto)
     sess.add(nova_venda)
-    sess.commit()
-    sess.refresh(nova_venda)
+    registrar_venda_nos_resumos(sess, nova_venda)
+    return nova_venda
+
+
+def processar_lote_vendas(
+    sess: Session, itens: list[VendaLoteItem]
+) -> tuple[list[Venda], list[dict]]:
+    """
+    Valida e calcula todas as vendas do lote. Produtos e custos médios são
+    buscados uma única vez por lote. Se todas forem válidas, adiciona vendas,
+    movimentos e resumos à sessão (sem commit) e retorna as vendas; caso
+    contrário, não grava nada e a lista de vendas volta vazia. O segundo item
+    traz o resultado de cada venda, na ordem recebida.
+    """
+    ids = {item.produto_id for item in itens}
+    produtos = {
+        produto.id: produto
+        for produto in sess.exec(select(Produto).where(Produto.id.in_(ids))).all()
+    }
+    custos = {
+        produto_id: calcular_custo_medio_barril(sess, produtos[produto_id])
+        for produto_id in {
+            item.produto_id for item in itens if item.tipo_venda == "barril_festas"
+        }
+        if produto_id in produtos
+    }
+
+    vendas, movimentos, resultados = [], [], []
+    for indice, item in enumerate(itens):
+        produto = produtos.get(item.produto_id)
+        try:
+            if produto is None:
+                raise HTTPException(status_code=404, detail="Produto não encontrado.")
+            campos = item.model_dump(exclude={"produto_id"})
+            venda, movimento = calcular_venda(produto, custos.get(produto.id), **campos)
+        except HTTPException as e:
+            resultados.append({"indice": indice, "ok": False, "erro": e.detail})
+            continue
+        vendas.append(venda)
+        movimentos.append(movimento)
+        resultados.append({"indice": indice, "ok": True})
+
+    if len(vendas) < len(itens):
+        return [], resultados
+
+    registrar_movimentos(sess, movimentos, produtos)
+    sess.add_all(vendas)
+    registrar_vendas_nos_resumos(sess, vendas)
+    return vendas, resultados
+
+
+@app.post("/registrar_venda", response_class=HTMLResponse)
+async def register_venda(
+    *,
+    sess: AsyncSession = Depends(get_async_session),
+    data: date = Form(...),
+    produto_id: int = Form(...),
+    tipo_venda: str = Form(...),  # Novo campo para tipo de venda
+    total: Optional[float] = Form(None),  # Total pode ser None para barril_festas
+    cartao: Optional[float] = Form(None),
+    dinheiro: Optional[float] = Form(None),
+    pix: Optional[float] = Form(None),
+    custo_func: Optional[float] = Form(None),
+    custo_copos: Optional[float] = Form(None),
+    custo_boleto: Optional[float] = Form(None),
+    quantidade_barris_vendidos: Optional[float] = Form(None),  # Para barril_festas
+    username: str = Depends(get_current_username),  # Protege o endpoint
+):
+    """
+    Recebe os dados do formulário e salva no banco de dados (protegido por senha).
+    """
+    nova_venda = await sess.run_sync(
+        processar_venda,
+        data=data,
+        produto_id=produto_id,
+        tipo_venda=tipo_venda,
+        total=total,
+        cartao=cartao,
+        dinheiro=dinheiro,
+        pix=pix,
+        custo_func=custo_func,
+        custo_copos=custo_copos,
+        custo_boleto=custo_boleto,
+        quantidade_barris_vendidos=quantidade_barris_vendidos,
+    )
+    await sess.commit()
+    await sess.refresh(nova_venda)
+    report_cache.invalidar([data], produto_id)
 
     return HTMLResponse(
         content="<h1>Registro salvo com sucesso!</h1><p><a href='/'>Registrar outra venda</a></p>"
     )
 
 
+# Limite de vendas por requisição em /vendas/lote
+LOTE_MAXIMO_VENDAS = 500
+
+
+@app.post("/vendas/lote")
+async def register_vendas_lote(
+    itens: list[VendaLoteItem],
+    sess: AsyncSession = Depends(get_async_session),
+    username: str = Depends(get_current_username),
+):
+    """
+    Registra várias vendas (feira e barril_festas) em uma única transação.
+    Se alguma venda for inválida, nenhuma é gravada e a resposta (422) indica
+    o erro de cada item.
+    """
+    if not itens:
+        raise HTTPException(status_code=400, detail="O lote não tem nenhuma venda.")
+    if len(itens) > LOTE_MAXIMO_VENDAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"O lote pode ter no máximo {LOTE_MAXIMO_VENDAS} vendas.",
+        )
+
+    vendas, resultados = await sess.run_sync(processar_lote_vendas, itens)
+    if len(vendas) < len(itens):
+        return JSONResponse(
+            status_code=422, content={"registradas": 0, "itens": resultados}
+        )
+    await sess.commit()
+
+    datas_por_produto = {}
+    for venda, resultado in zip(vendas, resultados):
+        resultado.update(id=venda.id, total=venda.total, lucro=venda.lucro)
+        datas_por_produto.setdefault(venda.produto_id, set()).add(venda.data)
+    for produto_id, datas in datas_por_produto.items():
+        report_cache.invalidar(datas, produto_id)
+
+    return {"registradas": len(vendas), "itens": resultados}
+
+
 # --- Endpoints de Produtos ---
 
 
 @app.post("/produtos", response_class=HTMLResponse)
 async def create_produto(
     *,
-    sess: Session = Depends(get_session),
+    sess: AsyncSession = Depends(get_async_session),
     nome: str = Form(...),
     preco_venda_barril_fechado: float = Form(...),
     volume_litros: Optional[float] = Form(None),
@@ -237,8 +414,11 @@ async def create_produto(
 
     produto = Produto(**produto_data)
     sess.add(produto)
-    sess.commit()
-    sess.refresh(produto)
+    await sess.flush()
+    # Todo produto nasce com saldo zerado
+    sess.add(SaldoEstoque(produto_id=produto.id))
+    await sess.commit()
+    await sess.refresh(produto)
     return HTMLResponse(
         content=f"<h1>Produto '{produto.nome}' cadastrado com sucesso!</h1><p><a href='/'>Voltar</a></p>"
     )
@@ -247,10 +427,10 @@ async def create_produto(
 @app.get("/produtos", response_model=list[Produto])
 async def get_produtos(
     *,
-    sess: Session = Depends(get_session),
+    sess: AsyncSession = Depends(get_async_read_session),
     username: str = Depends(get_current_username),
 ):
-    produtos = sess.exec(select(Produto)).all()
+    produtos = (await sess.exec(select(Produto))).all()
     return produtos
 
 
@@ -260,13 +440,17 @@ async def get_produtos(
 @app.post("/estoque/entrada", response_class=HTMLResponse)
 async def register_entrada_estoque(
     *,
-    sess: Session = Depends(get_session),
+    sess: AsyncSession = Depends(get_async_session),
     produto_id: int = Form(...),
     quantidade: int = Form(...),
     custo_unitario: float = Form(...),
     data_movimento: date = Form(...),
     username: str = Depends(get_current_username),
 ):
+    produto = (await sess.exec(select(Produto).where(Produto.id == produto_id))).first()
+    if not produto:
+        raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
     movimento = MovimentoEstoque(
         produto_id=produto_id,
         tipo_movimento="entrada",
@@ -274,9 +458,9 @@ async def register_entrada_estoque(
         custo_unitario=custo_unitario,
         data_movimento=data_movimento,
     )
-    sess.add(movimento)
-    sess.commit()
-    sess.refresh(movimento)
+    await sess.run_sync(registrar_movimento, movimento, produto)
+    await sess.commit()
+    await sess.refresh(movimento)
     return HTMLResponse(
         content=f"<h1>Entrada de {quantidade} barril(is) registrada com sucesso!</h1><p><a href='/'>Voltar</a></p>"
     )
@@ -285,12 +469,16 @@ async def register_entrada_estoque(
 @app.post("/estoque/saida_manual", response_class=HTMLResponse)
 async def register_saida_manual_estoque(
     *,
-    sess: Session = Depends(get_session),
+    sess: AsyncSession = Depends(get_async_session),
     produto_id: int = Form(...),
     quantidade: int = Form(...),
     data_movimento: date = Form(...),
     username: str = Depends(get_current_username),
 ):
+    produto = (await sess.exec(select(Produto).where(Produto.id == produto_id))).first()
+    if not produto:
+        raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
     movimento = MovimentoEstoque(
         produto_id=produto_id,
         tipo_movimento="saida_manual",
@@ -298,59 +486,95 @@ async def register_saida_manual_estoque(
         custo_unitario=None,  # Saída manual não tem custo unitário associado diretamente
         data_movimento=data_movimento,
     )
-    sess.add(movimento)
-    sess.commit()
-    sess.refresh(movimento)
+    await sess.run_sync(registrar_movimento, movimento, produto)
+    await sess.commit()
+    await sess.refresh(movimento)
     return HTMLResponse(
         content=f"<h1>Saída manual de {quantidade} barril(is) registrada com sucesso!</h1><p><a href='/'>Voltar</a></p>"
     )
 
 
-@app.get("/estoque", response_model=dict)
-async def get_estoque_atual(
+def importar_e_confirmar(sess: Session, arquivo, tipo_movimento: str) -> dict:
+    resultado = importar_movimentos_csv(sess, arquivo, tipo_movimento)
+    sess.commit()
+    return resultado
+
+
+@app.post("/estoque/importar", response_model=dict)
+async def importar_estoque_csv(
     *,
     sess: Session = Depends(get_session),
+    arquivo: UploadFile = File(...),
+    tipo_movimento: str = Form("entrada"),
     username: str = Depends(get_current_username),
 ):
-    # Calcula o estoque atual por produto
-    # Soma as entradas e subtrai as saídas
+    """
+    Importa movimentos de estoque (entradas ou saídas manuais) de um arquivo
+    CSV. O arquivo é lido linha a linha e gravado em lotes; as linhas
+    rejeitadas voltam com o número da linha e o motivo.
+    """
+    if tipo_movimento not in TIPOS_IMPORTACAO:
+        raise HTTPException(
+            status_code=400,
+            detail="Tipo de movimento inválido. Use 'entrada' ou 'saida_manual'.",
+        )
+
+    # O upload já está em um arquivo temporário; a leitura é incremental.
+    # Leitura, validação e gravação rodam em uma thread com sessão síncrona:
+    # um arquivo grande não bloqueia o event loop (e as outras requisições).
+    texto = io.TextIOWrapper(arquivo.file, encoding="utf-8-sig", newline="")
+    try:
+        return await anyio.to_thread.run_sync(
+            importar_e_confirmar, sess, texto, tipo_movimento
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="O arquivo deve estar em UTF-8.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Devolve o arquivo ao UploadFile, que é quem o fecha
+        texto.detach()
+
+
+def listar_produtos_com_saldo(sess: Session) -> list:
+    """Lista os produtos com o saldo de cada um (None se não houver movimento)."""
+    return sess.exec(
+        select(Produto, SaldoEstoque)
+        .outerjoin(SaldoEstoque, SaldoEstoque.produto_id == Produto.id)
+        .order_by(Produto.id)
+    ).all()
+
+
+def consultar_estoque(sess: Session) -> dict:
+    """
+    Monta o estoque atual de todos os produtos a partir da tabela de saldos,
+    mantida a cada movimento. O custo é proporcional ao número de produtos,
+    independente do tamanho do histórico de movimentos.
+    """
     # Isso é uma simplificação, um sistema de estoque real seria mais complexo
     # e consideraria o volume em litros, não apenas barris.
     # Por enquanto, vamos considerar a quantidade de barris.
-
-    produtos = sess.exec(select(Produto)).all()
     estoque_info = {}
-
-    for produto in produtos:
-        entradas = sess.exec(
-            select(MovimentoEstoque.quantidade).where(
-                MovimentoEstoque.produto_id == produto.id,
-                MovimentoEstoque.tipo_movimento == "entrada",
-            )
-        ).all()
-        saidas = sess.exec(
-            select(MovimentoEstoque.quantidade).where(
-                MovimentoEstoque.produto_id == produto.id,
-                MovimentoEstoque.tipo_movimento.in_(
-                    ["saida_manual", "saida_venda", "saida_venda_barril"]
-                ),
-            )
-        ).all()
-
-        total_entradas = sum(entradas)
-        total_saidas = sum(saidas)
-
-        estoque_atual = total_entradas - total_saidas
-
+    for produto, saldo in listar_produtos_com_saldo(sess):
         estoque_info[produto.nome] = {
-            "quantidade_barris": estoque_atual,
-            "volume_litros_total": estoque_atual * produto.volume_litros,
+            "quantidade_barris": saldo.quantidade_barris if saldo else 0.0,
+            "volume_litros_total": saldo.volume_litros if saldo else 0.0,
             "preco_venda_litro": produto.preco_venda_litro,
             "preco_venda_barril_fechado": produto.preco_venda_barril_fechado,
         }
     return estoque_info
 
 
+@app.get("/estoque", response_model=dict)
+async def get_estoque_atual(
+    *,
+    sess: AsyncSession = Depends(get_async_read_session),
+    username: str = Depends(get_current_username),
+):
+    # Calcula o estoque atual por produto
+    return await sess.run_sync(consultar_estoque)
+
+
 # --- Lógica de Relatórios ---
 
 
@@ -393,49 +617,123 @@ def calculate_report_metrics(vendas: list[Venda]):
     }
 
 
+def build_report_metrics(
+    receita_bruta: float,
+    gasto_func: float,
+    gasto_copos: float,
+    gasto_boleto: float,
+    num_vendas: int,
+) -> dict:
+    """
+    Monta o dicionário de métricas a partir de totais já somados no banco,
+    com o mesmo arredondamento de `calculate_report_metrics`.
+    """
+    gasto_total = gasto_func + gasto_copos + gasto_boleto
+    receita_liquida = receita_bruta - gasto_total
+
+    media_vendas = receita_bruta / num_vendas
+
+    return {
+        "receita_bruta": round(receita_bruta, 2),
+        "receita_liquida": round(receita_liquida, 2),
+        "media_vendas": round(media_vendas, 2),
+        "gasto_funcionarios": round(gasto_func, 2),
+        "gasto_copos": round(gasto_copos, 2),
+        "gasto_boleto": round(gasto_boleto, 2),
+        "dias_registrados": num_vendas,
+    }
+
+
+@report_cache.cached("relatorio")
 def get_report_data(inicio: date, fim: date, sess: Session):
     """
     Busca os dados de um relatório para um período específico e retorna as métricas calculadas.
+    A agregação é feita no banco (SUM/COALESCE sobre os resumos de vendas);
+    `calculate_report_metrics` continua sendo a implementação de referência.
     """
-    vendas = sess.exec(
-        select(Venda).where(Venda.data >= inicio, Venda.data < fim)
-    ).all()
+    totais = totais_do_periodo(sess, inicio, fim)
 
-    if not vendas:
+    if not totais["num_vendas"]:
         return None
 
-    return calculate_report_metrics(vendas)
+    return build_report_metrics(
+        float(totais["receita"]),
+        float(totais["custo_func"]),
+        float(totais["custo_copos"]),
+        float(totais["custo_boleto"]),
+        totais["num_vendas"],
+    )
 
 
+@report_cache.cached(
+    "dias_movimento", decode=lambda ranking: [tuple(item) for item in ranking]
+)
 def get_dias_movimento(inicio: date, fim: date, sess: Session):
     """
     Busca e calcula os dias da semana mais lucrativos em um período.
     """
-    vendas = sess.exec(
-        select(Venda.dia_semana, Venda.total).where(
-            Venda.data >= inicio, Venda.data < fim
-        )
+    resumos = sess.exec(
+        select(ResumoVendaDiario.dia_semana, ResumoVendaDiario.receita)
+        .where(ResumoVendaDiario.data >= inicio, ResumoVendaDiario.data < fim)
+        .order_by(ResumoVendaDiario.data)
     ).all()
 
-    if not vendas:
+    if not resumos:
         return None
 
     faturamento_por_dia = Counter()
-    for dia_semana, total in vendas:
+    for dia_semana, total in resumos:
         if dia_semana:
             faturamento_por_dia[dia_semana] += total
 
     return faturamento_por_dia.most_common()
 
 
+@app.get("/relatorios/cache", response_model=dict)
+async def get_report_cache_stats(username: str = Depends(get_current_username)):
+    """
+    Retorna os contadores do cache de relatórios (acertos, faltas, etc.).
+    """
+    return report_cache.stats()
+
+
+@app.get("/metrics")
+async def get_metrics(username: str = Depends(get_current_username)):
+    """
+    Métricas da API no formato texto do Prometheus.
+    """
+    conteudo, content_type = metricas.exportar()
+    return Response(content=conteudo, media_type=content_type)
+
+
 # --- Webhook do WhatsApp ---
 
 
+async def responder_comando(body: str) -> str:
+    """Gera a resposta de um comando fora da requisição do Twilio."""
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as sess:
+        return await sess.run_sync(gerar_resposta, body)
+
+
+# Fila das respostas diferidas (None no modo imediato)
+fila_respostas = criar_fila(responder_comando)
+
+
+@app.get("/whatsapp/fila", response_model=dict)
+async def get_whatsapp_queue_stats(username: str = Depends(get_current_username)):
+    """
+    Retorna a profundidade e os contadores da fila de respostas diferidas.
+    """
+    if fila_respostas is None:
+        return {"modo": "imediato"}
+    return {"modo": "diferido", **fila_respostas.stats()}
+
+
 @app.post("/whatsapp/webhook")
 async def whatsapp_webhook(
     request: Request,
     body: str = Form(..., alias="Body"),
-    sess: Session = Depends(get_session),
+    sess: AsyncSession = Depends(get_async_read_session),
 ):
     """
     Webhook para receber mensagens WhatsApp via Twilio.
@@ -464,15 +762,44 @@ async def whatsapp_webhook(
         # Se a validação falhar, retorna um erro 403 Forbidden
         raise HTTPException(status_code=403, detail="Assinatura Twilio inválida.")
 
-    text = body.strip().lower().replace("relatório", "relatorio")
-    parts = text.split()
+    # Rótulo da latência desta requisição nas métricas
+    request.state.comando = rotulo_comando(body)
+
+    # No modo diferido, responde na hora com um TwiML vazio e envia o
+    # relatório depois, pela fila. Se a fila estiver cheia, responde aqui mesmo.
+    destino = form_params_dict.get("From")
+    if fila_respostas is not None and destino:
+        if fila_respostas.enfileirar(destino, body):
+            return Response(
+                content=str(MessagingResponse()), media_type="application/xml"
+            )
+        logger.warning("Fila de respostas cheia; respondendo de forma síncrona.")
+
+    text_reply = await sess.run_sync(gerar_resposta, body)
 
     resp = MessagingResponse()
+    resp.message(text_reply)
+    return Response(content=str(resp), media_type="application/xml")
+
+
+# Comandos conhecidos do WhatsApp (também usados como rótulo nas métricas)
+COMANDOS_WHATSAPP = (
+    "relatorio",
+    "relatorio anual",
+    "comparar",
+    "melhores dias",
+    "ajuda",
+)
+
+
+def identificar_comando(body: str) -> tuple[str, list[str]]:
+    """Separa a mensagem em palavras e reconhece o comando (ou "")."""
+    text = body.strip().lower().replace("relatório", "relatorio")
+    parts = text.split()
 
     # Lógica de reconhecimento de comandos
     if not parts:
-        resp.message("Comando não reconhecido. Digite `ajuda` para ver as opções.")
-        return Response(content=str(resp), media_type="application/xml")
+        return "", parts
 
     # Tenta comandos de duas palavras primeiro
     if len(parts) >= 2:
@@ -487,6 +814,26 @@ async def whatsapp_webhook(
             ]  # Se não for comando de duas palavras, pega a primeira palavra
     else:
         command = parts[0]  # Se for apenas uma palavra, pega ela mesma
+    return command, parts
+
+
+def rotulo_comando(body: str) -> str:
+    """Comando da mensagem para as métricas; texto livre vira "desconhecido"."""
+    command, _ = identificar_comando(body)
+    return command if command in COMANDOS_WHATSAPP else "desconhecido"
+
+
+def gerar_resposta(sess: Session, body: str) -> str:
+    """Interpreta o comando recebido pelo WhatsApp e monta o texto da resposta."""
+    with metricas.DURACAO_COMANDO_WHATSAPP.labels(rotulo_comando(body)).time():
+        return _gerar_resposta(sess, body)
+
+
+def _gerar_resposta(sess: Session, body: str) -> str:
+    command, parts = identificar_comando(body)
+
+    if not command:
+        return "Comando não reconhecido. Digite `ajuda` para ver as opções."
 
     if command == "relatorio":
         try:
@@ -499,8 +846,7 @@ async def whatsapp_webhook(
             report = get_report_data(inicio_atual, fim_atual, sess)
 
             if not report:
-                resp.message(f"Nenhum registro de vendas encontrado para {mes}/{ano}.")
-                return Response(content=str(resp), media_type="application/xml")
+                return f"Nenhum registro de vendas encontrado para {mes}/{ano}."
 
             # Lógica para tendência
             mes_anterior = mes - 1 if mes > 1 else 12
@@ -543,12 +889,12 @@ async def whatsapp_webhook(
                 f"Dias registrados: {report['dias_registrados']}"
                 f"{tendencia_str}"
             )
-            resp.message(text_reply)
+            return text_reply
 
         except (ValueError, IndexError):
-            resp.message("Formato inválido. Use: relatorio <mês> <ano>")
+            return "Formato inválido. Use: relatorio <mês> <ano>"
         except HTTPException as e:
-            resp.message(e.detail)
+            return e.detail
 
     elif command == "relatorio anual":
         try:
@@ -570,11 +916,11 @@ async def whatsapp_webhook(
                 f"Média por dia: R$ {report['media_vendas']:.2f}\n"
                 f"Dias registrados: {report['dias_registrados']}"
             )
-            resp.message(text_reply)
+            return text_reply
         except (ValueError, IndexError):
-            resp.message("Formato inválido. Use: relatorio anual <ano>")
+            return "Formato inválido. Use: relatorio anual <ano>"
         except HTTPException as e:
-            resp.message(e.detail)
+            return e.detail
 
     elif command == "comparar":
         try:
@@ -590,13 +936,9 @@ async def whatsapp_webhook(
             report2 = get_report_data(inicio2, fim2, sess)
 
             if not report1:
-                resp.message(
-                    f"Não há dados para o primeiro período ({mes1}/{ano1}) para comparar."
-                )
+                return f"Não há dados para o primeiro período ({mes1}/{ano1}) para comparar."
             elif not report2:
-                resp.message(
-                    f"Não há dados para o segundo período ({mes2}/{ano2}) para comparar."
-                )
+                return f"Não há dados para o segundo período ({mes2}/{ano2}) para comparar."
             else:
                 rec_liq1, rec_liq2 = (
                     report1["receita_liquida"],
@@ -614,9 +956,9 @@ async def whatsapp_webhook(
                     f"  - {mes2}/{ano2}: R$ {rec_liq2:.2f}\n"
                     f"  - Variação: {variacao}"
                 )
-                resp.message(text_reply)
+                return text_reply
         except (ValueError, IndexError):
-            resp.message("Formato inválido. Use: comparar <m1> <a1> <m2> <a2>")
+            return "Formato inválido. Use: comparar <m1> <a1> <m2> <a2>"
 
     elif command == "melhores dias":
         try:
@@ -626,7 +968,7 @@ async def whatsapp_webhook(
             ranking = get_dias_movimento(inicio, fim, sess)
 
             if not ranking:
-                resp.message(f"Não há dados de vendas para {mes}/{ano}.")
+                return f"Não há dados de vendas para {mes}/{ano}."
             else:
                 # Dicionário para traduzir os dias da semana
                 traducao_dias = {
@@ -642,9 +984,9 @@ async def whatsapp_webhook(
                 for i, (dia, total) in enumerate(ranking):
                     dia_traduzido = traducao_dias.get(dia.capitalize(), dia)
                     reply_lines.append(f"{i + 1}. {dia_traduzido}: R$ {total:.2f}")
-                resp.message("\n".join(reply_lines))
+                return "\n".join(reply_lines)
         except (ValueError, IndexError):
-            resp.message("Formato inválido. Use: melhores dias <mês> <ano>")
+            return "Formato inválido. Use: melhores dias <mês> <ano>"
 
     elif command == "ajuda":
         text_reply = (
@@ -655,9 +997,7 @@ async def whatsapp_webhook(
             "4. `melhores dias <mês> <ano>`\n"
             "5. `ajuda`"
         )
-        resp.message(text_reply)
+        return text_reply
 
     else:
-        resp.message("Comando não reconhecido. Digite `ajuda` para ver as opções.")
-
-    return Response(content=str(resp), media_type="application/xml")
+        return "Comando não reconhecido. Digite `ajuda` para ver as opções."
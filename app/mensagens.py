@@ -0,0 +1,214 @@
+"""
+Respostas diferidas do WhatsApp.
+
+O Twilio desiste do webhook depois de ~15 segundos. No modo diferido o
+webhook só valida a assinatura, coloca o comando na `FilaRespostas` e devolve
+um TwiML vazio; um worker em segundo plano gera a resposta e a envia pelo
+`enviador`, com novas tentativas e backoff exponencial em caso de falha.
+
+Configuração por variáveis de ambiente:
+    WHATSAPP_MODO_RESPOSTA  - imediato (padrão) ou diferido
+    WHATSAPP_ENVIADOR       - twilio (padrão) ou local (só registra no log)
+    WHATSAPP_REMETENTE      - número de origem, ex.: whatsapp:+14155238886
+    TWILIO_ACCOUNT_SID      - conta usada pelo enviador twilio
+    WHATSAPP_WORKERS        - quantidade de workers (padrão 2)
+    WHATSAPP_FILA_MAXSIZE   - tamanho máximo da fila (padrão 100)
+    WHATSAPP_MAX_TENTATIVAS - tentativas de envio por mensagem (padrão 4)
+    WHATSAPP_BACKOFF        - espera inicial entre tentativas, em s (padrão 1)
+"""
+
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Enviador(ABC):
+    """Interface de envio de mensagens para o usuário."""
+
+    nome = "base"
+
+    @abstractmethod
+    def enviar(self, destino: str, texto: str) -> None:
+        """Envia `texto` para `destino`; falhas levantam exceção."""
+
+
+class TwilioEnviador(Enviador):
+    """Envia as mensagens pela API REST do Twilio."""
+
+    nome = "twilio"
+
+    def __init__(self, account_sid: str, auth_token: str, remetente: str):
+        from twilio.rest import Client
+
+        self.client = Client(account_sid, auth_token)
+        self.remetente = remetente
+
+    def enviar(self, destino: str, texto: str) -> None:
+        self.client.messages.create(from_=self.remetente, to=destino, body=texto)
+
+
+class EnviadorLocal(Enviador):
+    """
+    Guarda as mensagens em memória em vez de enviá-las. Usado nos testes e em
+    desenvolvimento; `falhas` simula erros nos primeiros envios.
+    """
+
+    nome = "local"
+
+    def __init__(self, falhas: int = 0):
+        self.falhas = falhas
+        self.enviadas: list[tuple[str, str]] = []
+
+    def enviar(self, destino: str, texto: str) -> None:
+        if self.falhas > 0:
+            self.falhas -= 1
+            raise ConnectionError("Falha simulada no envio")
+        logger.info(f"Mensagem para {destino}: {texto}")
+        self.enviadas.append((destino, texto))
+
+
+class FilaRespostas:
+    """Fila de comandos do WhatsApp atendida por workers em segundo plano."""
+
+    def __init__(
+        self,
+        processar: Callable[[str], Awaitable[str]],
+        enviador: Enviador,
+        workers: int = 2,
+        maxsize: int = 100,
+        max_tentativas: int = 4,
+        backoff: float = 1.0,
+    ):
+        self.processar = processar
+        self.enviador = enviador
+        self.num_workers = workers
+        self.max_tentativas = max_tentativas
+        self.backoff = backoff
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._workers: list[asyncio.Task] = []
+        self.enfileiradas = 0
+        self.descartadas = 0
+        self.enviadas = 0
+        self.retentativas = 0
+        self.falhas = 0
+        self.erros = 0
+        self.profundidade_maxima = 0
+
+    def enfileirar(self, destino: str, comando: str) -> bool:
+        """Coloca um comando na fila. Retorna False se a fila estiver cheia."""
+        try:
+            self.fila.put_nowait((destino, comando))
+        except asyncio.QueueFull:
+            self.descartadas += 1
+            return False
+        self.enfileiradas += 1
+        self.profundidade_maxima = max(self.profundidade_maxima, self.fila.qsize())
+        return True
+
+    def iniciar(self):
+        """Inicia os workers no event loop atual."""
+        for _ in range(self.num_workers - len(self._workers)):
+            self._workers.append(asyncio.create_task(self._trabalhar()))
+
+    async def parar(self):
+        """Cancela os workers; comandos ainda na fila são perdidos."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        if self.fila.qsize():
+            logger.warning(f"{self.fila.qsize()} respostas pendentes descartadas.")
+
+    async def aguardar(self):
+        """Espera até que todos os comandos enfileirados tenham sido atendidos."""
+        await self.fila.join()
+
+    async def _trabalhar(self):
+        while True:
+            destino, comando = await self.fila.get()
+            try:
+                await self._atender(destino, comando)
+            except Exception:
+                logger.exception(f"Erro inesperado ao atender {comando!r}")
+            finally:
+                self.fila.task_done()
+
+    async def _atender(self, destino: str, comando: str):
+        try:
+            texto = await self.processar(comando)
+        except Exception:
+            self.erros += 1
+            logger.exception(f"Falha ao gerar a resposta para {comando!r}")
+            return
+
+        for tentativa in range(1, self.max_tentativas + 1):
+            try:
+                # O cliente do Twilio é síncrono; roda fora do event loop
+                await asyncio.to_thread(self.enviador.enviar, destino, texto)
+            except Exception as e:
+                if tentativa == self.max_tentativas:
+                    self.falhas += 1
+                    logger.error(
+                        f"Envio para {destino} falhou após {tentativa} tentativas: {e}"
+                    )
+                    return
+                self.retentativas += 1
+                espera = self.backoff * 2 ** (tentativa - 1)
+                logger.warning(
+                    f"Envio para {destino} falhou ({e}); nova tentativa em {espera}s"
+                )
+                await asyncio.sleep(espera)
+            else:
+                self.enviadas += 1
+                return
+
+    def stats(self) -> dict:
+        return {
+            "enviador": self.enviador.nome,
+            "workers": len(self._workers),
+            "profundidade": self.fila.qsize(),
+            "profundidade_maxima": self.profundidade_maxima,
+            "enfileiradas": self.enfileiradas,
+            "descartadas": self.descartadas,
+            "enviadas": self.enviadas,
+            "retentativas": self.retentativas,
+            "falhas": self.falhas,
+            "erros": self.erros,
+        }
+
+
+def criar_enviador() -> Enviador:
+    """Cria o enviador de mensagens a partir das variáveis de ambiente."""
+    tipo = os.getenv("WHATSAPP_ENVIADOR", "twilio").lower()
+    if tipo == "local":
+        return EnviadorLocal()
+    if tipo == "twilio":
+        return TwilioEnviador(
+            os.environ["TWILIO_ACCOUNT_SID"],
+            os.environ["TWILIO_AUTH_TOKEN"],
+            os.environ["WHATSAPP_REMETENTE"],
+        )
+    raise ValueError(f"WHATSAPP_ENVIADOR inválido: {tipo!r}")
+
+
+def criar_fila(
+    processar: Callable[[str], Awaitable[str]],
+) -> Optional[FilaRespostas]:
+    """Cria a fila de respostas se o modo diferido estiver ativo."""
+    modo = os.getenv("WHATSAPP_MODO_RESPOSTA", "imediato").lower()
+    if modo == "imediato":
+        return None
+    if modo != "diferido":
+        raise ValueError(f"WHATSAPP_MODO_RESPOSTA inválido: {modo!r}")
+    return FilaRespostas(
+        processar,
+        criar_enviador(),
+        workers=int(os.getenv("WHATSAPP_WORKERS", "2")),
+        maxsize=int(os.getenv("WHATSAPP_FILA_MAXSIZE", "100")),
+        max_tentativas=int(os.getenv("WHATSAPP_MAX_TENTATIVAS", "4")),
+        backoff=float(os.getenv("WHATSAPP_BACKOFF", "1")),
+    )
@@ -0,0 +1,154 @@
+"""
+Métricas da API no formato texto do Prometheus, expostas em /metrics.
+
+`MiddlewareMetricas` mede cada requisição (latência por rota e status,
+requisições em andamento) e, com os eventos dos engines registrados em
+`monitorar_engine`, quantos comandos SQL ela executou e quanto tempo passou
+no banco. No webhook do WhatsApp a latência também é separada por comando
+(`request.state.comando`).
+
+As métricas ficam na memória do processo: com vários workers do uvicorn,
+cada um expõe apenas os próprios números.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy import event
+
+registro = CollectorRegistry()
+
+# Limites (em segundos) dos histogramas de latência
+FAIXAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+DURACAO_REQUISICAO = Histogram(
+    "chopp_requisicao_duracao_segundos",
+    "Latência das requisições HTTP por rota.",
+    ["metodo", "rota", "comando", "status"],
+    buckets=FAIXAS_LATENCIA,
+    registry=registro,
+)
+REQUISICOES_EM_ANDAMENTO = Gauge(
+    "chopp_requisicoes_em_andamento",
+    "Requisições HTTP sendo atendidas no momento.",
+    registry=registro,
+)
+COMANDOS_SQL_POR_REQUISICAO = Histogram(
+    "chopp_sql_comandos_por_requisicao",
+    "Comandos SQL executados por requisição.",
+    ["metodo", "rota"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+    registry=registro,
+)
+TEMPO_SQL_POR_REQUISICAO = Histogram(
+    "chopp_sql_tempo_por_requisicao_segundos",
+    "Tempo gasto no banco por requisição.",
+    ["metodo", "rota"],
+    buckets=FAIXAS_LATENCIA,
+    registry=registro,
+)
+COMANDOS_SQL = Counter(
+    "chopp_sql_comandos",
+    "Comandos SQL executados (dentro ou fora de requisições).",
+    registry=registro,
+)
+TEMPO_SQL = Counter(
+    "chopp_sql_tempo_segundos",
+    "Tempo total gasto no banco.",
+    registry=registro,
+)
+DURACAO_COMANDO_WHATSAPP = Histogram(
+    "chopp_whatsapp_comando_duracao_segundos",
+    "Tempo para gerar a resposta de cada comando do WhatsApp (imediato ou diferido).",
+    ["comando"],
+    buckets=FAIXAS_LATENCIA,
+    registry=registro,
+)
+
+# Contagem de SQL da requisição em andamento. O dicionário é mutável para que
+# as contagens feitas no greenlet do SQLAlchemy ou em threads do pool (que
+# recebem cópias do contexto) cheguem à requisição.
+_banco_da_requisicao: ContextVar[Optional[dict]] = ContextVar(
+    "banco_da_requisicao", default=None
+)
+
+
+def _antes_do_comando(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metricas_inicio = time.perf_counter()
+
+
+def _depois_do_comando(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_metricas_inicio", None)
+    duracao = time.perf_counter() - inicio if inicio is not None else 0.0
+    COMANDOS_SQL.inc()
+    TEMPO_SQL.inc(duracao)
+    banco = _banco_da_requisicao.get()
+    if banco is not None:
+        banco["comandos"] += 1
+        banco["segundos"] += duracao
+
+
+def monitorar_engine(engine):
+    """Passa a medir os comandos SQL do engine (síncrono) nas métricas."""
+    if not event.contains(engine, "before_cursor_execute", _antes_do_comando):
+        event.listen(engine, "before_cursor_execute", _antes_do_comando)
+        event.listen(engine, "after_cursor_execute", _depois_do_comando)
+
+
+def rota_da_requisicao(scope) -> str:
+    """Modelo da rota (ex.: /produtos), para não criar uma série por URL."""
+    rota = scope.get("route")
+    return getattr(rota, "path", None) or "nao_encontrada"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que registra as métricas de cada requisição HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        banco = {"comandos": 0, "segundos": 0.0}
+        token = _banco_da_requisicao.set(banco)
+        REQUISICOES_EM_ANDAMENTO.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            REQUISICOES_EM_ANDAMENTO.dec()
+            _banco_da_requisicao.reset(token)
+            metodo, rota = scope["method"], rota_da_requisicao(scope)
+            comando = scope.get("state", {}).get("comando", "")
+            DURACAO_REQUISICAO.labels(metodo, rota, comando, str(status)).observe(
+                duracao
+            )
+            COMANDOS_SQL_POR_REQUISICAO.labels(metodo, rota).observe(banco["comandos"])
+            TEMPO_SQL_POR_REQUISICAO.labels(metodo, rota).observe(banco["segundos"])
+
+
+def exportar() -> tuple[bytes, str]:
+    """Métricas no formato texto do Prometheus e o content-type da resposta."""
+    return generate_latest(registro), CONTENT_TYPE_LATEST
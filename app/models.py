@@ -1,5 +1,6 @@
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Relationship
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional
 
 
@@ -18,6 +19,17 @@ class Produto(SQLModel, table=True):
 
 
 class MovimentoEstoque(SQLModel, table=True):
+    __table_args__ = (
+        # Saldo e custo médio filtram por produto e tipo de movimento; no
+        # PostgreSQL o índice também cobre as colunas lidas por essas consultas
+        Index(
+            "ix_movimentoestoque_produto_id_tipo_movimento",
+            "produto_id",
+            "tipo_movimento",
+            postgresql_include=["quantidade", "custo_unitario"],
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     tipo_movimento: (
         str  # 'entrada', 'saida_manual', 'saida_venda', 'saida_venda_barril'
@@ -31,6 +43,24 @@ class MovimentoEstoque(SQLModel, table=True):
 
 
 class Venda(SQLModel, table=True):
+    __table_args__ = (
+        # Atende tanto os filtros por período (data é a primeira coluna) quanto
+        # o DELETE do ETL por (data, produto_id)
+        Index("ix_venda_data_produto_id", "data", "produto_id"),
+        # Chave natural das vendas carregadas pelo ETL (a n-ésima linha da
+        # planilha com a mesma data, por produto). Vendas do formulário não têm
+        # hash e podem repetir o dia, por isso o índice é parcial.
+        Index(
+            "uq_venda_data_produto_id_ordem_etl",
+            "data",
+            "produto_id",
+            "ordem_no_dia",
+            unique=True,
+            sqlite_where=text("hash_conteudo IS NOT NULL"),
+            postgresql_where=text("hash_conteudo IS NOT NULL"),
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     data: date
     dia_semana: str
@@ -48,6 +78,77 @@ class Venda(SQLModel, table=True):
     preco_venda_litro_registrado: Optional[float] = (
         None  # Preço por litro no momento da venda
     )
+    # SHA-256 do conteúdo da linha da planilha; só o ETL preenche
+    hash_conteudo: Optional[str] = Field(default=None, max_length=64)
+    # Posição da linha entre as linhas da planilha com a mesma data (0, 1, ...)
+    ordem_no_dia: int = 0
 
     produto_id: Optional[int] = Field(default=None, foreign_key="produto.id")
     produto: Optional[Produto] = Relationship(back_populates="vendas")
+
+
+class SaldoEstoque(SQLModel, table=True):
+    # Saldo atual por produto, atualizado na mesma transação de cada
+    # MovimentoEstoque. Pode ser recalculado a partir do histórico com
+    # `python -m app.estoque recalcular`.
+    produto_id: int = Field(foreign_key="produto.id", primary_key=True)
+    quantidade_barris: float = 0.0
+    volume_litros: float = 0.0
+    # Base do custo médio: soma de quantidade * custo e de quantidade das entradas
+    custo_total_entradas: float = 0.0
+    quantidade_entradas: float = 0.0
+
+
+class ResumoVendaDiario(SQLModel, table=True):
+    # Totais de Venda por dia (e dia da semana registrado), mantidos pelo
+    # registro de vendas e pelo ETL. Ver `app/resumos.py`.
+    data: date = Field(primary_key=True)
+    dia_semana: str = Field(default="", primary_key=True)
+    receita: float = 0.0
+    cartao: float = 0.0
+    dinheiro: float = 0.0
+    pix: float = 0.0
+    custo_func: float = 0.0
+    custo_copos: float = 0.0
+    custo_boleto: float = 0.0
+    lucro: float = 0.0
+    num_vendas: int = 0
+
+
+class ResumoVendaMensal(SQLModel, table=True):
+    # Mesmos totais do resumo diário, agregados por mês
+    ano: int = Field(primary_key=True)
+    mes: int = Field(primary_key=True)
+    receita: float = 0.0
+    cartao: float = 0.0
+    dinheiro: float = 0.0
+    pix: float = 0.0
+    custo_func: float = 0.0
+    custo_copos: float = 0.0
+    custo_boleto: float = 0.0
+    lucro: float = 0.0
+    num_vendas: int = 0
+
+
+class CargaPlanilha(SQLModel, table=True):
+    # Uma linha por carga do ETL concluída, com o SHA-256 da planilha. A
+    # última diz se a planilha mudou desde então (ver `etl.origem.EstadoCargas`).
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sha256: str = Field(max_length=64)
+    concluida_em: datetime
+
+
+class VendaLoteItem(SQLModel):
+    """Uma venda enviada ao POST /vendas/lote, com os campos do formulário."""
+
+    data: date
+    produto_id: int
+    tipo_venda: str
+    total: Optional[float] = None
+    cartao: Optional[float] = None
+    dinheiro: Optional[float] = None
+    pix: Optional[float] = None
+    custo_func: Optional[float] = None
+    custo_copos: Optional[float] = None
+    custo_boleto: Optional[float] = None
+    quantidade_barris_vendidos: Optional[float] = None
@@ -0,0 +1,158 @@
+"""
+Páginas HTML renderizadas no servidor e servidas a partir da memória.
+
+Os templates Jinja são compilados uma vez e ficam em cache. O resultado da
+última renderização é guardado junto com as variantes comprimidas (gzip e, se
+o pacote `brotli` estiver instalado, br); enquanto os dados não mudam, a
+compressão não é refeita. Cada variante tem um ETag forte próprio, e um
+`If-None-Match` correspondente recebe 304 sem corpo, o que economiza dados no
+link móvel do trailer.
+
+Com TEMPLATE_RELOAD=1 (desenvolvimento) o template é recompilado sempre que o
+arquivo for alterado.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli é opcional
+    brotli = None
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# Codificações em ordem de preferência quando o cliente aceita várias
+PREFERENCIA = ("br", "gzip")
+
+
+def comprimir(conteudo: bytes) -> dict[str, bytes]:
+    """Gera as variantes comprimidas disponíveis de um conteúdo."""
+    variantes = {"gzip": gzip.compress(conteudo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes["br"] = brotli.compress(conteudo, quality=11)
+    return variantes
+
+
+def escolher_codificacao(accept_encoding: str, disponiveis) -> Optional[str]:
+    """
+    Escolhe a codificação a partir do cabeçalho Accept-Encoding, respeitando
+    os valores q (q=0 recusa a codificação). None significa sem compressão.
+    """
+    aceitas = {}
+    for item in accept_encoding.split(","):
+        nome, _, parametros = item.strip().partition(";")
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        parametro, _, valor = parametros.strip().partition("=")
+        if parametro.strip().lower() == "q":
+            try:
+                q = float(valor)
+            except ValueError:
+                q = 0.0
+        aceitas[nome] = q
+
+    candidatas = [
+        c
+        for c in PREFERENCIA
+        if c in disponiveis and aceitas.get(c, aceitas.get("*", 0)) > 0
+    ]
+    if not candidatas:
+        return None
+    return max(candidatas, key=lambda c: aceitas.get(c, aceitas.get("*", 0)))
+
+
+def etag_corresponde(if_none_match: str, etag: str) -> bool:
+    """Compara o If-None-Match com o ETag (comparação fraca, como manda a RFC)."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+class ConteudoComprimido:
+    """Corpo de uma resposta com suas variantes comprimidas e ETags."""
+
+    def __init__(self, conteudo: bytes, media_type: str = "text/html"):
+        self.media_type = media_type
+        self.corpos = {None: conteudo, **comprimir(conteudo)}
+        base = hashlib.sha256(conteudo).hexdigest()[:32]
+        self.etags = {
+            codificacao: f'"{base}-{codificacao}"' if codificacao else f'"{base}"'
+            for codificacao in self.corpos
+        }
+
+    def resposta(self, request: Request) -> Response:
+        """Monta a resposta para o cliente, ou 304 se ele já tiver a versão."""
+        codificacao = escolher_codificacao(
+            request.headers.get("accept-encoding", ""), self.corpos
+        )
+        headers = {
+            "ETag": self.etags[codificacao],
+            "Vary": "Accept-Encoding",
+            # A página exige login: só o navegador guarda, sempre revalidando
+            "Cache-Control": "private, no-cache",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_corresponde(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if codificacao:
+            headers["Content-Encoding"] = codificacao
+        return Response(
+            content=self.corpos[codificacao],
+            media_type=self.media_type,
+            headers=headers,
+        )
+
+
+class PaginaTemplate:
+    """Template Jinja compilado uma vez; a última renderização fica em memória."""
+
+    def __init__(self, nome: str, diretorio: Path = TEMPLATES_DIR, reload=False):
+        self.nome = nome
+        self.ambiente = Environment(
+            loader=FileSystemLoader(diretorio),
+            autoescape=True,
+            # Sem reload, o template compilado nunca é conferido no disco
+            auto_reload=reload,
+        )
+        self._html: Optional[bytes] = None
+        self._conteudo: Optional[ConteudoComprimido] = None
+        self._lock = threading.Lock()
+
+    def carregar(self):
+        """Compila o template (ou o pega do cache de templates do Jinja)."""
+        return self.ambiente.get_template(self.nome)
+
+    def renderizar(self, **contexto) -> ConteudoComprimido:
+        html = self.carregar().render(**contexto).encode("utf-8")
+        with self._lock:
+            if html != self._html:
+                self._conteudo = ConteudoComprimido(html)
+                self._html = html
+            return self._conteudo
+
+    def resposta(self, request: Request, **contexto) -> Response:
+        try:
+            return self.renderizar(**contexto).resposta(request)
+        except TemplateNotFound:
+            raise HTTPException(
+                status_code=500, detail="Arquivo de formulário não encontrado."
+            )
+
+
+pagina_formulario = PaginaTemplate(
+    "index.html",
+    reload=os.getenv("TEMPLATE_RELOAD", "").lower() in ("1", "true"),
+)
@@ -0,0 +1,227 @@
+"""
+Resumos diários e mensais de vendas usados pelos relatórios.
+
+Em vez de varrer a tabela `venda` a cada comando do WhatsApp, os relatórios
+leem `ResumoVendaDiario` (uma linha por dia e dia da semana) e
+`ResumoVendaMensal` (uma linha por mês). Os resumos são atualizados de forma
+incremental a cada venda registrada pelo formulário e recalculados para as
+datas recarregadas pelo ETL.
+
+Uso pela linha de comando:
+    python -m app.resumos recalcular
+"""
+
+import argparse
+import logging
+import sys
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, extract, func
+from sqlmodel import Session, select
+
+from app.database import inserir_ou_somar
+from app.models import ResumoVendaDiario, ResumoVendaMensal, Venda
+
+logger = logging.getLogger(__name__)
+
+# Campo do resumo -> coluna correspondente em Venda
+CAMPOS_VENDA = {
+    "receita": "total",
+    "cartao": "cartao",
+    "dinheiro": "dinheiro",
+    "pix": "pix",
+    "custo_func": "custo_func",
+    "custo_copos": "custo_copos",
+    "custo_boleto": "custo_boleto",
+    "lucro": "lucro",
+}
+
+
+def periodo_em_meses_inteiros(inicio: date, fim: date) -> bool:
+    """Indica se o período [inicio, fim) começa e termina na virada de um mês."""
+    return inicio.day == 1 and fim.day == 1
+
+
+def indice_mes(ano: int, mes: int) -> int:
+    return ano * 12 + mes - 1
+
+
+def filtro_meses(inicio: date, fim: date) -> tuple:
+    """
+    Filtro dos resumos mensais dos meses de `inicio` (inclusive) até `fim`
+    (exclusive). O intervalo de anos vem primeiro para que o banco use a
+    chave primária (ano, mes).
+    """
+    indice = ResumoVendaMensal.ano * 12 + ResumoVendaMensal.mes - 1
+    return (
+        ResumoVendaMensal.ano >= inicio.year,
+        ResumoVendaMensal.ano <= fim.year,
+        indice >= indice_mes(inicio.year, inicio.month),
+        indice < indice_mes(fim.year, fim.month),
+    )
+
+
+def registrar_venda_nos_resumos(sess: Session, venda: Venda):
+    """
+    Acrescenta uma venda aos resumos diário e mensal.
+    Não faz commit: deve ser chamada na mesma transação que grava a venda.
+    """
+    registrar_vendas_nos_resumos(sess, [venda])
+
+
+def registrar_vendas_nos_resumos(sess: Session, vendas: Iterable[Venda]):
+    """
+    Acrescenta várias vendas aos resumos com uma única atualização por dia e
+    por mês envolvidos. Não faz commit.
+    """
+    grupos = {}  # (modelo, chave) -> (valores somados, número de vendas)
+    for venda in vendas:
+        valores = {
+            campo: float(getattr(venda, coluna) or 0.0)
+            for campo, coluna in CAMPOS_VENDA.items()
+        }
+        for modelo, chave in (
+            (
+                ResumoVendaDiario,
+                (("data", venda.data), ("dia_semana", venda.dia_semana or "")),
+            ),
+            (ResumoVendaMensal, (("ano", venda.data.year), ("mes", venda.data.month))),
+        ):
+            soma, n = grupos.get((modelo, chave), (dict.fromkeys(valores, 0.0), 0))
+            grupos[(modelo, chave)] = (
+                {campo: soma[campo] + v for campo, v in valores.items()},
+                n + 1,
+            )
+
+    # Um upsert por linha de resumo, sempre na mesma ordem: no PostgreSQL,
+    # lotes concorrentes bloqueiam as linhas na mesma sequência
+    for (modelo, chave), (valores, n) in sorted(
+        grupos.items(), key=lambda item: (item[0][0].__name__, item[0][1])
+    ):
+        incrementos = {**valores, "num_vendas": n}
+        inserir_ou_somar(sess, modelo, {**dict(chave), **incrementos}, incrementos)
+
+
+def _somas(modelo, campos: dict[str, str]):
+    return [
+        func.coalesce(func.sum(getattr(modelo, coluna)), 0.0).label(campo)
+        for campo, coluna in campos.items()
+    ]
+
+
+def recalcular_resumos(sess: Session, datas: Optional[Iterable[date]] = None) -> int:
+    """
+    Recalcula os resumos a partir da tabela `venda`. Se `datas` for informado,
+    apenas esses dias (e os meses que os contêm) são refeitos; caso contrário,
+    todos os resumos são reconstruídos. Não faz commit.
+    Retorna a quantidade de linhas diárias gravadas.
+    """
+    dia_semana = func.coalesce(Venda.dia_semana, "")
+    stmt_diario = select(
+        Venda.data,
+        dia_semana,
+        *_somas(Venda, CAMPOS_VENDA),
+        func.count(Venda.id),
+    ).group_by(Venda.data, dia_semana)
+
+    del_diario = delete(ResumoVendaDiario)
+    del_mensal = delete(ResumoVendaMensal)
+    if datas is not None:
+        datas = sorted(set(datas))
+        if not datas:
+            return 0
+        # Todos os meses entre o primeiro e o último dia recarregado são refeitos
+        inicio_meses = date(datas[0].year, datas[0].month, 1)
+        ultimo = datas[-1]
+        fim_meses = date(ultimo.year + (ultimo.month == 12), ultimo.month % 12 + 1, 1)
+        stmt_diario = stmt_diario.where(Venda.data.in_(datas))
+        del_diario = del_diario.where(ResumoVendaDiario.data.in_(datas))
+        del_mensal = del_mensal.where(*filtro_meses(inicio_meses, fim_meses))
+
+    campos = list(CAMPOS_VENDA)
+    sess.exec(del_diario)
+    linhas = sess.exec(stmt_diario).all()
+    for data, dia, *valores, num_vendas in linhas:
+        sess.add(
+            ResumoVendaDiario(
+                data=data,
+                dia_semana=dia,
+                num_vendas=num_vendas,
+                **dict(zip(campos, valores)),
+            )
+        )
+    sess.flush()
+
+    # Os meses são refeitos a partir dos resumos diários já atualizados
+    ano = extract("year", ResumoVendaDiario.data)
+    mes = extract("month", ResumoVendaDiario.data)
+    stmt_mensal = select(
+        ano,
+        mes,
+        *_somas(ResumoVendaDiario, {c: c for c in campos}),
+        func.coalesce(func.sum(ResumoVendaDiario.num_vendas), 0),
+    ).group_by(ano, mes)
+    if datas is not None:
+        stmt_mensal = stmt_mensal.where(
+            ResumoVendaDiario.data >= inicio_meses,
+            ResumoVendaDiario.data < fim_meses,
+        )
+    sess.exec(del_mensal)
+    for ano_, mes_, *valores, num_vendas in sess.exec(stmt_mensal).all():
+        sess.add(
+            ResumoVendaMensal(
+                ano=int(ano_),
+                mes=int(mes_),
+                num_vendas=num_vendas,
+                **dict(zip(campos, valores)),
+            )
+        )
+    sess.flush()
+    logger.info(f"Resumos de vendas recalculados para {len(linhas)} dias.")
+    return len(linhas)
+
+
+def totais_do_periodo(sess: Session, inicio: date, fim: date) -> dict:
+    """
+    Soma no banco os totais do período [inicio, fim) e retorna uma única linha
+    com receita, custos, formas de pagamento, lucro e número de vendas.
+    Usa os resumos mensais quando o período é formado por meses inteiros
+    (um relatório anual agrega no máximo 12 linhas) e os diários caso contrário.
+    """
+    if periodo_em_meses_inteiros(inicio, fim):
+        modelo = ResumoVendaMensal
+        filtros = filtro_meses(inicio, fim)
+    else:
+        modelo = ResumoVendaDiario
+        filtros = (ResumoVendaDiario.data >= inicio, ResumoVendaDiario.data < fim)
+
+    linha = sess.exec(
+        select(
+            *_somas(modelo, {c: c for c in CAMPOS_VENDA}),
+            func.coalesce(func.sum(modelo.num_vendas), 0).label("num_vendas"),
+        ).where(*filtros)
+    ).one()
+    return dict(linha._mapping)
+
+
+def main(argv=None) -> int:
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(
+        description="Recalcula os resumos diários e mensais de vendas."
+    )
+    parser.add_argument("comando", choices=["recalcular"])
+    parser.parse_args(argv)
+
+    with Session(engine) as sess:
+        recalcular_resumos(sess)
+        sess.commit()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(main())
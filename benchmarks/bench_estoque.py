@@ -0,0 +1,141 @@
+"""
+Benchmark do cálculo de estoque (`/estoque`).
+
+Compara a implementação antiga (duas consultas por produto) com
+`app.main.consultar_estoque`, que lê a tabela de saldos materializada, mantendo
+o total de movimentos fixo e variando a quantidade de produtos. A latência da
+versão atual deve ficar praticamente estável enquanto a antiga cresce com o
+número de produtos.
+
+Uso:
+    python benchmarks/bench_estoque.py [--movimentos 20000] [--repeticoes 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# O app exige o token do Twilio na importação; o benchmark não o utiliza.
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+
+from app.estoque import recalcular_saldos  # noqa: E402
+from app.main import consultar_estoque  # noqa: E402
+from app.models import MovimentoEstoque, Produto  # noqa: E402
+
+TIPOS = ["entrada", "saida_manual", "saida_venda", "saida_venda_barril"]
+
+
+def estoque_legado(sess: Session) -> dict:
+    """Implementação original: 2 consultas por produto, soma em Python."""
+    estoque_info = {}
+    for produto in sess.exec(select(Produto)).all():
+        entradas = sess.exec(
+            select(MovimentoEstoque.quantidade).where(
+                MovimentoEstoque.produto_id == produto.id,
+                MovimentoEstoque.tipo_movimento == "entrada",
+            )
+        ).all()
+        saidas = sess.exec(
+            select(MovimentoEstoque.quantidade).where(
+                MovimentoEstoque.produto_id == produto.id,
+                MovimentoEstoque.tipo_movimento.in_(TIPOS[1:]),
+            )
+        ).all()
+        estoque_atual = sum(entradas) - sum(saidas)
+        estoque_info[produto.nome] = {
+            "quantidade_barris": estoque_atual,
+            "volume_litros_total": estoque_atual * produto.volume_litros,
+            "preco_venda_litro": produto.preco_venda_litro,
+            "preco_venda_barril_fechado": produto.preco_venda_barril_fechado,
+        }
+    return estoque_info
+
+
+def popular(engine, n_produtos: int, n_movimentos: int):
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    rnd = random.Random(42)
+    with Session(engine) as sess:
+        sess.add_all(
+            Produto(
+                nome=f"Produto {i}",
+                preco_venda_barril_fechado=600.0,
+                preco_venda_litro=20.0,
+            )
+            for i in range(n_produtos)
+        )
+        sess.commit()
+        sess.add_all(
+            MovimentoEstoque(
+                produto_id=rnd.randint(1, n_produtos),
+                tipo_movimento=rnd.choice(TIPOS),
+                quantidade=rnd.randint(1, 10),
+                custo_unitario=400.0,
+                data_movimento=date(2025, 1, 1),
+            )
+            for _ in range(n_movimentos)
+        )
+        sess.commit()
+        recalcular_saldos(sess)
+
+
+def medir(engine, funcao, repeticoes: int):
+    consultas = 0
+
+    def contar(*args):
+        nonlocal consultas
+        consultas += 1
+
+    event.listen(engine, "before_cursor_execute", contar)
+    tempos = []
+    try:
+        for _ in range(repeticoes):
+            consultas = 0
+            with Session(engine) as sess:
+                inicio = time.perf_counter()
+                resultado = funcao(sess)
+                tempos.append(time.perf_counter() - inicio)
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+    return min(tempos) * 1000, consultas, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--movimentos", type=int, default=20000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument(
+        "--produtos", type=int, nargs="+", default=[1, 10, 25, 50, 100, 200]
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench_estoque.db")
+        print(
+            f"{'produtos':>8} | {'legado (ms)':>11} | {'consultas':>9} | "
+            f"{'atual (ms)':>13} | {'consultas':>9}"
+        )
+        for n in args.produtos:
+            popular(engine, n, args.movimentos)
+            t_legado, q_legado, r_legado = medir(
+                engine, estoque_legado, args.repeticoes
+            )
+            t_novo, q_novo, r_novo = medir(engine, consultar_estoque, args.repeticoes)
+            assert r_legado == r_novo, "Os resultados divergem!"
+            print(
+                f"{n:>8} | {t_legado:>11.2f} | {q_legado:>9} | "
+                f"{t_novo:>13.2f} | {q_novo:>9}"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark de memória da leitura da planilha: `pd.read_excel(sheet_name=None)`
+(todas as abas carregadas de uma vez, como antes) contra `clean_master`, que
+abre a planilha em modo somente leitura, lê só as abas `registros_*` e limpa
+as linhas em blocos.
+
+Para cada tamanho é gerada uma planilha sintética com três abas de registros
+e uma aba grande que o ETL ignora. Cada leitura roda em um processo novo e o
+pico de memória (RSS máximo do processo) é comparado com o processo logo
+após as importações.
+
+Uso:
+    python benchmarks/bench_leitura_planilha.py [--linhas 10000 50000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# clean_data exige a URL da planilha na importação; ela é trocada abaixo.
+os.environ.setdefault("SHEETS_XLSX_URL", "benchmark")
+
+import openpyxl  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import etl.clean_data as clean_data  # noqa: E402
+from etl.master import EscritorMaster, para_tabela  # noqa: E402
+
+CABECALHO = [
+    "Data",
+    "Dia da Semana",
+    "Vendas Total Feira",
+    "Cartão Feira",
+    "Dinheiro Feira",
+    "Pix Feira",
+    "Lucro Feira",
+    "Boleto Klaro",
+    "Custo Funcionários",
+    "Custo Copos",
+    "Observações",
+]
+
+
+def gerar_planilha(caminho: str, linhas: int):
+    rnd = random.Random(42)
+    wb = openpyxl.Workbook(write_only=True)
+    for ano in (2022, 2023, 2024):
+        aba = wb.create_sheet(f"Registros_{ano}")
+        aba.append(CABECALHO)
+        inicio = date(ano, 1, 1)
+        for i in range(linhas):
+            aba.append(
+                [
+                    (inicio + timedelta(days=i % 365)).strftime("%d/%m/%Y"),
+                    "Sábado",
+                    f"{rnd.uniform(100, 5000):.2f}".replace(".", ","),
+                    round(rnd.uniform(0, 2000), 2),
+                    round(rnd.uniform(0, 1000), 2),
+                    round(rnd.uniform(0, 1000), 2),
+                    round(rnd.uniform(-100, 2000), 2),
+                    0.0,
+                    120.0,
+                    35.5,
+                    "chuva" if i % 10 == 0 else None,
+                ]
+            )
+    # Aba que o ETL descarta, do mesmo tamanho das de registros
+    aba = wb.create_sheet("Estoque")
+    aba.append([f"coluna_{c}" for c in range(11)])
+    for i in range(linhas):
+        aba.append([rnd.random() for _ in range(11)])
+    wb.save(caminho)
+
+
+def read_excel(caminho: str, destino: str):
+    abas = pd.read_excel(caminho, sheet_name=None)
+    dfs = []
+    for nome, df in abas.items():
+        if nome.lower().startswith("registros_"):
+            df.columns = clean_data.normalizar_colunas(df.columns)
+            dfs.append(df.rename(columns=clean_data.RENOMEAR_COLUNAS))
+    master = pd.concat(dfs, ignore_index=True)
+    master["data"] = pd.to_datetime(master["data"], dayfirst=True, errors="coerce")
+    master = master.dropna(subset=["data"])
+    for col in clean_data.COLUNAS_NUMERICAS:
+        master[col] = clean_data.parse_num_series(master[col])
+    with EscritorMaster(destino) as escritor:
+        escritor.escrever_tabela(para_tabela(master))
+
+
+def streaming(caminho: str, destino: str):
+    clean_data.SHEETS_XLSX_URL = caminho
+    clean_data.clean_master(destino, debug_csv=None)
+
+
+def medir(modo: str, caminho: str, destino: str, fila):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    {"read_excel": read_excel, "streaming": streaming}[modo](caminho, destino)
+    tempo = time.perf_counter() - inicio
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KiB no Linux
+    fila.put((tempo, (pico - base) / 1024, pico / 1024))
+
+
+def em_processo_novo(modo: str, caminho: str, destino: str):
+    contexto = multiprocessing.get_context("spawn")
+    fila = contexto.Queue()
+    processo = contexto.Process(target=medir, args=(modo, caminho, destino, fila))
+    processo.start()
+    resultado = fila.get()
+    processo.join()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 50_000])
+    args = parser.parse_args()
+
+    print(
+        f"{'linhas/aba':>10} | {'xlsx (MB)':>9} | {'modo':>10} | {'tempo (s)':>9} | "
+        f"{'+RSS (MB)':>9} | {'pico (MB)':>9}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for linhas in args.linhas:
+            caminho = os.path.join(tmp, f"planilha_{linhas}.xlsx")
+            gerar_planilha(caminho, linhas)
+            tamanho = os.path.getsize(caminho) / 1024 / 1024
+            for modo in ("read_excel", "streaming"):
+                destino = os.path.join(tmp, f"master_{modo}.parquet")
+                tempo, acrescimo, pico = em_processo_novo(modo, caminho, destino)
+                print(
+                    f"{linhas:>10} | {tamanho:>9.1f} | {modo:>10} | {tempo:>9.1f} | "
+                    f"{acrescimo:>9.0f} | {pico:>9.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
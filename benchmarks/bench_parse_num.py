@@ -0,0 +1,82 @@
+"""
+Benchmark da conversão das colunas numéricas do ETL: `Series.apply(parse_num)`
+(uma chamada Python por célula) contra `parse_num_series` (operações de
+coluna do pandas).
+
+As colunas sintéticas misturam o que chega da planilha: números já
+convertidos pelo Excel, texto no formato brasileiro ("1.234,56"), células
+vazias e alguns valores inválidos. O resultado das duas versões é conferido
+antes da medição.
+
+Uso:
+    python benchmarks/bench_parse_num.py [--linhas 100000 500000] [--repeticoes 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# clean_data exige a URL da planilha na importação; o benchmark não a utiliza.
+os.environ.setdefault("SHEETS_XLSX_URL", "benchmark")
+
+from etl.clean_data import parse_num, parse_num_series  # noqa: E402
+
+
+def gerar_coluna(n: int, seed: int = 42) -> pd.Series:
+    rnd = random.Random(seed)
+    valores = []
+    for _ in range(n):
+        sorteio = rnd.random()
+        valor = round(rnd.uniform(-500, 50000), 2)
+        if sorteio < 0.45:
+            valores.append(valor)
+        elif sorteio < 0.85:
+            texto = f"{valor:,.2f}".replace(",", "_").replace(".", ",")
+            valores.append(texto.replace("_", "."))
+        elif sorteio < 0.95:
+            valores.append(None)
+        else:
+            valores.append(rnd.choice(["", "-", "R$ 10", "n/d", " 12 "]))
+    return pd.Series(valores, dtype=object)
+
+
+def medir(funcao, serie: pd.Series, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(serie)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[100_000, 500_000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'linhas':>8} | {'apply (ms)':>10} | {'vetorizado (ms)':>15} | {'ganho':>6}"
+    )
+    for n in args.linhas:
+        serie = gerar_coluna(n)
+        assert np.array_equal(
+            serie.apply(parse_num).to_numpy(dtype=float),
+            parse_num_series(serie).to_numpy(),
+        )
+        t_apply = medir(lambda s: s.apply(parse_num), serie, args.repeticoes)
+        t_vetor = medir(parse_num_series, serie, args.repeticoes)
+        print(
+            f"{n:>8} | {t_apply * 1000:>10.1f} | {t_vetor * 1000:>15.1f} | "
+            f"{t_apply / t_vetor:>5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark do registro de vendas: `/registrar_venda` (uma venda por requisição)
+contra `/vendas/lote` (todas as vendas em uma transação).
+
+As requisições passam pela aplicação completa (autenticação, validação,
+sessão assíncrona), usando um banco SQLite temporário. Para cada tamanho de
+lote são medidos o tempo total, as vendas por segundo e a quantidade de
+comandos SQL executados.
+
+Uso:
+    python benchmarks/bench_vendas_lote.py [--vendas 10 50 200 500]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+_tmp = tempfile.TemporaryDirectory()
+# A aplicação lê a configuração na importação
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench_vendas.db"
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+os.environ.setdefault("FORM_USER", "benchmark")
+os.environ.setdefault("FORM_PASSWORD", "benchmark")
+os.environ["REPORT_CACHE_BACKEND"] = "none"
+
+import httpx  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from app.database import async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import MovimentoEstoque, Produto, SaldoEstoque  # noqa: E402
+
+AUTH = (os.environ["FORM_USER"], os.environ["FORM_PASSWORD"])
+
+
+def popular():
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as sess:
+        for i in range(5):
+            sess.add(
+                Produto(
+                    nome=f"Produto {i}",
+                    preco_venda_barril_fechado=600.0,
+                    preco_venda_litro=20.0,
+                )
+            )
+        sess.commit()
+        for produto_id in range(1, 6):
+            sess.add(
+                MovimentoEstoque(
+                    produto_id=produto_id,
+                    tipo_movimento="entrada",
+                    quantidade=1000,
+                    custo_unitario=300.0,
+                    data_movimento=date(2025, 1, 1),
+                )
+            )
+            sess.add(
+                SaldoEstoque(
+                    produto_id=produto_id,
+                    quantidade_barris=1000,
+                    volume_litros=50000,
+                    custo_total_entradas=300000.0,
+                    quantidade_entradas=1000,
+                )
+            )
+        sess.commit()
+
+
+def gerar_vendas(n: int) -> list[dict]:
+    rnd = random.Random(42)
+    vendas = []
+    for _ in range(n):
+        venda = {
+            "data": f"2025-02-{rnd.randint(1, 28):02d}",
+            "produto_id": rnd.randint(1, 5),
+            "cartao": 100.0,
+            "dinheiro": 50.0,
+            "pix": 0.0,
+        }
+        if rnd.random() < 0.8:
+            venda.update(tipo_venda="feira", total=150.0, custo_func=40.0)
+        else:
+            venda.update(tipo_venda="barril_festas", quantidade_barris_vendidos=1)
+        vendas.append(venda)
+    return vendas
+
+
+async def medir(funcao, vendas: list[dict]):
+    popular()
+    comandos = 0
+
+    def contar(*args):
+        nonlocal comandos
+        comandos += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", contar)
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", auth=AUTH
+        ) as client:
+            inicio = time.perf_counter()
+            await funcao(client, vendas)
+            tempo = time.perf_counter() - inicio
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", contar)
+    return tempo, comandos
+
+
+async def uma_a_uma(client: httpx.AsyncClient, vendas: list[dict]):
+    for venda in vendas:
+        response = await client.post("/registrar_venda", data=venda)
+        response.raise_for_status()
+
+
+async def em_lote(client: httpx.AsyncClient, vendas: list[dict]):
+    response = await client.post("/vendas/lote", json=vendas)
+    response.raise_for_status()
+
+
+async def executar(tamanhos: list[int]):
+    print(
+        f"{'vendas':>6} | {'individual (ms)':>15} | {'vendas/s':>8} | {'SQL':>6} | "
+        f"{'lote (ms)':>9} | {'vendas/s':>8} | {'SQL':>4}"
+    )
+    for n in tamanhos:
+        vendas = gerar_vendas(n)
+        t_um, sql_um = await medir(uma_a_uma, vendas)
+        t_lote, sql_lote = await medir(em_lote, vendas)
+        print(
+            f"{n:>6} | {t_um * 1000:>15.1f} | {n / t_um:>8.0f} | {sql_um:>6} | "
+            f"{t_lote * 1000:>9.1f} | {n / t_lote:>8.0f} | {sql_lote:>4}"
+        )
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vendas", type=int, nargs="+", default=[10, 50, 200, 500])
+    args = parser.parse_args()
+    try:
+        asyncio.run(executar(args.vendas))
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,25 @@
 import os
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, Optional, Union
+import numpy as np
+import openpyxl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype
 from dotenv import load_dotenv
+from etl.master import (
+    BASE_DIR,
+    COLUNAS_NUMERICAS,
+    SCHEMA_MASTER,
+    EscritorMaster,
+    para_tabela,
+)
+from etl.origem import criar_origem
+from etl.relatorio import etapa
 
 # Carrega variáveis de ambiente do .env para que o script possa ser executado de forma independente
 load_dotenv()
@@ -10,98 +27,340 @@ load_dotenv()
 # Configura um logger para este módulo
 logger = logging.getLogger(__name__)
 
+# Linhas da planilha lidas e limpas de cada vez
+ETL_LINHAS_POR_BLOCO = int(os.getenv("ETL_LINHAS_POR_BLOCO", "5000"))
+
+# Processos que limpam as abas em paralelo. O padrão (1) limpa tudo no processo
+# atual, em blocos e com memória limitada; com mais workers cada aba é
+# carregada inteira em um processo, então a memória cresce com o tamanho delas.
+ETL_WORKERS = int(os.getenv("ETL_WORKERS", "1"))
+
+# Cabeçalhos da planilha (já normalizados) -> colunas do master
+RENOMEAR_COLUNAS = {
+    "vendas_total_feira": "total",
+    "cartao_feira": "cartao",
+    "dinheiro_feira": "dinheiro",
+    "pix_feira": "pix",
+    "lucro_feira": "lucro",
+    "boleto_klaro": "custo_boleto",
+    "custo_funcionarios": "custo_func",
+}
+
+# Textos que o pd.read_excel trata como célula vazia (na_values padrão)
+VALORES_VAZIOS = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+# Caminho opcional de um CSV com a planilha limpa, só para depuração
+ETL_DEBUG_CSV = os.getenv("ETL_DEBUG_CSV")
+
 SHEETS_XLSX_URL = os.getenv("SHEETS_XLSX_URL")
 if not SHEETS_XLSX_URL:
     raise ValueError("A variável de ambiente SHEETS_XLSX_URL não foi definida.")
 
+# Número que `float()` aceita sem ambiguidade depois de tirar o separador de
+# milhar e trocar a vírgula decimal (com espaços ASCII nas pontas, que
+# `strip()` removeria); o resto passa por `parse_num`.
+NUMERO_SIMPLES = (
+    r"^[ \t\n\r\f\v]*[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+    r"[ \t\n\r\f\v]*$"
+)
+
+
+def parse_num(s):
+    # se for NaN do pandas, já zera
+    if pd.isna(s):
+        return 0.0
+    # se for int ou float _não_ NaN, retorna direto
+    if isinstance(s, (int, float)):
+        return float(s)
+    # senão, é string: remove milhar e ajusta vírgula
+    s = str(s).strip().replace(".", "").replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return 0.0
+
+
+def parse_num_series(serie: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de `parse_num` para uma coluna inteira, com o mesmo
+    resultado célula a célula. Números e strings no formato "1.234,56" são
+    convertidos por operações de coluna; só os valores incomuns (texto
+    inválido, "inf", outros tipos) caem em `parse_num`.
+    """
+    if (
+        is_bool_dtype(serie.dtype)
+        or is_integer_dtype(serie.dtype)
+        or is_float_dtype(serie.dtype)
+    ):
+        return serie.astype(float).fillna(0.0)
 
-def clean_master(output_path="master.csv"):
-    logger.info("Iniciando leitura da planilha a partir da URL.")
-    # Le todas as abas do sheets
-    all_sheets: dict[str, pd.DataFrame] = pd.read_excel(
-        SHEETS_XLSX_URL, sheet_name=None
+    valores = serie.to_numpy(dtype=object)
+    resultado = np.zeros(len(valores))
+    pendentes = ~pd.isna(valores)
+
+    # Tipos distintos da coluna (poucos), para não chamar isinstance por célula
+    tipos = np.frompyfunc(type, 1, 1)(valores)
+    unicos = set(tipos[pendentes])
+    numeros = pendentes & np.isin(
+        tipos, [t for t in unicos if issubclass(t, (int, float))]
     )
+    resultado[numeros] = valores[numeros].astype(float)
+    pendentes &= ~numeros
 
-    logger.debug(f"Abas lidas do Sheets: {list(all_sheets.keys())}")
-    for aba, df in all_sheets.items():
-        logger.debug(f" - {aba!r}: {df.shape[0]} linhas, {df.shape[1]} colunas")
+    textos = pendentes & np.isin(tipos, [t for t in unicos if issubclass(t, str)])
+    if textos.any():
+        indices = np.flatnonzero(textos)
+        try:
+            # As operações de texto rodam nos kernels do Arrow, não por célula
+            originais = pa.array(valores[indices], type=pa.string())
+        except (pa.ArrowException, UnicodeEncodeError):
+            # Texto que não é UTF-8 válido (ex.: surrogates) fica para parse_num
+            originais = None
+        if originais is not None:
+            normalizados = pc.replace_substring(
+                pc.replace_substring(originais, ".", ""), ",", "."
+            )
+            simples = pc.match_substring_regex(normalizados, NUMERO_SIMPLES).to_numpy(
+                zero_copy_only=False
+            )
+            resultado[indices[simples]] = pc.cast(
+                pc.ascii_trim_whitespace(normalizados.filter(simples)), pa.float64()
+            ).to_numpy()
+            # Sem dígito, "inf" ou "nan", `float()` certamente falha: fica 0.0
+            talvez_numero = pc.match_substring_regex(
+                normalizados.filter(~simples), r"(?i)\p{Nd}|inf|nan"
+            ).to_numpy(zero_copy_only=False)
+            pendentes[indices[simples]] = False
+            pendentes[indices[~simples][~talvez_numero]] = False
 
-    # Filtra só as abas que interessam
-    dfs = []
-    for aba, df in all_sheets.items():
-        if not aba.lower().startswith("registros_"):
-            continue
-        df.columns = (
-            df.columns.str.strip()
-            .str.normalize("NFKD")
-            .str.encode("ascii", errors="ignore")
-            .str.decode("utf-8")
-            .str.lower()
-            .str.replace(r"\s+", "_", regex=True)
-        )
+    if pendentes.any():
+        resultado[pendentes] = [parse_num(v) for v in valores[pendentes]]
+    return pd.Series(resultado, index=serie.index, name=serie.name)
 
-        # renomeia as colunas necessarias
-        df = df.rename(
-            columns={
-                "vendas_total_feira": "total",
-                "cartao_feira": "cartao",
-                "dinheiro_feira": "dinheiro",
-                "pix_feira": "pix",
-                "lucro_feira": "lucro",
-                "boleto_klaro": "custo_boleto",
-                "custo_funcionarios": "custo_func",
-            }
-        )
 
-        dfs.append(df)
+def normalizar_colunas(colunas: pd.Index) -> pd.Index:
+    return (
+        colunas.str.strip()
+        .str.normalize("NFKD")
+        .str.encode("ascii", errors="ignore")
+        .str.decode("utf-8")
+        .str.lower()
+        .str.replace(r"\s+", "_", regex=True)
+    )
+
 
-    # concatena num único dataframe
-    if not dfs:
-        logger.warning("Nenhuma aba de 'registros_' encontrada na planilha.")
-        return
+def nomes_do_cabecalho(cabecalho: tuple) -> pd.Index:
+    """Nomes das colunas como o `pd.read_excel` os monta (vazias e repetidas)."""
+    nomes = []
+    vistos: dict[str, int] = {}
+    for i, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if valor is None else str(valor)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return normalizar_colunas(pd.Index(nomes, dtype=object))
 
-    master = pd.concat(dfs, ignore_index=True)
-    logger.info(f"Foram concatenadas {master.shape[0]} linhas de {len(dfs)} abas.")
+
+def limpar_bloco(bloco: pd.DataFrame) -> pd.DataFrame:
+    """Aplica a limpeza da planilha a um bloco de linhas de uma aba."""
+    bloco = bloco.replace(VALORES_VAZIOS, None)
+
+    # renomeia as colunas necessarias
+    bloco = bloco.rename(columns=RENOMEAR_COLUNAS)
+
+    # Abas sem alguma coluna (ex.: sem "Custo Copos") ficam com ela vazia,
+    # como no concat de todas as abas: a data vira NaT e os números viram 0.0
+    for col in ["data", *COLUNAS_NUMERICAS]:
+        if col not in bloco.columns:
+            bloco[col] = None
 
     # Trata a data de forma genérica
-    master["data"] = pd.to_datetime(master["data"], dayfirst=True, errors="coerce")
+    bloco["data"] = pd.to_datetime(bloco["data"], dayfirst=True, errors="coerce")
 
     # Se necessário, descarta linhas sem data válida
-    master = master.dropna(subset=["data"])
+    bloco = bloco.dropna(subset=["data"])
 
     # Tratamento de numéricos
-    campos_num = [
-        "total",
-        "cartao",
-        "dinheiro",
-        "pix",
-        "lucro",
-        "custo_func",
-        "custo_copos",
-        "custo_boleto",
-    ]
-
-    def parse_num(s):
-        # se for NaN do pandas, já zera
-        if pd.isna(s):
-            return 0.0
-        # se for int ou float _não_ NaN, retorna direto
-        if isinstance(s, (int, float)):
-            return float(s)
-        # senão, é string: remove milhar e ajusta vírgula
-        s = str(s).strip().replace(".", "").replace(",", ".")
-        try:
-            return float(s)
-        except ValueError:
-            return 0.0
+    for col in COLUNAS_NUMERICAS:
+        bloco[col] = parse_num_series(bloco[col])
+    return bloco
+
+
+def ler_blocos(aba, tamanho: int) -> Iterator[pd.DataFrame]:
+    """
+    Percorre as linhas de uma aba aberta em modo somente leitura e entrega
+    blocos de até `tamanho` linhas. Linhas totalmente vazias são ignoradas.
+    """
+    linhas = aba.iter_rows(values_only=True)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        return
+    colunas = nomes_do_cabecalho(cabecalho)
+    bloco = []
+    for linha in linhas:
+        if all(valor is None for valor in linha):
+            continue
+        bloco.append(linha[: len(colunas)])
+        if len(bloco) >= tamanho:
+            yield pd.DataFrame(bloco, columns=colunas, dtype=object)
+            bloco = []
+    if bloco:
+        yield pd.DataFrame(bloco, columns=colunas, dtype=object)
+
 
-    for col in campos_num:
-        master[col] = master[col].apply(parse_num)
+def limpar_blocos(aba, linhas_por_bloco: int, tempos: dict) -> Iterator[pa.Table]:
+    """
+    Lê e limpa uma aba bloco a bloco, entregando tabelas do master. Soma em
+    `tempos` os segundos gastos lendo a planilha e limpando os dados.
+    """
+    blocos = ler_blocos(aba, linhas_por_bloco)
+    while True:
+        inicio = time.perf_counter()
+        bloco = next(blocos, None)
+        tempos["leitura_s"] += time.perf_counter() - inicio
+        if bloco is None:
+            return
+        inicio = time.perf_counter()
+        tabela = para_tabela(limpar_bloco(bloco))
+        tempos["limpeza_s"] += time.perf_counter() - inicio
+        yield tabela
 
-    # exporta o csv limpo
-    out = Path(__file__).parent.parent / output_path
-    master.to_csv(out, index=False)
-    logger.info(f"Arquivo master salvo em {out!s} com {len(master)} registros.")
+
+def limpar_aba(caminho: Union[str, Path], nome: str, linhas_por_bloco: int):
+    """
+    Abre a planilha, lê e limpa uma aba inteira e devolve (tabela do master,
+    tempos). Roda nos processos do pool, por isso abre a própria planilha.
+    """
+    inicio = time.perf_counter()
+    tempos = {"leitura_s": 0.0, "limpeza_s": 0.0}
+    planilha = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        tabelas = list(limpar_blocos(planilha[nome], linhas_por_bloco, tempos))
+    finally:
+        planilha.close()
+    tabela = pa.concat_tables(tabelas) if tabelas else SCHEMA_MASTER.empty_table()
+    tempos["segundos"] = time.perf_counter() - inicio
+    return tabela, tempos
+
+
+def clean_master(
+    output_path="master.parquet",
+    debug_csv: Optional[str] = ETL_DEBUG_CSV,
+    linhas_por_bloco: Optional[int] = None,
+    caminho: Union[str, Path, None] = None,
+    workers: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Lê as abas `registros_*` da planilha em modo somente leitura, limpa cada
+    uma e grava o master, na ordem das abas na planilha.
+
+    Com um worker, as linhas são lidas e gravadas em blocos de
+    `linhas_por_bloco` no próprio processo (memória constante). Com mais, cada
+    aba é limpa em um processo de um ProcessPoolExecutor e o resultado é
+    gravado assim que chega a sua vez. `caminho` é a planilha já obtida; sem
+    ele, ela vem de SHEETS_XLSX_URL.
+
+    Retorna o total de linhas e os tempos de cada aba.
+    """
+    linhas_por_bloco = linhas_por_bloco or ETL_LINHAS_POR_BLOCO
+    if caminho is None:
+        caminho = criar_origem(SHEETS_XLSX_URL).obter().caminho
+    logger.info(f"Iniciando leitura da planilha {caminho!s}.")
+    with etapa("clean_master.abrir_planilha"):
+        planilha = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        logger.debug(f"Abas do Sheets: {planilha.sheetnames}")
+        # Filtra só as abas que interessam, antes de ler qualquer linha
+        abas = [
+            nome
+            for nome in planilha.sheetnames
+            if nome.lower().startswith("registros_")
+        ]
+        if not abas:
+            logger.warning("Nenhuma aba de 'registros_' encontrada na planilha.")
+            return None
+        workers = min(workers or ETL_WORKERS, len(abas))
+
+        out = BASE_DIR / output_path
+        por_aba = []
+        with (
+            etapa("clean_master.limpeza", workers=workers) as medicao,
+            EscritorMaster(
+                out, BASE_DIR / debug_csv if debug_csv else None
+            ) as escritor,
+        ):
+            if workers <= 1:
+                for nome in abas:
+                    inicio = time.perf_counter()
+                    tempos = {"leitura_s": 0.0, "limpeza_s": 0.0, "escrita_s": 0.0}
+                    antes = escritor.linhas
+                    for tabela in limpar_blocos(
+                        planilha[nome], linhas_por_bloco, tempos
+                    ):
+                        inicio_escrita = time.perf_counter()
+                        escritor.escrever_tabela(tabela)
+                        tempos["escrita_s"] += time.perf_counter() - inicio_escrita
+                    tempos["segundos"] = time.perf_counter() - inicio
+                    por_aba.append((nome, escritor.linhas - antes, tempos))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futuros = [
+                        pool.submit(limpar_aba, caminho, nome, linhas_por_bloco)
+                        for nome in abas
+                    ]
+                    # Grava na ordem das abas, não na ordem em que terminam
+                    for nome, futuro in zip(abas, futuros):
+                        tabela, tempos = futuro.result()
+                        inicio_escrita = time.perf_counter()
+                        escritor.escrever_tabela(tabela)
+                        tempos["escrita_s"] = time.perf_counter() - inicio_escrita
+                        por_aba.append((nome, tabela.num_rows, tempos))
+            medicao["linhas"] = escritor.linhas
+            medicao["abas"] = [
+                {
+                    "aba": nome,
+                    "linhas": linhas,
+                    **{chave: round(valor, 3) for chave, valor in tempos.items()},
+                }
+                for nome, linhas, tempos in por_aba
+            ]
+    finally:
+        planilha.close()
+
+    for aba in medicao["abas"]:
+        logger.info(
+            f"Aba {aba['aba']!r}: {aba['linhas']} linhas limpas em "
+            f"{aba['segundos']:.2f}s (leitura {aba['leitura_s']:.2f}s, "
+            f"limpeza {aba['limpeza_s']:.2f}s, escrita {aba['escrita_s']:.2f}s)."
+        )
+    logger.info(f"Foram lidas {len(abas)} abas de registros ({workers} worker(s)).")
+    logger.info(f"Arquivo master salvo em {out!s} com {escritor.linhas} registros.")
+    if debug_csv:
+        logger.info(f"CSV de depuração salvo em {BASE_DIR / debug_csv!s}.")
+    return {"linhas": escritor.linhas, "workers": workers, "abas": medicao["abas"]}
 
 
 if __name__ == "__main__":
@@ -1,11 +1,19 @@
+import hashlib
+import io
+import json
 import os
 import logging
-from pathlib import Path
+import time
+from typing import Optional
 import pandas as pd
-from sqlalchemy import delete, exc
+from sqlalchemy import delete, exc, insert, update
 from sqlmodel import Session, select
+from app.cache import report_cache
 from app.database import engine, init_db
 from app.models import Venda, Produto
+from app.resumos import recalcular_resumos
+from etl import master
+from etl.relatorio import etapa
 from dotenv import load_dotenv
 
 # Configura um logger para este módulo
@@ -14,13 +22,218 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente do .env
 load_dotenv()
 
-# Caminho para o CSV mestre
-BASE_DIR = Path(__file__).resolve().parent.parent
-MASTER_CSV = BASE_DIR / "master.csv"
+# Master tipado gerado por clean_master (ver etl/master.py)
+MASTER_PARQUET = master.MASTER_PARQUET
 
 # Usa variável de ambiente para o nome do produto, com um padrão
 ETL_PRODUCT_NAME = os.getenv("ETL_PRODUCT_NAME", "Chopp Pilsen 50L")
 
+# Quantidade de vendas por comando de INSERT em lote
+ETL_CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", "1000"))
+
+# No PostgreSQL as vendas são gravadas com COPY (ETL_COPY=0 desativa)
+ETL_COPY = os.getenv("ETL_COPY", "1") != "0"
+
+# Coluna da tabela venda -> (coluna do master, valor quando a coluna não existe)
+COLUNAS_VENDA = {
+    "data": ("data", None),
+    "dia_semana": ("dia_da_semana", None),
+    "total": ("total", 0.0),
+    "cartao": ("cartao", 0.0),
+    "dinheiro": ("dinheiro", 0.0),
+    "pix": ("pix", 0.0),
+    "custo_func": ("custo_func", 0.0),
+    "custo_copos": ("custo_copos", 0.0),
+    "custo_boleto": ("custo_boleto", 0.0),
+    "lucro": ("lucro", 0.0),
+    "observacoes": ("observacoes", None),
+}
+
+
+def montar_linhas(df: pd.DataFrame, product_id: int) -> list[dict]:
+    """
+    Monta as linhas da tabela venda a partir das colunas do DataFrame, sem
+    percorrer linha a linha. Valores ausentes (NaN) viram NULL.
+    """
+    colunas = {}
+    for coluna, (origem, padrao) in COLUNAS_VENDA.items():
+        if origem in df.columns:
+            serie = df[origem].astype(object)
+            colunas[coluna] = serie.where(serie.notna(), None).tolist()
+        else:
+            colunas[coluna] = [padrao] * len(df)
+    # A planilha registra as vendas de feira, todas do produto do ETL
+    colunas["tipo_venda"] = ["feira"] * len(df)
+    colunas["produto_id"] = [product_id] * len(df)
+    linhas = [dict(zip(colunas, valores)) for valores in zip(*colunas.values())]
+    for linha in linhas:
+        linha["hash_conteudo"] = hash_linha(linha)
+    return linhas
+
+
+def hash_linha(linha: dict) -> str:
+    """SHA-256 do conteúdo de uma linha, para saber se ela mudou desde a última carga."""
+    valores = [linha.get(coluna) for coluna in (*COLUNAS_VENDA, "tipo_venda")]
+    return hashlib.sha256(
+        json.dumps(valores, default=str, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def numerar_por_data(linhas: list[dict]) -> list[dict]:
+    """
+    Numera as linhas de cada data na ordem da planilha (`ordem_no_dia`), já
+    que (data, produto, ordem_no_dia) é a chave natural das vendas do ETL.
+    Datas repetidas são vendas distintas do mesmo dia e ficam todas.
+    """
+    por_data: dict = {}
+    numeradas = []
+    for linha in linhas:
+        if linha["data"] is None:
+            continue
+        linha["ordem_no_dia"] = por_data.get(linha["data"], 0)
+        por_data[linha["data"]] = linha["ordem_no_dia"] + 1
+        numeradas.append(linha)
+    return numeradas
+
+
+def _valor_copy(valor) -> str:
+    """Formata um valor para o formato texto do COPY do PostgreSQL."""
+    if valor is None:
+        return "\\N"
+    if isinstance(valor, float):
+        return repr(valor)
+    texto = valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+    return (
+        texto.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copiar_postgres(sess: Session, linhas: list[dict], tamanho_lote: int):
+    """Grava as linhas com COPY ... FROM STDIN, na transação da sessão."""
+    colunas = list(linhas[0])
+    comando = f"COPY venda ({', '.join(colunas)}) FROM STDIN"
+    dbapi = sess.connection().connection.dbapi_connection
+    with dbapi.cursor() as cursor:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            for inicio in range(0, len(linhas), tamanho_lote):
+                buffer = io.StringIO()
+                for linha in linhas[inicio : inicio + tamanho_lote]:
+                    buffer.write("\t".join(_valor_copy(v) for v in linha.values()))
+                    buffer.write("\n")
+                buffer.seek(0)
+                cursor.copy_expert(comando, buffer)
+        else:  # psycopg 3
+            with cursor.copy(comando) as copy:
+                for linha in linhas:
+                    copy.write_row(tuple(linha.values()))
+
+
+def inserir_vendas(
+    sess: Session, linhas: list[dict], tamanho_lote: Optional[int] = None
+) -> int:
+    """
+    Insere as vendas em lotes de `tamanho_lote` linhas (executemany) ou com
+    COPY no PostgreSQL. Não faz commit. Retorna a quantidade inserida.
+    """
+    if not linhas:
+        return 0
+    tamanho_lote = tamanho_lote or ETL_CHUNK_SIZE
+    inicio = time.perf_counter()
+    if ETL_COPY and sess.get_bind().dialect.name == "postgresql":
+        copiar_postgres(sess, linhas, tamanho_lote)
+    else:
+        comando = insert(Venda).execution_options(render_nulls=True)
+        for i in range(0, len(linhas), tamanho_lote):
+            sess.exec(comando, params=linhas[i : i + tamanho_lote])
+    duracao = time.perf_counter() - inicio
+    logger.info(
+        f"{len(linhas)} vendas inseridas em {duracao:.2f}s "
+        f"({len(linhas) / max(duracao, 1e-9):.0f} linhas/s, lotes de {tamanho_lote})."
+    )
+    return len(linhas)
+
+
+def sincronizar_vendas(
+    sess: Session, linhas: list[dict], product_id: int
+) -> tuple[dict, set]:
+    """
+    Compara as linhas da planilha com as vendas já carregadas pelo hash do
+    conteúdo: insere as novas, atualiza as alteradas e ignora as iguais.
+    Vendas sem hash nas datas da planilha (cargas anteriores ao hash) e
+    linhas de uma data que deixaram de existir na planilha são apagadas.
+    Não faz commit. Retorna as contagens e as datas que mudaram.
+    """
+    linhas = numerar_por_data(linhas)
+    contagens = {"inseridas": 0, "atualizadas": 0, "inalteradas": 0, "removidas": 0}
+    if not linhas:
+        return contagens, set()
+    datas = [linha["data"] for linha in linhas]
+
+    # Uma única consulta pelo intervalo da planilha em vez de um IN com
+    # milhares de datas; o índice (data, produto_id) atende o filtro
+    existentes, sem_hash = {}, set()
+    conjunto_datas = set(datas)
+    with etapa("load.consultar_existentes") as medicao:
+        for venda_id, data, ordem, hash_conteudo in sess.exec(
+            select(Venda.id, Venda.data, Venda.ordem_no_dia, Venda.hash_conteudo).where(
+                Venda.produto_id == product_id,
+                Venda.data.between(min(datas), max(datas)),
+            )
+        ):
+            if hash_conteudo is not None:
+                existentes[(data, ordem)] = (venda_id, hash_conteudo)
+            elif data in conjunto_datas:
+                sem_hash.add(data)
+        medicao["linhas"] = len(existentes)
+
+    # Linhas de uma data da planilha que sumiram (ex.: a data tinha duas
+    # vendas e agora tem uma)
+    chaves = {(linha["data"], linha["ordem_no_dia"]) for linha in linhas}
+    sobrando = {
+        chave: venda_id
+        for chave, (venda_id, _) in existentes.items()
+        if chave[0] in conjunto_datas and chave not in chaves
+    }
+
+    datas_alteradas = set(sem_hash) | {data for data, _ in sobrando}
+    if sem_hash:
+        with etapa("load.apagar_sem_hash") as medicao:
+            result = sess.exec(
+                delete(Venda).where(
+                    Venda.data.in_(sem_hash),
+                    Venda.produto_id == product_id,
+                    Venda.hash_conteudo.is_(None),
+                )
+            )
+            contagens["removidas"] = medicao["linhas"] = result.rowcount
+    if sobrando:
+        sess.exec(delete(Venda).where(Venda.id.in_(sobrando.values())))
+        contagens["removidas"] += len(sobrando)
+
+    novas, alteradas = [], []
+    for linha in linhas:
+        atual = existentes.get((linha["data"], linha["ordem_no_dia"]))
+        if atual is None:
+            novas.append(linha)
+        elif atual[1] != linha["hash_conteudo"]:
+            alteradas.append({"id": atual[0], **linha})
+        else:
+            contagens["inalteradas"] += 1
+            continue
+        datas_alteradas.add(linha["data"])
+
+    with etapa("load.inserir") as medicao:
+        contagens["inseridas"] = medicao["linhas"] = inserir_vendas(sess, novas)
+    if alteradas:
+        with etapa("load.atualizar") as medicao:
+            # UPDATE em lote pela chave primária (executemany)
+            sess.exec(update(Venda), params=alteradas)
+            contagens["atualizadas"] = medicao["linhas"] = len(alteradas)
+    return contagens, datas_alteradas
+
 
 def load():
     try:
@@ -47,68 +260,61 @@ def load():
             )
             raise ValueError(f"Produto '{ETL_PRODUCT_NAME}' não encontrado.")
 
-    if not MASTER_CSV.exists():
-        logger.error(f"Arquivo master não encontrado em: {MASTER_CSV}")
-        raise FileNotFoundError(f"Arquivo master não encontrado em: {MASTER_CSV}")
+    if not MASTER_PARQUET.exists():
+        logger.error(f"Arquivo master não encontrado em: {MASTER_PARQUET}")
+        raise FileNotFoundError(f"Arquivo master não encontrado em: {MASTER_PARQUET}")
 
-    # Lê o CSV mestre com parse de datas
-    logger.info(f"Lendo arquivo de dados de {MASTER_CSV}")
-    df = pd.read_csv(MASTER_CSV, parse_dates=["data"])
-    df["data"] = pd.to_datetime(df["data"], errors="coerce").dt.date
+    # Lê o master já tipado: datas como date, texto como str, valores float
+    logger.info(f"Lendo arquivo de dados de {MASTER_PARQUET}")
+    with etapa("load.ler_master") as medicao:
+        df = master.ler_master(MASTER_PARQUET)
+        medicao["linhas"] = len(df)
 
-    # --- Apaga todas as vendas para as datas deste CSV ---
     datas = df["data"].dropna().unique().tolist()
     if not datas:
         logger.warning(
-            "Nenhuma data válida encontrada no arquivo CSV. Nenhum dado será carregado."
+            "Nenhuma data válida encontrada no arquivo master. Nenhum dado será carregado."
         )
         return
 
-    logger.info(f"Apagando registros existentes para {len(datas)} datas.")
+    # --- Insere, atualiza ou ignora cada dia conforme o hash do conteúdo ---
+    logger.info(f"Sincronizando {len(df)} registros de {len(datas)} datas...")
     with Session(engine) as sess:
         try:
-            stmt = delete(Venda).where(
-                Venda.data.in_(datas), Venda.produto_id == product_id
-            )
-            result = sess.exec(stmt)
-            sess.commit()
-            logger.info(f"{result.rowcount} registros foram apagados.")
-        except exc.SQLAlchemyError as e:
-            logger.error(
-                f"Erro no banco de dados ao apagar registros: {e}", exc_info=True
+            contagens, datas_alteradas = sincronizar_vendas(
+                sess, montar_linhas(df, product_id), product_id
             )
-            sess.rollback()
-            raise
-
-    # --- Insere tudo de novo ---
-    logger.info(f"Inserindo {len(df)} novos registros...")
-    with Session(engine) as sess:
-        try:
-            for _, row in df.iterrows():
-                venda = Venda(
-                    data=row["data"],
-                    dia_semana=row.get("dia_da_semana"),
-                    total=row.get("total", 0.0),
-                    cartao=row.get("cartao", 0.0),
-                    dinheiro=row.get("dinheiro", 0.0),
-                    pix=row.get("pix", 0.0),
-                    custo_func=row.get("custo_func", 0.0),
-                    custo_copos=row.get("custo_copos", 0.0),
-                    custo_boleto=row.get("custo_boleto", 0.0),
-                    lucro=row.get("lucro", 0.0),
-                    observacoes=row.get("observacoes"),
-                    produto_id=product_id,  # Associa ao produto correto
-                )
-                sess.add(venda)
-            sess.commit()
+            if datas_alteradas:
+                # Atualiza os resumos de relatório apenas dos dias alterados
+                with etapa("load.resumos") as medicao:
+                    sess.flush()
+                    medicao["linhas"] = recalcular_resumos(sess, datas_alteradas)
+            with etapa("load.commit"):
+                sess.commit()
         except exc.SQLAlchemyError as e:
             logger.error(
-                f"Erro no banco de dados ao inserir registros: {e}", exc_info=True
+                f"Erro no banco de dados ao sincronizar registros: {e}", exc_info=True
             )
             sess.rollback()
             raise
 
-    logger.info(f"{len(df)} registros recarregados para {len(datas)} dias.")
+    # Só os relatórios em cache que cobrem dias alterados ficam inválidos
+    with etapa("load.invalidar_cache"):
+        report_cache.invalidar(datas_alteradas, product_id)
+    backend = report_cache.backend
+    if datas_alteradas and backend is not None and not backend.compartilhado:
+        logger.warning(
+            f"Cache de relatórios '{backend.nome}' não é compartilhado com a API: "
+            "ela pode servir relatórios antigos até o TTL. Use "
+            "REPORT_CACHE_BACKEND=sqlite para que o ETL invalide o cache da API."
+        )
+    logger.info(
+        f"Vendas do ETL: {contagens['inseridas']} inseridas, "
+        f"{contagens['atualizadas']} atualizadas, "
+        f"{contagens['inalteradas']} inalteradas, "
+        f"{contagens['removidas']} removidas (sem hash ou fora da planilha)."
+    )
+    return contagens
 
 
 if __name__ == "__main__":
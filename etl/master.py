@@ -0,0 +1,101 @@
+"""
+Arquivo intermediário entre as etapas do ETL (limpeza -> carga).
+
+A planilha limpa é gravada em Parquet com um esquema declarado: a carga lê as
+colunas já tipadas, sem reinterpretar datas nem inferir tipos (no CSV, uma
+coluna de texto toda vazia voltava como float/NaN). O CSV fica apenas como
+exportação opcional para depuração.
+"""
+
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MASTER_PARQUET = BASE_DIR / "master.parquet"
+
+COLUNAS_TEXTO = ["dia_da_semana", "observacoes"]
+
+COLUNAS_NUMERICAS = [
+    "total",
+    "cartao",
+    "dinheiro",
+    "pix",
+    "lucro",
+    "custo_func",
+    "custo_copos",
+    "custo_boleto",
+]
+
+SCHEMA_MASTER = pa.schema(
+    [
+        pa.field("data", pa.date32(), nullable=False),
+        *(pa.field(coluna, pa.string()) for coluna in COLUNAS_TEXTO),
+        *(pa.field(coluna, pa.float64()) for coluna in COLUNAS_NUMERICAS),
+    ]
+)
+
+
+def para_tabela(df: pd.DataFrame) -> pa.Table:
+    """
+    Converte a planilha limpa para o esquema do master. Colunas fora do
+    esquema são descartadas; colunas de texto ausentes ficam nulas e as
+    numéricas ausentes, zeradas (como `parse_num` faz com células vazias).
+    """
+    colunas = {"data": pd.to_datetime(df["data"]).dt.date}
+    for coluna in COLUNAS_TEXTO:
+        if coluna in df.columns:
+            serie = df[coluna].astype(object)
+            colunas[coluna] = serie.where(serie.isna(), serie.astype(str))
+        else:
+            colunas[coluna] = [None] * len(df)
+    for coluna in COLUNAS_NUMERICAS:
+        colunas[coluna] = df[coluna] if coluna in df.columns else [0.0] * len(df)
+    return pa.Table.from_pydict(
+        {
+            coluna: pa.array(valores, from_pandas=True)
+            for coluna, valores in colunas.items()
+        }
+    ).cast(SCHEMA_MASTER)
+
+
+class EscritorMaster:
+    """
+    Grava o master em blocos (um row group por bloco), para que a planilha
+    nunca precise estar inteira na memória. O CSV de depuração, se pedido,
+    recebe os mesmos blocos.
+    """
+
+    def __init__(self, caminho: Union[str, Path], debug_csv=None):
+        self.caminho = caminho
+        self.debug_csv = debug_csv
+        self.linhas = 0
+        self._parquet = pq.ParquetWriter(caminho, SCHEMA_MASTER, compression="zstd")
+
+    def escrever_tabela(self, tabela: pa.Table):
+        self._parquet.write_table(tabela)
+        if self.debug_csv:
+            tabela.to_pandas().to_csv(
+                self.debug_csv,
+                mode="a" if self.linhas else "w",
+                header=not self.linhas,
+                index=False,
+            )
+        self.linhas += tabela.num_rows
+
+    def fechar(self):
+        self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def ler_master(caminho: Union[str, Path] = MASTER_PARQUET) -> pd.DataFrame:
+    """Lê o master com os tipos declarados (datas como `datetime.date`)."""
+    return pq.read_table(caminho, schema=SCHEMA_MASTER).to_pandas()
@@ -0,0 +1,181 @@
+"""
+Origem da planilha do ETL: uma URL (exportação do Google Sheets) ou um arquivo
+local.
+
+Downloads ficam em cache no disco (ETL_CACHE_DIR) junto com o ETag, o
+Last-Modified e o SHA-256 do conteúdo. Nas execuções seguintes a requisição é
+condicional: se o servidor responder 304 o arquivo em cache é usado sem novo
+download. O hash do conteúdo identifica a versão da planilha; quando ela é a
+mesma da última carga concluída (registrada no banco, ver `EstadoCargas`), o
+ETL termina sem limpar nem carregar nada.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+
+from sqlalchemy import exc
+from sqlmodel import Session, select
+
+from app.models import CargaPlanilha
+from etl.master import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+ETL_CACHE_DIR = Path(os.getenv("ETL_CACHE_DIR", BASE_DIR / ".cache" / "etl"))
+
+# Tempo máximo (segundos) de espera pela resposta do servidor
+ETL_DOWNLOAD_TIMEOUT = float(os.getenv("ETL_DOWNLOAD_TIMEOUT", "60"))
+
+TAMANHO_BLOCO = 1024 * 1024
+
+
+@dataclass
+class Planilha:
+    """Versão local da planilha pronta para leitura."""
+
+    caminho: Path
+    sha256: str
+    # True só quando o arquivo acabou de ser baixado (não veio do cache)
+    baixada: bool = False
+
+
+def hash_arquivo(caminho: Union[str, Path]) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _chave(valor: str) -> str:
+    return hashlib.sha256(valor.encode("utf-8")).hexdigest()[:16]
+
+
+class OrigemLocal:
+    def __init__(self, caminho: Union[str, Path]):
+        self.caminho = Path(caminho)
+
+    def __str__(self):
+        return str(self.caminho)
+
+    def obter(self) -> Planilha:
+        return Planilha(self.caminho, hash_arquivo(self.caminho))
+
+
+class OrigemURL:
+    """Planilha baixada de uma URL, com cache e revalidação condicional."""
+
+    def __init__(self, url: str, cache_dir: Union[str, Path, None] = None):
+        self.url = url
+        self.cache_dir = Path(cache_dir or ETL_CACHE_DIR)
+        chave = _chave(url)
+        self.arquivo = self.cache_dir / f"{chave}.xlsx"
+        self.metadados = self.cache_dir / f"{chave}.json"
+
+    def __str__(self):
+        # A URL de exportação pode conter tokens; não vai inteira para o log
+        return self.url.split("?")[0]
+
+    def _ler_metadados(self) -> Optional[dict]:
+        if not (self.arquivo.exists() and self.metadados.exists()):
+            return None
+        try:
+            return json.loads(self.metadados.read_text())
+        except ValueError:
+            return None
+
+    def obter(self) -> Planilha:
+        cache = self._ler_metadados()
+        requisicao = urllib.request.Request(self.url)
+        if cache:
+            if cache.get("etag"):
+                requisicao.add_header("If-None-Match", cache["etag"])
+            if cache.get("last_modified"):
+                requisicao.add_header("If-Modified-Since", cache["last_modified"])
+
+        try:
+            resposta = urllib.request.urlopen(requisicao, timeout=ETL_DOWNLOAD_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cache:
+                logger.info(f"Planilha em cache ainda válida (304) para {self}.")
+                return Planilha(self.arquivo, cache["sha256"])
+            raise
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        sha = hashlib.sha256()
+        with (
+            resposta,
+            tempfile.NamedTemporaryFile(
+                dir=self.cache_dir, suffix=".part", delete=False
+            ) as destino,
+        ):
+            try:
+                for bloco in iter(lambda: resposta.read(TAMANHO_BLOCO), b""):
+                    sha.update(bloco)
+                    destino.write(bloco)
+            except BaseException:
+                destino.close()
+                os.unlink(destino.name)
+                raise
+        # Troca atômica: um download interrompido não corrompe o cache
+        os.replace(destino.name, self.arquivo)
+        self.metadados.write_text(
+            json.dumps(
+                {
+                    "etag": resposta.headers.get("ETag"),
+                    "last_modified": resposta.headers.get("Last-Modified"),
+                    "sha256": sha.hexdigest(),
+                }
+            )
+        )
+        logger.info(
+            f"Planilha baixada de {self} ({self.arquivo.stat().st_size} bytes)."
+        )
+        return Planilha(self.arquivo, sha.hexdigest(), baixada=True)
+
+
+def criar_origem(valor: str, cache_dir: Union[str, Path, None] = None):
+    """Cria a origem a partir de SHEETS_XLSX_URL: URL http(s) ou caminho local."""
+    if valor.lower().startswith(("http://", "https://")):
+        return OrigemURL(valor, cache_dir)
+    return OrigemLocal(valor)
+
+
+class EstadoCargas:
+    """
+    Hash da última planilha carregada com sucesso, guardado no próprio banco
+    (tabela `cargaplanilha`). Assim o estado acompanha o banco: outro host, um
+    cache apagado ou um banco restaurado não enganam a verificação.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def ultima(self) -> Optional[str]:
+        """SHA-256 da última carga; None se nunca houve carga neste banco."""
+        try:
+            with Session(self.engine) as sess:
+                return sess.exec(
+                    select(CargaPlanilha.sha256)
+                    .order_by(CargaPlanilha.id.desc())
+                    .limit(1)
+                ).first()
+        except (exc.OperationalError, exc.ProgrammingError):
+            # Tabela ainda não criada: o `load` a cria com `init_db`
+            return None
+
+    def registrar(self, sha256: str):
+        with Session(self.engine) as sess:
+            sess.add(
+                CargaPlanilha(sha256=sha256, concluida_em=datetime.now(timezone.utc))
+            )
+            sess.commit()
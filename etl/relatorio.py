@@ -0,0 +1,120 @@
+"""
+Relatório de execução do ETL.
+
+Cada etapa de `clean_master` e `load` roda dentro de `etapa(nome)`, que mede
+o tempo de relógio, o pico de memória do processo (RSS máximo até o fim da
+etapa) e a quantidade de comandos SQL executados no engine monitorado. As
+etapas entram no relatório ativo, que o run_etl.py grava em JSON ao final;
+sem relatório ativo, as medições só vão para o log.
+
+Etapas podem ser aninhadas (ex.: `load` contém `load.inserir`); os números
+da etapa externa incluem os das internas.
+"""
+
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+
+from sqlalchemy import event
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - indisponível no Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_relatorio_ativo: ContextVar[Optional["RelatorioExecucao"]] = ContextVar(
+    "relatorio_etl", default=None
+)
+
+# Comandos SQL executados nos engines monitorados desde o início do processo
+_comandos_sql = 0
+
+
+def _contar_comando(*args):
+    global _comandos_sql
+    _comandos_sql += 1
+
+
+def monitorar_engine(engine):
+    """Passa a contar os comandos SQL executados no engine."""
+    if not event.contains(engine, "before_cursor_execute", _contar_comando):
+        event.listen(engine, "before_cursor_execute", _contar_comando)
+
+
+def pico_rss_mb(filhos: bool = False) -> Optional[float]:
+    """RSS máximo do processo (ou dos processos filhos já encerrados), em MB."""
+    if resource is None:
+        return None
+    quem = resource.RUSAGE_CHILDREN if filhos else resource.RUSAGE_SELF
+    pico = resource.getrusage(quem).ru_maxrss
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RelatorioExecucao:
+    def __init__(self):
+        self.inicio = datetime.now(timezone.utc)
+        self.etapas: list[dict] = []
+        self._relogio = time.perf_counter()
+        self._comandos = _comandos_sql
+
+    @contextmanager
+    def ativar(self):
+        token = _relatorio_ativo.set(self)
+        try:
+            yield self
+        finally:
+            _relatorio_ativo.reset(token)
+
+    def como_dict(self, **extra) -> dict:
+        return {
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "segundos": round(time.perf_counter() - self._relogio, 3),
+            "pico_rss_mb": pico_rss_mb(),
+            "pico_rss_filhos_mb": pico_rss_mb(filhos=True),
+            "comandos_sql": _comandos_sql - self._comandos,
+            **extra,
+            "etapas": self.etapas,
+        }
+
+    def salvar(self, caminho: Union[str, Path], **extra) -> dict:
+        dados = self.como_dict(**extra)
+        Path(caminho).write_text(
+            json.dumps(dados, indent=2, ensure_ascii=False, default=str)
+        )
+        return dados
+
+
+@contextmanager
+def etapa(nome: str, **info):
+    """
+    Mede uma etapa. O dicionário entregue pode receber dados da etapa (ex.:
+    `linhas`), que vão para o relatório junto com as medições.
+    """
+    relatorio = _relatorio_ativo.get()
+    dados = {"etapa": nome, **info}
+    if relatorio is not None:
+        # Entra no relatório na ordem de início; os números chegam no fim
+        relatorio.etapas.append(dados)
+    comandos = _comandos_sql
+    inicio = time.perf_counter()
+    try:
+        yield dados
+    finally:
+        dados["segundos"] = round(time.perf_counter() - inicio, 3)
+        dados["comandos_sql"] = _comandos_sql - comandos
+        dados["pico_rss_mb"] = pico_rss_mb()
+        logger.info(
+            f"Etapa {nome}: {dados['segundos']:.2f}s, "
+            f"{dados['comandos_sql']} comandos SQL"
+            + (f", {dados['linhas']} linhas" if "linhas" in dados else "")
+            + "."
+        )
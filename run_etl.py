@@ -1,38 +1,112 @@
+import argparse
+import cProfile
 import os
 import logging
+from etl import clean_data, load_to_db
 from etl.clean_data import clean_master
 from etl.load_to_db import load
+from app.database import engine
+from etl.origem import EstadoCargas, criar_origem
+from etl.relatorio import RelatorioExecucao, etapa, monitorar_engine
 
-# Configuração básica do logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
 
-# Garante que os caminhos sejam relativos ao script
-# Isso é importante para rodar em diferentes ambientes
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+def executar(forcar: bool = False) -> str:
+    """Executa as etapas do ETL e retorna a situação final da execução."""
+    # 0. Obtém a planilha (cache local revalidado com o servidor)
+    with etapa("download") as medicao:
+        planilha = criar_origem(clean_data.SHEETS_XLSX_URL).obter()
+        medicao.update(
+            baixada=planilha.baixada, bytes=os.path.getsize(planilha.caminho)
+        )
 
-if __name__ == "__main__":
-    logging.info("Iniciando processo de ETL...")
+    # A última carga fica registrada no próprio banco
+    cargas = EstadoCargas(engine)
+    if not forcar and cargas.ultima() == planilha.sha256:
+        logging.info(
+            "Planilha inalterada desde a última carga "
+            f"(sha256 {planilha.sha256[:12]}); nada a fazer."
+        )
+        return "inalterada"
 
-    # 1. Limpa os dados e gera o master.csv
-    logging.info("Passo 1: Limpando dados e gerando master.csv")
-    try:
-        clean_master()
-        logging.info("Passo 1 concluído com sucesso.")
-    except Exception as e:
-        logging.error(f"Erro na execução do clean_master: {e}", exc_info=True)
-        exit(1)  # Encerra o script se houver um erro crítico
+    # 1. Limpa os dados e gera o master.parquet
+    logging.info("Passo 1: Limpando dados e gerando master.parquet")
+    with etapa("clean_master") as medicao:
+        resumo = clean_master(load_to_db.MASTER_PARQUET, caminho=planilha.caminho)
+        medicao["linhas"] = resumo["linhas"] if resumo else 0
+    logging.info("Passo 1 concluído com sucesso.")
 
-    # 2. Carrega os dados do master.csv para o banco de dados
+    # 2. Carrega os dados do master.parquet para o banco de dados
     logging.info("Passo 2: Carregando dados para o banco de dados")
+    with etapa("load") as medicao:
+        contagens = load()
+        if contagens:
+            medicao.update(contagens)
+    logging.info("Passo 2 concluído com sucesso.")
+
+    cargas.registrar(planilha.sha256)
+    return "concluida"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Executa o ETL da planilha.")
+    parser.add_argument(
+        "--forcar",
+        action="store_true",
+        help="processa a planilha mesmo que ela não tenha mudado desde a última carga",
+    )
+    parser.add_argument(
+        "--relatorio",
+        default=os.getenv("ETL_RELATORIO", "etl_relatorio.json"),
+        help="arquivo JSON com o relatório da execução (tempos, linhas, memória, SQL)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="etl.prof",
+        help="grava um perfil do cProfile (padrão: etl.prof); veja com `python -m pstats`",
+    )
+    args = parser.parse_args(argv)
+
+    # Garante que os caminhos sejam relativos ao script
+    # Isso é importante para rodar em diferentes ambientes
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    logging.info("Iniciando processo de ETL...")
+    monitorar_engine(engine)
+    relatorio = RelatorioExecucao()
+    perfil = cProfile.Profile() if args.profile else None
+    situacao, erro = "erro", None
     try:
-        load()
-        logging.info("Passo 2 concluído com sucesso.")
+        with relatorio.ativar():
+            if perfil:
+                perfil.enable()
+            try:
+                situacao = executar(args.forcar)
+            finally:
+                if perfil:
+                    perfil.disable()
     except Exception as e:
-        logging.error(f"Erro na execução do load: {e}", exc_info=True)
-        exit(1)  # Encerra o script se houver um erro crítico
+        # Encerra o script se houver um erro crítico
+        logging.error(f"Erro na execução do ETL: {e}", exc_info=True)
+        erro = repr(e)
+    finally:
+        relatorio.salvar(args.relatorio, situacao=situacao, erro=erro)
+        logging.info(f"Relatório da execução salvo em {args.relatorio}.")
+        if perfil:
+            perfil.dump_stats(args.profile)
+            logging.info(f"Perfil do cProfile salvo em {args.profile}.")
 
+    if situacao == "erro":
+        return 1
     logging.info("Processo de ETL concluído com sucesso!")
+    return 0
+
+
+if __name__ == "__main__":
+    # Configuração básica do logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    exit(main())
@@ -0,0 +1,101 @@
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.estoque import recalcular_saldos
+from app.models import MovimentoEstoque, Produto
+
+
+class ComandosSQL(list):
+    """Comandos SQL executados dentro de um bloco de `limite_sql`."""
+
+    def listar(self) -> str:
+        return "\n".join(f"  {i}. {comando}" for i, comando in enumerate(self, 1))
+
+
+@contextmanager
+def contar_sql(*engines):
+    """Registra os comandos SQL executados nos engines durante o bloco."""
+    comandos = ComandosSQL()
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(" ".join(statement.split()))
+
+    # Engines assíncronos emitem os eventos pelo engine síncrono interno
+    alvos = [getattr(engine, "sync_engine", engine) for engine in engines]
+    for alvo in alvos:
+        event.listen(alvo, "before_cursor_execute", registrar)
+    try:
+        yield comandos
+    finally:
+        for alvo in alvos:
+            event.remove(alvo, "before_cursor_execute", registrar)
+
+
+@pytest.fixture
+def limite_sql():
+    """
+    Orçamento de comandos SQL para um bloco de código. Uso:
+
+        with limite_sql(3, async_engine) as comandos:
+            client.get("/estoque")
+
+    Ao sair do bloco, o teste falha listando os comandos executados se o
+    orçamento foi ultrapassado.
+    """
+
+    @contextmanager
+    def limite(maximo: int, *engines):
+        with contar_sql(*engines) as comandos:
+            yield comandos
+        if len(comandos) > maximo:
+            pytest.fail(
+                f"{len(comandos)} comandos SQL executados, orçamento de {maximo}:\n"
+                + comandos.listar(),
+                pytrace=False,
+            )
+
+    return limite
+
+
+@pytest.fixture
+def completar_catalogo():
+    """
+    Cadastra produtos até o total pedido, cada um com uma entrada em estoque.
+    Uso: `completar_catalogo(engine, 100)`.
+    """
+
+    def completar(engine, quantidade: int):
+        with Session(engine) as session:
+            existentes = len(session.exec(select(Produto.id)).all())
+            novos = [
+                Produto(
+                    nome=f"Chopp {i}",
+                    preco_venda_barril_fechado=600.0,
+                    preco_venda_litro=20.0,
+                )
+                for i in range(existentes + 1, quantidade + 1)
+            ]
+            session.add_all(novos)
+            session.flush()
+            session.add_all(
+                MovimentoEstoque(
+                    tipo_movimento="entrada",
+                    quantidade=10,
+                    custo_unitario=400.0,
+                    data_movimento=date(2025, 10, 1),
+                    produto_id=produto.id,
+                )
+                for produto in novos
+            )
+            recalcular_saldos(session)
+            session.commit()
+
+    return completar
@@ -0,0 +1,139 @@
+import sys
+import os
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.cache import MemoryBackend, ReportCache, SQLiteBackend
+
+
+def _relatorio(chamadas):
+    def relatorio(inicio, fim, sess, produto_id=None):
+        chamadas.append((inicio, fim, produto_id))
+        return {"inicio": inicio.isoformat(), "produto_id": produto_id}
+
+    return relatorio
+
+
+def test_memory_backend_lru():
+    chamadas = []
+    cache = ReportCache(MemoryBackend(maxsize=2))
+    relatorio = cache.cached("relatorio")(_relatorio(chamadas))
+
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    relatorio(date(2025, 2, 1), date(2025, 3, 1), None)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)  # acerto
+    relatorio(date(2025, 3, 1), date(2025, 4, 1), None)  # despeja fevereiro
+    relatorio(date(2025, 2, 1), date(2025, 3, 1), None)  # falta
+
+    assert len(chamadas) == 4
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 4
+    assert stats["despejos"] == 2
+    assert stats["entradas"] == 2
+
+
+def test_memory_backend_ttl():
+    chamadas = []
+    cache = ReportCache(MemoryBackend(ttl=0.05))
+    relatorio = cache.cached("relatorio")(_relatorio(chamadas))
+
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    time.sleep(0.1)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    assert len(chamadas) == 2
+
+
+def test_invalidacao_por_periodo_e_produto():
+    chamadas = []
+    cache = ReportCache(MemoryBackend())
+    relatorio = cache.cached("relatorio")(_relatorio(chamadas))
+
+    relatorio(date(2025, 1, 1), date(2026, 1, 1), None)  # anual, todos os produtos
+    relatorio(date(2025, 3, 1), date(2025, 4, 1), None, produto_id=1)
+    relatorio(date(2025, 3, 1), date(2025, 4, 1), None, produto_id=2)
+    relatorio(date(2025, 4, 1), date(2025, 5, 1), None, produto_id=1)
+
+    # Venda do produto 1 em março: anual e março/produto 1 saem do cache
+    assert cache.invalidar([date(2025, 3, 31)], produto_id=1) == 2
+    assert cache.stats()["entradas"] == 2
+    # O fim do período é exclusivo
+    assert cache.invalidar([date(2025, 5, 1)]) == 0
+    assert cache.invalidar([date(2024, 12, 31), date(2025, 4, 1)]) == 1
+
+
+def test_sqlite_backend_compartilhado(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+    chamadas = []
+    # Dois "workers" usando o mesmo arquivo
+    web = ReportCache(SQLiteBackend(caminho))
+    etl = ReportCache(SQLiteBackend(caminho))
+
+    @web.cached("dias_movimento", decode=lambda r: [tuple(item) for item in r])
+    def relatorio(inicio, fim, sess):
+        chamadas.append((inicio, fim))
+        return [("Saturday", 10.0)]
+
+    assert relatorio(date(2025, 3, 1), date(2025, 4, 1), None) == [("Saturday", 10.0)]
+    assert relatorio(date(2025, 3, 1), date(2025, 4, 1), None) == [("Saturday", 10.0)]
+    assert len(chamadas) == 1
+
+    assert etl.invalidar([date(2025, 3, 15)]) == 1
+    relatorio(date(2025, 3, 1), date(2025, 4, 1), None)
+    assert len(chamadas) == 2
+    assert web.stats()["entradas"] == 1
+    assert web.stats()["hits"] == 1
+
+
+def test_sqlite_backend_lru(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"), maxsize=2)
+    for mes in (1, 2, 3):
+        chave = ("relatorio", date(2025, mes, 1).isoformat(), "2026-01-01", None)
+        backend.set(chave, {"mes": mes})
+        time.sleep(0.01)
+    assert len(backend) == 2
+    assert backend.despejos == 1
+
+
+def test_resultado_calculado_durante_invalidacao_nao_e_guardado():
+    chamadas = []
+    cache = ReportCache(MemoryBackend())
+
+    def relatorio(inicio, fim, sess, produto_id=None):
+        chamadas.append(inicio)
+        if len(chamadas) == 1:
+            # Uma venda do período é gravada enquanto o relatório é calculado
+            cache.invalidar([date(2025, 1, 10)])
+        return {"chamada": len(chamadas)}
+
+    relatorio = cache.cached("relatorio")(relatorio)
+
+    assert relatorio(date(2025, 1, 1), date(2025, 2, 1), None) == {"chamada": 1}
+    assert cache.stats()["entradas"] == 0
+    assert relatorio(date(2025, 1, 1), date(2025, 2, 1), None) == {"chamada": 2}
+    assert relatorio(date(2025, 1, 1), date(2025, 2, 1), None) == {"chamada": 2}
+    assert len(chamadas) == 2
+
+
+def test_carencia_apos_invalidacao_com_replica():
+    chamadas = []
+    cache = ReportCache(MemoryBackend(), carencia=0.1)
+    relatorio = cache.cached("relatorio")(_relatorio(chamadas))
+
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    assert len(chamadas) == 1
+
+    # Logo após a invalidação a réplica pode estar atrasada: nada é guardado
+    cache.invalidar([date(2025, 1, 10)])
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    assert len(chamadas) == 3
+
+    time.sleep(0.15)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    relatorio(date(2025, 1, 1), date(2025, 2, 1), None)
+    assert len(chamadas) == 4
@@ -0,0 +1,214 @@
+import sys
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import exc, func, text
+from sqlmodel import Session, SQLModel, select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import etl.load_to_db as load_to_db
+from app import database
+from app.models import Produto, ResumoVendaDiario, ResumoVendaMensal, Venda
+from app.resumos import registrar_vendas_nos_resumos
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def banco(tmp_path):
+    """Banco SQLite em arquivo com o perfil de produção (WAL, pragmas)."""
+    engine = database.criar_engine(f"sqlite:///{tmp_path / 'stress.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as sess:
+        sess.add(
+            Produto(nome="Chopp", preco_venda_barril_fechado=600, preco_venda_litro=20)
+        )
+        sess.commit()
+    yield engine
+    engine.dispose()
+
+
+def _vendas(quantidade: int, inicio: date = date(2020, 1, 1)) -> list[dict]:
+    return [
+        {
+            "data": inicio + timedelta(days=i),
+            "dia_semana": "Sábado",
+            "tipo_venda": "copo",
+            "total": 100.0,
+            "cartao": 50.0,
+            "dinheiro": 25.0,
+            "pix": 25.0,
+            "lucro": 40.0,
+            "produto_id": 1,
+            "hash_conteudo": f"{i:064x}",
+        }
+        for i in range(quantidade)
+    ]
+
+
+def test_pragmas_aplicados_em_cada_conexao(banco):
+    with banco.connect() as conn:
+        pragmas = {
+            nome: conn.exec_driver_sql(f"PRAGMA {nome}").scalar()
+            for nome in ("journal_mode", "synchronous", "busy_timeout", "foreign_keys")
+        }
+    # synchronous=NORMAL é 1
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,
+        "busy_timeout": database.SQLITE_PRAGMAS["busy_timeout"],
+        "foreign_keys": 1,
+    }
+
+
+@pytest.mark.anyio
+async def test_pragmas_no_engine_assincrono(tmp_path):
+    engine = database.criar_async_engine(f"sqlite:///{tmp_path / 'async.db'}")
+    async with engine.connect() as conn:
+        modo = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+        chaves = (await conn.exec_driver_sql("PRAGMA foreign_keys")).scalar()
+    await engine.dispose()
+    assert (modo, chaves) == ("wal", 1)
+
+
+def test_pool_configuravel_fora_do_sqlite():
+    assert (
+        database.opcoes_engine("postgresql://u:s@localhost/chopp") == database.DB_POOL
+    )
+    assert "pool_size" not in database.opcoes_engine("sqlite:///./x.db")
+
+
+def test_leituras_continuam_durante_carga_do_etl(banco):
+    """
+    Simula a carga do ETL (uma transação longa, inserindo em lotes) enquanto
+    três leitores consultam as vendas sem parar. Com WAL os leitores nunca
+    esperam pelo escritor e enxergam o último estado confirmado.
+    """
+    linhas = _vendas(3000)
+    carregando = threading.Event()
+    terminou = threading.Event()
+    leituras, erros = [], []
+
+    def carga():
+        try:
+            with Session(banco) as sess:
+                for i in range(0, len(linhas), 300):
+                    load_to_db.inserir_vendas(sess, linhas[i : i + 300])
+                    carregando.set()
+                    time.sleep(0.05)
+                sess.commit()
+        except Exception as e:
+            erros.append(e)
+        finally:
+            carregando.set()
+            terminou.set()
+
+    def leitor():
+        carregando.wait()
+        while not terminou.is_set():
+            inicio = time.perf_counter()
+            try:
+                with Session(banco) as sess:
+                    total = sess.exec(select(func.count()).select_from(Venda)).one()
+            except Exception as e:
+                erros.append(e)
+                return
+            # Leituras concluídas antes do commit não veem a carga pela metade
+            if not terminou.is_set():
+                leituras.append((total, time.perf_counter() - inicio))
+
+    threads = [threading.Thread(target=carga)]
+    threads += [threading.Thread(target=leitor) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    assert erros == []
+    assert len(leituras) >= 10
+    assert {total for total, _ in leituras} <= {0, len(linhas)}
+    assert max(duracao for _, duracao in leituras) < 1.0
+    with Session(banco) as sess:
+        assert sess.exec(select(func.count()).select_from(Venda)).one() == len(linhas)
+
+
+def test_escritas_concorrentes_esperam_a_vez(banco):
+    """Com busy_timeout, escritores simultâneos não falham com 'database is locked'."""
+    erros = []
+
+    def escritor(n):
+        linhas = _vendas(20, inicio=date(2021 + n, 1, 1))
+        try:
+            for linha in linhas:
+                with Session(banco) as sess:
+                    load_to_db.inserir_vendas(sess, [linha])
+                    sess.commit()
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=escritor, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    assert erros == []
+    with banco.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM venda")).scalar() == 80
+
+
+def test_primeiras_vendas_simultaneas_do_dia_somam_no_resumo(banco):
+    """
+    Vendas de um dia (e mês) ainda sem resumo, registradas ao mesmo tempo:
+    o upsert cria a linha uma vez e soma as demais, sem chave duplicada.
+    """
+    erros = []
+    inicio = threading.Barrier(4)
+
+    def vendedor():
+        inicio.wait()
+        try:
+            for _ in range(10):
+                with Session(banco) as sess:
+                    venda = Venda(**_vendas(1, inicio=date(2025, 10, 4))[0])
+                    venda.hash_conteudo = None
+                    sess.add(venda)
+                    registrar_vendas_nos_resumos(sess, [venda])
+                    sess.commit()
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=vendedor) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    assert erros == []
+    with Session(banco) as sess:
+        diario = sess.exec(select(ResumoVendaDiario)).one()
+        mensal = sess.exec(select(ResumoVendaMensal)).one()
+    assert (diario.num_vendas, diario.receita) == (40, 4000.0)
+    assert (mensal.num_vendas, mensal.lucro) == (40, 1600.0)
+
+
+def test_replica_recusa_escritas(banco):
+    replica = database.criar_engine(str(banco.url), somente_leitura=True)
+    with Session(replica) as sess:
+        assert sess.exec(select(Produto.nome)).all() == ["Chopp"]
+        sess.add(Produto(nome="IPA", preco_venda_barril_fechado=700))
+        with pytest.raises(exc.OperationalError, match="readonly"):
+            sess.commit()
+    replica.dispose()
+
+
+def test_leituras_usam_o_principal_sem_replica():
+    assert database.DATABASE_READ_URL is None
+    assert database.async_read_engine is database.async_engine
@@ -1,21 +1,46 @@
 
 import sys
 import os
+import io
+import threading
+import time
 from datetime import date
+from unittest.mock import patch
+import anyio
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app.main import app
-from app.database import get_session
-from app.models import MovimentoEstoque, Produto
+from app.database import (
+    async_database_url,
+    criar_engine,
+    get_async_read_session,
+    get_async_session,
+    get_session,
+)
+from app.estoque import (
+    recalcular_saldos,
+    registrar_movimento,
+    registrar_movimentos,
+    verificar_saldos,
+)
+from app.importacao import importar_movimentos_csv
+from app.models import MovimentoEstoque, Produto, SaldoEstoque
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(
     DATABASE_URL, echo=False, connect_args={"check_same_thread": False}
 )
+# NullPool: o TestClient abre um event loop por requisição, então as conexões
+# assíncronas não podem ser reaproveitadas entre requisições.
+async_engine = create_async_engine(async_database_url(DATABASE_URL), poolclass=NullPool)
 
 
 def get_session_override():
@@ -23,7 +48,14 @@ def get_session_override():
         yield session
 
 
+async def get_async_session_override():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 app.dependency_overrides[get_session] = get_session_override
+app.dependency_overrides[get_async_session] = get_async_session_override
+app.dependency_overrides[get_async_read_session] = get_async_session_override
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -188,3 +220,533 @@ def test_get_estoque_com_vendas():
     # Estoque final: 20 - 0.5 - 2 = 17.5
     assert estoque["Weiss"]["quantidade_barris"] == 17.5
 
+
+def test_get_estoque_varios_produtos():
+    client.auth = ("admin", "admin")
+    for nome in ("Pilsen", "IPA"):
+        client.post(
+            "/produtos",
+            data={
+                "nome": nome,
+                "preco_venda_barril_fechado": 600.0,
+                "volume_litros": 30,
+                "preco_venda_litro": 20.0,
+            },
+        )
+    client.post(
+        "/estoque/entrada",
+        data={
+            "produto_id": 2,
+            "quantidade": 5,
+            "custo_unitario": 400.0,
+            "data_movimento": "2025-10-01",
+        },
+    )
+    client.post(
+        "/estoque/saida_manual",
+        data={"produto_id": 2, "quantidade": 1, "data_movimento": "2025-10-02"},
+    )
+
+    response = client.get("/estoque")
+    assert response.status_code == 200
+    estoque = response.json()
+    # Produto sem movimentos aparece com estoque zerado
+    assert list(estoque) == ["Pilsen", "IPA"]
+    assert estoque["Pilsen"]["quantidade_barris"] == 0
+    assert estoque["Pilsen"]["volume_litros_total"] == 0
+    assert estoque["IPA"]["quantidade_barris"] == 4
+    assert estoque["IPA"]["volume_litros_total"] == 120
+    assert estoque["IPA"]["preco_venda_barril_fechado"] == 600.0
+
+
+def test_saldo_atualizado_a_cada_movimento():
+    client.auth = ("admin", "admin")
+    client.post(
+        "/produtos",
+        data={
+            "nome": "Weiss",
+            "preco_venda_barril_fechado": 700.0,
+            "volume_litros": 50,
+            "preco_venda_litro": 25.0,
+        },
+    )
+    with Session(engine) as session:
+        saldo = session.get(SaldoEstoque, 1)
+        assert saldo.quantidade_barris == 0
+
+    client.post(
+        "/estoque/entrada",
+        data={
+            "produto_id": 1,
+            "quantidade": 20,
+            "custo_unitario": 350.0,
+            "data_movimento": "2025-10-01",
+        },
+    )
+    client.post(
+        "/estoque/saida_manual",
+        data={"produto_id": 1, "quantidade": 1, "data_movimento": "2025-10-02"},
+    )
+    client.post(
+        "/registrar_venda",
+        data={
+            "data": "2025-10-10",
+            "produto_id": 1,
+            "tipo_venda": "feira",
+            "total": 625.0,
+            "cartao": 625.0,
+            "dinheiro": 0.0,
+            "pix": 0.0,
+        },
+    )
+    client.post(
+        "/registrar_venda",
+        data={
+            "data": "2025-10-11",
+            "produto_id": 1,
+            "tipo_venda": "barril_festas",
+            "quantidade_barris_vendidos": 2,
+            "cartao": 1400.0,
+            "dinheiro": 0.0,
+            "pix": 0.0,
+        },
+    )
+
+    with Session(engine) as session:
+        saldo = session.get(SaldoEstoque, 1)
+        # 20 - 1 - 0.5 - 2 = 16.5
+        assert saldo.quantidade_barris == pytest.approx(16.5)
+        assert saldo.volume_litros == pytest.approx(825.0)
+        assert verificar_saldos(session) == []
+
+
+def test_movimento_produto_inexistente():
+    client.auth = ("admin", "admin")
+    response = client.post(
+        "/estoque/entrada",
+        data={
+            "produto_id": 99,
+            "quantidade": 1,
+            "custo_unitario": 400.0,
+            "data_movimento": "2025-10-01",
+        },
+    )
+    assert response.status_code == 404
+
+    with Session(engine) as session:
+        assert session.exec(select(MovimentoEstoque)).first() is None
+
+
+def test_recalcular_e_verificar_saldos():
+    with Session(engine) as session:
+        produto = Produto(
+            nome="Pilsen", preco_venda_barril_fechado=600.0, volume_litros=30
+        )
+        session.add(produto)
+        session.commit()
+        # Movimentos gravados sem passar pela tabela de saldos
+        session.add_all(
+            [
+                MovimentoEstoque(
+                    produto_id=produto.id,
+                    tipo_movimento="entrada",
+                    quantidade=10,
+                    custo_unitario=400.0,
+                    data_movimento=date(2025, 10, 1),
+                ),
+                MovimentoEstoque(
+                    produto_id=produto.id,
+                    tipo_movimento="saida_venda",
+                    quantidade=2.5,
+                    data_movimento=date(2025, 10, 2),
+                ),
+            ]
+        )
+        session.commit()
+
+        divergencias = verificar_saldos(session)
+        assert len(divergencias) == 1
+        assert divergencias[0]["quantidade_barris_esperada"] == 7.5
+
+        assert recalcular_saldos(session) == 1
+        assert verificar_saldos(session) == []
+        saldo = session.get(SaldoEstoque, produto.id)
+        assert saldo.quantidade_barris == 7.5
+        assert saldo.volume_litros == 225.0
+        assert saldo.custo_total_entradas == 4000.0
+        assert saldo.quantidade_entradas == 10
+
+
+# --- Importação de CSV ---
+
+
+def _cadastrar_produtos(*nomes):
+    client.auth = ("admin", "admin")
+    for nome in nomes:
+        client.post(
+            "/produtos",
+            data={
+                "nome": nome,
+                "preco_venda_barril_fechado": 600.0,
+                "volume_litros": 50,
+                "preco_venda_litro": 20.0,
+            },
+        )
+
+
+def test_importar_csv_entradas_com_linhas_rejeitadas():
+    _cadastrar_produtos("Pilsen", "IPA")
+    conteudo = (
+        "produto,quantidade,custo_unitario,data_movimento\n"
+        "1,5,280.00,2024-05-01\n"
+        "IPA,3,310.50,2024-05-01\n"
+        "Weiss,2,300,2024-05-01\n"
+        "\n"
+        "1,0,280,2024-05-01\n"
+        "2,4,,2024-05-02\n"
+        "ipa,2,320,02/05/2024\n"
+        "1,1,280,2024-13-01\n"
+    )
+    response = client.post(
+        "/estoque/importar",
+        files={"arquivo": ("nota.csv", conteudo, "text/csv")},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "linhas": 7,
+        "importadas": 3,
+        "rejeitadas_total": 4,
+        "rejeitadas": [
+            {"linha": 4, "erro": "Produto não encontrado: 'Weiss'"},
+            {
+                "linha": 6,
+                "erro": "Quantidade deve ser um número inteiro maior que zero.",
+            },
+            {"linha": 7, "erro": "Custo unitário inválido ou ausente: ''"},
+            {"linha": 9, "erro": "Data inválida: '2024-13-01'"},
+        ],
+    }
+    with Session(engine) as session:
+        assert session.get(SaldoEstoque, 1).quantidade_barris == 5
+        saldo_ipa = session.get(SaldoEstoque, 2)
+        assert saldo_ipa.quantidade_barris == 5
+        assert saldo_ipa.custo_total_entradas == 3 * 310.5 + 2 * 320
+        assert verificar_saldos(session) == []
+
+
+def test_importar_csv_ponto_e_virgula_e_saidas():
+    _cadastrar_produtos("Pilsen")
+    client.post(
+        "/estoque/entrada",
+        data={
+            "produto_id": 1,
+            "quantidade": 10,
+            "custo_unitario": 280.0,
+            "data_movimento": "2024-05-01",
+        },
+    )
+    conteudo = (
+        "Produto;Quantidade;Custo_Unitario;Data_Movimento;Tipo_Movimento\n"
+        "Pilsen;2;;03/05/2024;\n"
+        "Pilsen;1;1.285,50;04/05/2024;entrada\n"
+        "Pilsen;1;;05/05/2024;devolucao\n"
+    )
+    response = client.post(
+        "/estoque/importar",
+        data={"tipo_movimento": "saida_manual"},
+        files={"arquivo": ("baixas.csv", conteudo.encode("utf-8-sig"), "text/csv")},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["importadas"] == 2
+    assert response.json()["rejeitadas"] == [
+        {"linha": 4, "erro": "Tipo de movimento inválido: 'devolucao'"}
+    ]
+    with Session(engine) as session:
+        movimentos = session.exec(
+            select(MovimentoEstoque).order_by(MovimentoEstoque.id)
+        ).all()
+        assert [
+            (m.tipo_movimento, m.quantidade, m.custo_unitario) for m in movimentos
+        ] == [
+            ("entrada", 10, 280.0),
+            ("saida_manual", 2, None),
+            ("entrada", 1, 1285.5),
+        ]
+        assert session.get(SaldoEstoque, 1).quantidade_barris == 9
+
+
+def test_importar_csv_em_varios_lotes():
+    """O resultado não depende do tamanho do lote."""
+    _cadastrar_produtos("Pilsen", "IPA")
+    linhas = ["produto,quantidade,custo_unitario,data_movimento"]
+    linhas += [f"{i % 3 + 1},{i % 4 + 1},{250 + i},2024-05-01" for i in range(25)]
+
+    with Session(engine) as session:
+        resultado = importar_movimentos_csv(
+            session, io.StringIO("\n".join(linhas)), tamanho_lote=4
+        )
+        session.commit()
+
+        assert resultado["importadas"] == 17
+        assert resultado["rejeitadas_total"] == 8
+        assert all(
+            r["erro"] == "Produto não encontrado: '3'" for r in resultado["rejeitadas"]
+        )
+        assert verificar_saldos(session) == []
+
+
+def test_importar_csv_cabecalho_invalido():
+    _cadastrar_produtos("Pilsen")
+    response = client.post(
+        "/estoque/importar",
+        files={"arquivo": ("nota.csv", "produto,qtd\n1,2\n", "text/csv")},
+    )
+    assert response.status_code == 400
+    assert "data_movimento, quantidade" in response.json()["detail"]
+
+
+def test_lote_nao_sobrescreve_movimento_concorrente(tmp_path):
+    """
+    Um lote (`registrar_movimentos`) e movimentos avulsos gravados ao mesmo
+    tempo, em conexões diferentes: nenhuma atualização de saldo se perde.
+    """
+    banco = criar_engine(f"sqlite:///{tmp_path / 'concorrencia.db'}")
+    SQLModel.metadata.create_all(banco)
+    with Session(banco) as session:
+        produto = Produto(nome="Pilsen", preco_venda_barril_fechado=600.0)
+        session.add(produto)
+        session.flush()
+        registrar_movimento(
+            session,
+            MovimentoEstoque(
+                produto_id=produto.id,
+                tipo_movimento="entrada",
+                quantidade=100,
+                custo_unitario=400.0,
+                data_movimento=date(2025, 10, 1),
+            ),
+            produto,
+        )
+        session.commit()
+        session.refresh(produto)
+        produtos = {produto.id: produto}
+
+    def movimento(tipo):
+        return MovimentoEstoque(
+            produto_id=produto.id,
+            tipo_movimento=tipo,
+            quantidade=1,
+            custo_unitario=400.0 if tipo == "entrada" else None,
+            data_movimento=date(2025, 10, 2),
+        )
+
+    erros = []
+    inicio = threading.Barrier(2)
+
+    def lotes():
+        inicio.wait()
+        try:
+            for _ in range(30):
+                with Session(banco) as session:
+                    registrar_movimentos(
+                        session,
+                        [movimento("saida_manual"), movimento("saida_manual")],
+                        produtos,
+                    )
+                    session.commit()
+        except Exception as e:
+            erros.append(e)
+
+    def avulsos():
+        inicio.wait()
+        try:
+            for _ in range(30):
+                with Session(banco) as session:
+                    registrar_movimento(session, movimento("entrada"), produto)
+                    session.commit()
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=lotes), threading.Thread(target=avulsos)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    assert erros == []
+    with Session(banco) as session:
+        saldo = session.get(SaldoEstoque, produto.id)
+        # 100 + 30 entradas - 60 saídas
+        assert saldo.quantidade_barris == 70
+        assert saldo.quantidade_entradas == 130
+        assert verificar_saldos(session) == []
+    banco.dispose()
+
+
+def test_primeiros_movimentos_simultaneos_criam_um_saldo(tmp_path):
+    """
+    Produto sem linha de saldo (cadastrado antes da tabela existir) recebendo
+    movimentos avulsos e em lote ao mesmo tempo: o saldo é criado uma vez, a
+    partir do histórico, e os demais movimentos somam nele.
+    """
+    banco = criar_engine(f"sqlite:///{tmp_path / 'sem_saldo.db'}")
+    SQLModel.metadata.create_all(banco)
+    with Session(banco) as session:
+        produto = Produto(nome="Pilsen", preco_venda_barril_fechado=600.0)
+        session.add(produto)
+        session.commit()
+        session.refresh(produto)
+
+    def entrada():
+        return MovimentoEstoque(
+            produto_id=produto.id,
+            tipo_movimento="entrada",
+            quantidade=1,
+            custo_unitario=400.0,
+            data_movimento=date(2025, 10, 2),
+        )
+
+    erros = []
+    inicio = threading.Barrier(4)
+
+    def escritor(em_lote):
+        inicio.wait()
+        try:
+            for _ in range(10):
+                with Session(banco) as session:
+                    if em_lote:
+                        registrar_movimentos(
+                            session, [entrada(), entrada()], {produto.id: produto}
+                        )
+                    else:
+                        registrar_movimento(session, entrada(), produto)
+                    session.commit()
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=escritor, args=(n % 2,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    assert erros == []
+    with Session(banco) as session:
+        saldo = session.get(SaldoEstoque, produto.id)
+        # 2 escritores avulsos x 10 + 2 em lote x 10 x 2
+        assert saldo.quantidade_barris == 60
+        assert saldo.custo_total_entradas == 60 * 400.0
+        assert verificar_saldos(session) == []
+    banco.dispose()
+
+
+def test_lote_vazio_nao_grava_movimentos():
+    with Session(engine) as session:
+        registrar_movimentos(session, [], {})
+        session.commit()
+        assert session.exec(select(MovimentoEstoque)).all() == []
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_importacao_nao_bloqueia_outras_requisicoes():
+    """Enquanto um CSV grande é importado, as outras requisições são atendidas."""
+    terminou = {}
+
+    def importacao_lenta(sess, arquivo, tipo_padrao):
+        time.sleep(0.5)
+        terminou["importacao"] = time.perf_counter()
+        return {"linhas": 0, "importadas": 0, "rejeitadas_total": 0, "rejeitadas": []}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://test",
+        auth=("admin", "admin"),
+    ) as cliente:
+
+        async def importar():
+            response = await cliente.post(
+                "/estoque/importar",
+                files={"arquivo": ("nota.csv", "produto\n", "text/csv")},
+            )
+            assert response.status_code == 200
+
+        async def consultar():
+            await anyio.sleep(0.1)
+            response = await cliente.get("/relatorios/cache")
+            assert response.status_code == 200
+            terminou["consulta"] = time.perf_counter()
+
+        with patch("app.main.importar_movimentos_csv", importacao_lenta):
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(importar)
+                tg.start_soon(consultar)
+
+    assert terminou["consulta"] < terminou["importacao"]
+
+
+# --- Orçamento de comandos SQL ---
+
+
+def _importar_csv():
+    return client.post(
+        "/estoque/importar",
+        files={
+            "arquivo": (
+                "nota.csv",
+                "produto,quantidade,custo_unitario,data_movimento\n"
+                "1,5,280.00,2024-05-01\n"
+                "Chopp 1,3,310.50,2024-05-01\n",
+                "text/csv",
+            )
+        },
+    )
+
+
+# Endpoint -> (requisição, máximo de comandos SQL), independente do catálogo
+ORCAMENTOS_SQL = {
+    "GET /estoque": (lambda: client.get("/estoque"), 1),
+    "POST /estoque/entrada": (
+        lambda: client.post(
+            "/estoque/entrada",
+            data={
+                "produto_id": 1,
+                "quantidade": 2,
+                "custo_unitario": 400.0,
+                "data_movimento": "2025-10-05",
+            },
+        ),
+        4,
+    ),
+    "POST /estoque/saida_manual": (
+        lambda: client.post(
+            "/estoque/saida_manual",
+            data={"produto_id": 1, "quantidade": 1, "data_movimento": "2025-10-06"},
+        ),
+        4,
+    ),
+    "POST /estoque/importar": (_importar_csv, 4),
+}
+
+
+@pytest.mark.parametrize("endpoint", ORCAMENTOS_SQL)
+def test_orcamento_sql_constante_com_o_catalogo(
+    endpoint, limite_sql, completar_catalogo
+):
+    requisicao, maximo = ORCAMENTOS_SQL[endpoint]
+    client.auth = ("admin", "admin")
+    contagens = []
+    for produtos in (1, 10, 100):
+        completar_catalogo(engine, produtos)
+        with limite_sql(maximo, engine, async_engine) as comandos:
+            response = requisicao()
+        assert response.status_code == 200, response.text
+        contagens.append(len(comandos))
+    # Sem N+1: a quantidade de comandos não cresce com o número de produtos
+    assert contagens == [contagens[0]] * 3
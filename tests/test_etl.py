@@ -0,0 +1,464 @@
+import json
+import pstats
+import sys
+import os
+import random
+from datetime import date, timedelta
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from hypothesis import given, strategies as st
+from sqlalchemy import exc
+from sqlmodel import Session, SQLModel, create_engine, select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import etl.load_to_db as load_to_db
+import run_etl
+from etl import master, origem
+import etl.clean_data as clean_data
+from etl.clean_data import parse_num, parse_num_series
+from app.models import Produto, ResumoVendaDiario, Venda
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+engine = create_engine(
+    DATABASE_URL, echo=False, connect_args={"check_same_thread": False}
+)
+
+
+@pytest.fixture(scope="function", autouse=True)
+def setup_database():
+    """Cria e limpa o banco de dados para cada função de teste."""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(
+            Produto(
+                nome=load_to_db.ETL_PRODUCT_NAME,
+                preco_venda_barril_fechado=600.0,
+                preco_venda_litro=20.0,
+            )
+        )
+        session.commit()
+    yield
+    SQLModel.metadata.drop_all(engine)
+
+
+def _gravar_master(df: pd.DataFrame, caminho):
+    """Grava o master pelo mesmo caminho que o clean_master usa."""
+    with master.EscritorMaster(caminho) as escritor:
+        escritor.escrever_tabela(master.para_tabela(df))
+
+
+@pytest.fixture
+def master_parquet(tmp_path, monkeypatch):
+    """Gera um master.parquet no formato produzido por clean_master."""
+    rnd = random.Random(7)
+    dias = [date(2024, 1, 1) + timedelta(days=i) for i in range(45)]
+    df = pd.DataFrame(
+        {
+            "data": dias,
+            "dia_da_semana": [d.strftime("%A") for d in dias],
+            "total": [round(rnd.uniform(100, 2000), 2) for _ in dias],
+            "cartao": [round(rnd.uniform(0, 1000), 2) for _ in dias],
+            "dinheiro": [rnd.uniform(0, 500) for _ in dias],
+            "pix": [0.1 * i for i in range(len(dias))],
+            "lucro": [rnd.uniform(-50, 900) for _ in dias],
+            "custo_func": [80.0] * len(dias),
+            "custo_copos": [12.5] * len(dias),
+            "custo_boleto": [0.0] * len(dias),
+            "observacoes": [
+                "chuva\tforte" if i % 7 == 0 else None for i in range(len(dias))
+            ],
+            "coluna_extra": ["ignorada"] * len(dias),
+        }
+    )
+    caminho = tmp_path / "master.parquet"
+    _gravar_master(df, caminho)
+    monkeypatch.setattr(load_to_db, "MASTER_PARQUET", caminho)
+    return caminho
+
+
+def _carregar_linha_a_linha(caminho, product_id):
+    """Carga original (iterrows + um objeto Venda por linha), como referência."""
+    df = master.ler_master(caminho)
+    with Session(engine) as sess:
+        for _, row in df.iterrows():
+            sess.add(
+                Venda(
+                    data=row["data"],
+                    dia_semana=row.get("dia_da_semana"),
+                    tipo_venda="feira",
+                    total=row.get("total", 0.0),
+                    cartao=row.get("cartao", 0.0),
+                    dinheiro=row.get("dinheiro", 0.0),
+                    pix=row.get("pix", 0.0),
+                    custo_func=row.get("custo_func", 0.0),
+                    custo_copos=row.get("custo_copos", 0.0),
+                    custo_boleto=row.get("custo_boleto", 0.0),
+                    lucro=row.get("lucro", 0.0),
+                    observacoes=None
+                    if pd.isna(row.get("observacoes"))
+                    else row.get("observacoes"),
+                    produto_id=product_id,
+                )
+            )
+        sess.commit()
+
+
+def _vendas():
+    with Session(engine) as sess:
+        return [
+            venda.model_dump(exclude={"id", "hash_conteudo"})
+            for venda in sess.exec(select(Venda).order_by(Venda.id)).all()
+        ]
+
+
+@pytest.mark.parametrize("tamanho_lote", [1, 7, 1000])
+def test_load_em_lote_igual_a_carga_linha_a_linha(
+    master_parquet, monkeypatch, tamanho_lote
+):
+    _carregar_linha_a_linha(master_parquet, 1)
+    esperado = _vendas()
+    assert len(esperado) == 45
+
+    monkeypatch.setattr(load_to_db, "ETL_CHUNK_SIZE", tamanho_lote)
+    load_to_db.load()
+
+    assert _vendas() == esperado
+    with Session(engine) as sess:
+        assert len(sess.exec(select(ResumoVendaDiario)).all()) == 45
+
+
+def test_valor_copy_escapa_caracteres_especiais():
+    assert load_to_db._valor_copy(None) == "\\N"
+    assert load_to_db._valor_copy(0.1) == "0.1"
+    assert load_to_db._valor_copy(date(2024, 5, 1)) == "2024-05-01"
+    assert load_to_db._valor_copy("a\tb\\c\nd") == "a\\tb\\\\c\\nd"
+
+
+def _ids_e_hashes():
+    with Session(engine) as sess:
+        return {
+            (venda.data, venda.ordem_no_dia): (venda.id, venda.hash_conteudo)
+            for venda in sess.exec(select(Venda)).all()
+        }
+
+
+def test_load_incremental_insere_atualiza_e_ignora(master_parquet, monkeypatch):
+    _carregar_linha_a_linha(master_parquet, 1)
+    # Primeira carga: as vendas sem hash são substituídas por vendas com hash
+    contagens = load_to_db.load()
+    assert contagens == {
+        "inseridas": 45,
+        "atualizadas": 0,
+        "inalteradas": 0,
+        "removidas": 45,
+    }
+    antes = _ids_e_hashes()
+
+    # Nada mudou: nenhuma escrita e nenhum resumo recalculado
+    chamadas = []
+    monkeypatch.setattr(
+        load_to_db, "recalcular_resumos", lambda sess, datas: chamadas.append(datas)
+    )
+    assert load_to_db.load()["inalteradas"] == 45
+    assert _ids_e_hashes() == antes
+    assert chamadas == []
+    monkeypatch.undo()
+    monkeypatch.setattr(load_to_db, "MASTER_PARQUET", master_parquet)
+
+    # Um dia alterado e um dia novo
+    df = master.ler_master(master_parquet)
+    df.loc[3, "total"] = 1234.5
+    novo = df.iloc[[0]].assign(data=date(2024, 3, 1), total=99.0)
+    _gravar_master(pd.concat([df, novo]), master_parquet)
+
+    assert load_to_db.load() == {
+        "inseridas": 1,
+        "atualizadas": 1,
+        "inalteradas": 44,
+        "removidas": 0,
+    }
+    depois = _ids_e_hashes()
+    assert len(depois) == 46
+    alterados = {d for d in antes if depois[d] != antes[d]}
+    assert alterados == {(date(2024, 1, 4), 0)}
+    # As vendas atualizadas mantêm o id
+    assert all(depois[d][0] == antes[d][0] for d in antes)
+    with Session(engine) as sess:
+        receitas = {
+            resumo.data: resumo.receita
+            for resumo in sess.exec(select(ResumoVendaDiario)).all()
+        }
+        assert receitas[date(2024, 1, 4)] == 1234.5
+        assert receitas[date(2024, 3, 1)] == 99.0
+
+
+def test_load_mantem_todas_as_linhas_de_uma_data_repetida(master_parquet):
+    load_to_db.load()
+    antes = _ids_e_hashes()
+
+    # Duas vendas a mais no dia 11: nenhuma linha da planilha se perde
+    df = master.ler_master(master_parquet)
+    repetidas = df.iloc[[10, 10]].assign(total=[50.0, 25.0])
+    _gravar_master(pd.concat([df, repetidas]), master_parquet)
+    assert load_to_db.load() == {
+        "inseridas": 2,
+        "atualizadas": 0,
+        "inalteradas": 45,
+        "removidas": 0,
+    }
+    dia = date(2024, 1, 11)
+    with Session(engine) as sess:
+        totais = sess.exec(select(Venda.total).where(Venda.data == dia)).all()
+        resumo = sess.exec(
+            select(ResumoVendaDiario).where(ResumoVendaDiario.data == dia)
+        ).one()
+    assert sorted(totais) == sorted([df.loc[10, "total"], 50.0, 25.0])
+    assert resumo.receita == pytest.approx(sum(totais))
+    assert resumo.num_vendas == 3
+    assert _ids_e_hashes()[(dia, 0)] == antes[(dia, 0)]
+
+    # A última linha do dia sai da planilha: a venda correspondente é apagada
+    _gravar_master(pd.concat([df, repetidas.iloc[[0]]]), master_parquet)
+    assert load_to_db.load() == {
+        "inseridas": 0,
+        "atualizadas": 0,
+        "inalteradas": 46,
+        "removidas": 1,
+    }
+    assert (dia, 2) not in _ids_e_hashes()
+    assert len(_ids_e_hashes()) == 46
+
+
+def test_chave_natural_impede_venda_etl_duplicada(master_parquet):
+    load_to_db.load()
+    with Session(engine) as sess:
+        venda = sess.exec(select(Venda)).first()
+        duplicada = venda.model_dump(exclude={"id"})
+        sess.add(Venda(**duplicada))
+        with pytest.raises(exc.IntegrityError):
+            sess.commit()
+        sess.rollback()
+        # Vendas do formulário (sem hash) continuam podendo repetir o dia
+        duplicada["hash_conteudo"] = None
+        sess.add(Venda(**duplicada))
+        sess.commit()
+
+
+def _formato_brasileiro(valor: float) -> str:
+    return f"{valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+celulas = st.one_of(
+    st.none(),
+    st.floats(),
+    st.integers(min_value=-(10**15), max_value=10**15),
+    st.booleans(),
+    st.floats(allow_nan=False, allow_infinity=False).map(_formato_brasileiro),
+    st.floats(allow_nan=False).map(str),
+    st.text(alphabet="0123456789.,-+eE _", max_size=12),
+    st.text(max_size=6),
+    st.sampled_from(["", " ", "nan", "-inf", "1_000", "٣", "R$ 10", date(2024, 1, 1)]),
+)
+
+
+@given(st.lists(celulas, max_size=40))
+def test_parse_num_series_igual_a_parse_num(valores):
+    serie = pd.Series(valores, dtype=object)
+    esperado = np.array([parse_num(v) for v in valores], dtype=float)
+    assert np.array_equal(parse_num_series(serie).to_numpy(), esperado, equal_nan=True)
+
+
+@given(st.lists(st.one_of(st.floats(), st.integers(-(10**9), 10**9)), max_size=40))
+def test_parse_num_series_colunas_numericas(valores):
+    serie = pd.Series(valores)
+    esperado = np.array([parse_num(v) for v in serie], dtype=float)
+    assert np.array_equal(parse_num_series(serie).to_numpy(), esperado, equal_nan=True)
+
+
+def _planilha(caminho, linhas_por_aba=3):
+    """Planilha no formato do Sheets: abas registros_* e uma aba ignorada."""
+    abas = {}
+    for ano in (2023, 2024):
+        abas[f"Registros_{ano}"] = pd.DataFrame(
+            {
+                "Data": [f"{d + 1:02d}/03/{ano}" for d in range(linhas_por_aba)],
+                "Dia da Semana": ["Sexta"] * linhas_por_aba,
+                "Vendas Total Feira": ["1.234,50"] + [300.0] * (linhas_por_aba - 1),
+                "Cartão Feira": [100.0] * linhas_por_aba,
+                "Dinheiro Feira": ["50,25"] * linhas_por_aba,
+                "Pix Feira": [None] * linhas_por_aba,
+                "Lucro Feira": [80.0] * linhas_por_aba,
+                "Boleto Klaro": [0.0] * linhas_por_aba,
+                "Custo Funcionários": [40.0] * linhas_por_aba,
+                "Custo Copos": [10.0] * linhas_por_aba,
+                "Observações": [None] * linhas_por_aba,
+            }
+        )
+    abas["Resumo"] = pd.DataFrame({"x": [1, 2]})
+    with pd.ExcelWriter(caminho) as writer:
+        for nome, df in abas.items():
+            df.to_excel(writer, sheet_name=nome, index=False)
+
+
+def test_clean_master_grava_parquet_tipado(tmp_path, monkeypatch):
+    planilha = tmp_path / "planilha.xlsx"
+    _planilha(planilha)
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", str(planilha))
+
+    clean_data.clean_master(
+        tmp_path / "master.parquet", debug_csv=tmp_path / "master.csv"
+    )
+
+    assert pq.read_schema(tmp_path / "master.parquet") == master.SCHEMA_MASTER
+    df = master.ler_master(tmp_path / "master.parquet")
+    assert len(df) == 6
+    assert df["data"].iloc[0] == date(2023, 3, 1)
+    assert df["total"].tolist()[:3] == [1234.5, 300.0, 300.0]
+    assert df["dinheiro"].iloc[0] == 50.25
+    assert df["pix"].tolist() == [0.0] * 6
+    # Coluna de texto toda vazia continua texto (no CSV voltava como float)
+    assert df["observacoes"].isna().all()
+    assert pq.read_schema(tmp_path / "master.parquet").field("observacoes").type == (
+        pa.string()
+    )
+    assert (tmp_path / "master.csv").exists()
+
+
+def _clean_master_read_excel(caminho) -> pd.DataFrame:
+    """Limpeza original (pd.read_excel de todas as abas), como referência."""
+    dfs = []
+    for aba, df in pd.read_excel(caminho, sheet_name=None).items():
+        if not aba.lower().startswith("registros_"):
+            continue
+        df.columns = clean_data.normalizar_colunas(df.columns)
+        dfs.append(df.rename(columns=clean_data.RENOMEAR_COLUNAS))
+    df = pd.concat(dfs, ignore_index=True)
+    df["data"] = pd.to_datetime(df["data"], dayfirst=True, errors="coerce")
+    df = df.dropna(subset=["data"])
+    for col in master.COLUNAS_NUMERICAS:
+        df[col] = df[col].apply(parse_num)
+    return master.para_tabela(df).to_pandas()
+
+
+@pytest.mark.parametrize("linhas_por_bloco, workers", [(2, 1), (5000, 1), (2, 3)])
+def test_clean_master_streaming_igual_ao_read_excel(
+    tmp_path, monkeypatch, linhas_por_bloco, workers
+):
+    planilha = tmp_path / "planilha.xlsx"
+    _planilha(planilha, linhas_por_aba=7)
+    # Células vazias, textos "vazios", linha em branco e data inválida
+    wb = openpyxl.load_workbook(planilha)
+    aba = wb["Registros_2024"]
+    aba["E3"] = "N/A"
+    aba["K4"] = "NA"
+    aba["K5"] = "chuva"
+    aba["C6"] = None
+    aba["A7"] = "sem data"
+    aba.append([None] * 11)
+    aba.append(["20/03/2024", "Quarta", "2.000,00", 1, 2, 3, 4, 5, 6, 7, "fim"])
+    wb.save(planilha)
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", str(planilha))
+
+    resumo = clean_data.clean_master(
+        tmp_path / "master.parquet",
+        debug_csv=None,
+        linhas_por_bloco=linhas_por_bloco,
+        workers=workers,
+    )
+
+    obtido = master.ler_master(tmp_path / "master.parquet")
+    pd.testing.assert_frame_equal(obtido, _clean_master_read_excel(planilha))
+    assert len(obtido) == 14
+    # Uma entrada por aba, na ordem da planilha, qualquer que seja o paralelismo
+    assert resumo["workers"] == min(workers, 2)
+    assert [(aba["aba"], aba["linhas"]) for aba in resumo["abas"]] == [
+        ("Registros_2023", 7),
+        ("Registros_2024", 7),
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_clean_master_abas_com_colunas_diferentes(tmp_path, monkeypatch, workers):
+    planilha = tmp_path / "planilha.xlsx"
+    _planilha(planilha, linhas_por_aba=4)
+    # A aba de 2023 não tem "Custo Copos" nem "Observações"
+    wb = openpyxl.load_workbook(planilha)
+    wb["Registros_2023"].delete_cols(10, 2)
+    wb.save(planilha)
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", str(planilha))
+
+    clean_data.clean_master(
+        tmp_path / "master.parquet", debug_csv=None, workers=workers
+    )
+
+    obtido = master.ler_master(tmp_path / "master.parquet")
+    pd.testing.assert_frame_equal(obtido, _clean_master_read_excel(planilha))
+    assert obtido["custo_copos"].tolist() == [0.0] * 4 + [10.0] * 4
+
+
+def test_master_descarta_colunas_extras_e_mantem_tipos(tmp_path):
+    df = pd.DataFrame(
+        {
+            "data": pd.to_datetime(["2024-01-02", "2024-01-03"]),
+            "dia_da_semana": ["Terça", None],
+            **{coluna: [1, 2] for coluna in master.COLUNAS_NUMERICAS},
+            "observacoes": pd.Series([123, None], dtype=object),
+            "extra": ["x", "y"],
+        }
+    )
+    _gravar_master(df, tmp_path / "m.parquet")
+    lido = master.ler_master(tmp_path / "m.parquet")
+    assert list(lido.columns) == master.SCHEMA_MASTER.names
+    assert lido["data"].tolist() == [date(2024, 1, 2), date(2024, 1, 3)]
+    assert lido["observacoes"].iloc[0] == "123"
+    assert lido["total"].dtype == np.float64
+
+
+def test_run_etl_grava_relatorio_e_perfil(tmp_path, monkeypatch):
+    planilha = tmp_path / "planilha.xlsx"
+    _planilha(planilha, linhas_por_aba=5)
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", str(planilha))
+    monkeypatch.setattr(origem, "ETL_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(load_to_db, "MASTER_PARQUET", tmp_path / "master.parquet")
+    relatorio, perfil = tmp_path / "relatorio.json", tmp_path / "etl.prof"
+
+    assert run_etl.main(["--relatorio", str(relatorio), "--profile", str(perfil)]) == 0
+
+    dados = json.loads(relatorio.read_text())
+    assert dados["situacao"] == "concluida"
+    etapas = {e["etapa"]: e for e in dados["etapas"]}
+    assert list(etapas)[:3] == [
+        "download",
+        "clean_master",
+        "clean_master.abrir_planilha",
+    ]
+    for e in dados["etapas"]:
+        assert {"segundos", "comandos_sql", "pico_rss_mb"} <= e.keys()
+    assert etapas["clean_master"]["linhas"] == 10
+    assert etapas["clean_master"]["comandos_sql"] == 0
+    assert [a["aba"] for a in etapas["clean_master.limpeza"]["abas"]] == [
+        "Registros_2023",
+        "Registros_2024",
+    ]
+    assert etapas["load.ler_master"]["linhas"] == 10
+    assert etapas["load.inserir"]["linhas"] == 10
+    assert etapas["load"]["inseridas"] == 10
+    assert etapas["load.inserir"]["comandos_sql"] >= 1
+    # A etapa externa inclui os comandos das internas
+    assert etapas["load"]["comandos_sql"] >= sum(
+        e["comandos_sql"] for nome, e in etapas.items() if nome.startswith("load.")
+    )
+    assert dados["comandos_sql"] >= etapas["load"]["comandos_sql"]
+    assert pstats.Stats(str(perfil)).total_calls > 0
+
+    # Segunda execução: planilha inalterada, só a consulta da última carga
+    assert run_etl.main(["--relatorio", str(relatorio)]) == 0
+    dados = json.loads(relatorio.read_text())
+    assert dados["situacao"] == "inalterada"
+    assert dados["comandos_sql"] == 1
+    assert [e["etapa"] for e in dados["etapas"]] == ["download"]
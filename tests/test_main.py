@@ -1,23 +1,59 @@
 import sys
 import os
-from datetime import date
+import random
+import sqlite3
+from datetime import date, timedelta
 from unittest.mock import patch
+import anyio
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Adiciona o diretório raiz do projeto ao path para permitir importações de 'app'
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app.main import app, calculate_report_metrics
-from app.database import get_session
-from app.models import MovimentoEstoque, Venda
+from app import metricas
+from app.cache import report_cache
+from app.main import (
+    app,
+    calculate_report_metrics,
+    get_dias_movimento,
+    get_report_data,
+    responder_comando,
+    rotulo_comando,
+)
+from app.mensagens import EnviadorLocal, FilaRespostas
+from app.database import (
+    async_database_url,
+    criar_async_engine,
+    get_async_read_session,
+    get_async_session,
+    get_session,
+)
+from app.models import (
+    MovimentoEstoque,
+    Produto,
+    ResumoVendaDiario,
+    ResumoVendaMensal,
+    SaldoEstoque,
+    Venda,
+)
+from app.resumos import recalcular_resumos
 
 # --- Configuração do Banco de Dados de Teste ---
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(
     DATABASE_URL, echo=False, connect_args={"check_same_thread": False}
 )
+# NullPool: o TestClient abre um event loop por requisição, então as conexões
+# assíncronas não podem ser reaproveitadas entre requisições.
+async_engine = create_async_engine(async_database_url(DATABASE_URL), poolclass=NullPool)
 
 
 def get_session_override():
@@ -25,13 +61,21 @@ def get_session_override():
         yield session
 
 
+async def get_async_session_override():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 app.dependency_overrides[get_session] = get_session_override
+app.dependency_overrides[get_async_session] = get_async_session_override
+app.dependency_overrides[get_async_read_session] = get_async_session_override
 
 
 @pytest.fixture(scope="function", autouse=True)
 def setup_database():
     """Cria e limpa o banco de dados para cada função de teste."""
     SQLModel.metadata.create_all(engine)
+    report_cache.clear()
     yield
     SQLModel.metadata.drop_all(engine)
 
@@ -449,3 +493,793 @@ def test_get_root_unauthorized():
     client.auth = ("wrong_user", "wrong_password")
     response = client.get("/")
     assert response.status_code == 401
+
+
+def test_get_root_etag_e_304():
+    client.auth = ("admin", "admin")
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "Registrar Nova Venda" in response.text
+    assert "content-encoding" not in response.headers
+    etag = response.headers["etag"]
+
+    response = client.get(
+        "/", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_get_root_variantes_comprimidas():
+    client.auth = ("admin", "admin")
+    original = client.get("/", headers={"Accept-Encoding": "identity"}).text
+    etags = set()
+    for codificacao in ("gzip", "br"):
+        response = client.get("/", headers={"Accept-Encoding": codificacao})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == codificacao
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(original.encode())
+        assert response.text == original
+        etags.add(response.headers["etag"])
+    assert len(etags) == 2
+
+
+def test_get_root_renderiza_produtos_e_estoque():
+    """A primeira exibição já traz produtos e estoque, sem chamadas extras."""
+    client.auth = ("admin", "admin")
+    vazio = client.get("/")
+    # A mensagem também aparece no script de atualização
+    assert vazio.text.count("<p>Nenhum item em estoque") == 2
+
+    client.post(
+        "/produtos",
+        data={"nome": "Pilsen <Especial>", "preco_venda_barril_fechado": 500.0},
+    )
+    client.post(
+        "/estoque/entrada",
+        data={
+            "produto_id": 1,
+            "quantidade": 3,
+            "custo_unitario": 280.0,
+            "data_movimento": "2024-05-01",
+        },
+    )
+
+    response = client.get("/", headers={"If-None-Match": vazio.headers["etag"]})
+    assert response.status_code == 200
+    html = response.text
+    # Uma opção em cada um dos três formulários, com o nome escapado
+    assert html.count('<option value="1">Pilsen &lt;Especial&gt;</option>') == 3
+    assert "<tr><td>Pilsen &lt;Especial&gt;</td><td>3</td><td>150</td></tr>" in html
+    assert html.count("<p>Nenhum item em estoque") == 1
+
+
+def test_registrar_venda_barril_festas_custo_medio_ponderado():
+    client.auth = ("admin", "admin")
+    client.post(
+        "/produtos",
+        data={
+            "nome": "IPA",
+            "preco_venda_barril_fechado": 750.0,
+            "volume_litros": 50,
+            "preco_venda_litro": 22.0,
+        },
+    )
+    entradas = [(3, 333.33), (7, 401.17), (1, 299.99)]
+    for quantidade, custo in entradas:
+        client.post(
+            "/estoque/entrada",
+            data={
+                "produto_id": 1,
+                "quantidade": quantidade,
+                "custo_unitario": custo,
+                "data_movimento": "2025-10-01",
+            },
+        )
+
+    response = client.post(
+        "/registrar_venda",
+        data={
+            "data": "2025-10-12",
+            "produto_id": 1,
+            "tipo_venda": "barril_festas",
+            "quantidade_barris_vendidos": 1.5,
+            "cartao": 1125.0,
+            "dinheiro": 0.0,
+            "pix": 0.0,
+        },
+    )
+    assert response.status_code == 200
+
+    # Mesmo cálculo feito antes, varrendo todas as entradas do produto
+    custo_medio = sum(q * c for q, c in entradas) / sum(q for q, _ in entradas)
+    with Session(engine) as session:
+        venda = session.exec(select(Venda)).one()
+        assert venda.lucro == 1.5 * 750.0 - 1.5 * custo_medio
+
+        movimento = session.exec(
+            select(MovimentoEstoque).where(
+                MovimentoEstoque.tipo_movimento == "saida_venda_barril"
+            )
+        ).one()
+        assert movimento.custo_unitario == custo_medio
+
+
+def _registrar_vendas_feira(vendas):
+    client.auth = ("admin", "admin")
+    client.post(
+        "/produtos",
+        data={
+            "nome": "Pilsen",
+            "preco_venda_barril_fechado": 600.0,
+            "volume_litros": 50,
+            "preco_venda_litro": 20.0,
+        },
+    )
+    for data, total, custo_func, custo_copos in vendas:
+        response = client.post(
+            "/registrar_venda",
+            data={
+                "data": data,
+                "produto_id": 1,
+                "tipo_venda": "feira",
+                "total": total,
+                "cartao": total,
+                "dinheiro": 0.0,
+                "pix": 0.0,
+                "custo_func": custo_func,
+                "custo_copos": custo_copos,
+                "custo_boleto": 1.5,
+            },
+        )
+        assert response.status_code == 200
+
+
+def test_relatorio_lido_dos_resumos():
+    _registrar_vendas_feira(
+        [
+            ("2025-10-04", 1000.10, 100.0, 20.0),  # sábado
+            ("2025-10-04", 250.25, 0.0, 5.0),
+            ("2025-10-10", 730.0, 80.0, 15.0),  # sexta
+            ("2025-11-01", 410.0, 50.0, 10.0),
+        ]
+    )
+
+    with Session(engine) as session:
+        # Um dia com duas vendas ocupa uma única linha de resumo
+        assert len(session.exec(select(ResumoVendaDiario)).all()) == 3
+        assert len(session.exec(select(ResumoVendaMensal)).all()) == 2
+
+        vendas_outubro = session.exec(
+            select(Venda).where(
+                Venda.data >= date(2025, 10, 1), Venda.data < date(2025, 11, 1)
+            )
+        ).all()
+        todas_vendas = session.exec(select(Venda)).all()
+
+        assert get_report_data(
+            date(2025, 10, 1), date(2025, 11, 1), session
+        ) == calculate_report_metrics(vendas_outubro)
+        assert get_report_data(
+            date(2025, 1, 1), date(2026, 1, 1), session
+        ) == calculate_report_metrics(todas_vendas)
+        # Período que não é formado por meses inteiros usa o resumo diário
+        assert get_report_data(
+            date(2025, 10, 4), date(2025, 10, 5), session
+        ) == calculate_report_metrics(vendas_outubro[:2])
+        assert get_report_data(date(2025, 12, 1), date(2026, 1, 1), session) is None
+
+        ranking = get_dias_movimento(date(2025, 10, 1), date(2025, 11, 1), session)
+        assert ranking == [("Saturday", 1250.35), ("Friday", 730.0)]
+
+
+def test_recalcular_resumos_reproduz_incremental():
+    _registrar_vendas_feira(
+        [
+            ("2025-10-04", 1000.10, 100.0, 20.0),
+            ("2025-10-31", 250.25, 0.0, 5.0),
+            ("2025-11-01", 410.0, 50.0, 10.0),
+        ]
+    )
+
+    with Session(engine) as session:
+        diario = session.exec(
+            select(ResumoVendaDiario).order_by(ResumoVendaDiario.data)
+        ).all()
+        mensal = session.exec(select(ResumoVendaMensal)).all()
+        esperado = (
+            [r.model_dump() for r in diario],
+            sorted(r.model_dump().items() for r in mensal),
+        )
+
+        # Recalcula só os dias de outubro e depois tudo
+        recalcular_resumos(session, [date(2025, 10, 4), date(2025, 10, 31)])
+        session.commit()
+        recalcular_resumos(session)
+        session.commit()
+        session.expire_all()
+
+        diario = session.exec(
+            select(ResumoVendaDiario).order_by(ResumoVendaDiario.data)
+        ).all()
+        mensal = session.exec(select(ResumoVendaMensal)).all()
+        assert (
+            [r.model_dump() for r in diario],
+            sorted(r.model_dump().items() for r in mensal),
+        ) == esperado
+
+
+def test_agregacao_sql_equivale_a_calculate_report_metrics():
+    rnd = random.Random(2025)
+
+    def valor():
+        return round(rnd.uniform(0, 2000), 2)
+
+    with Session(engine) as session:
+        produto = Produto(nome="Pilsen", preco_venda_barril_fechado=600.0)
+        session.add(produto)
+        session.commit()
+        dia = date(2024, 1, 1)
+        while dia < date(2026, 1, 1):
+            for _ in range(rnd.choice([0, 1, 1, 2])):
+                session.add(
+                    Venda(
+                        data=dia,
+                        dia_semana=dia.strftime("%A"),
+                        tipo_venda="feira",
+                        total=valor(),
+                        cartao=valor(),
+                        dinheiro=valor(),
+                        pix=valor(),
+                        custo_func=rnd.choice([None, valor()]),
+                        custo_copos=rnd.choice([None, valor()]),
+                        custo_boleto=rnd.choice([None, 0.0, valor()]),
+                        lucro=valor(),
+                        produto_id=produto.id,
+                    )
+                )
+            dia += timedelta(days=1)
+        recalcular_resumos(session)
+        session.commit()
+
+        periodos = [(date(2024, 1, 1), date(2025, 1, 1))]
+        periodos += [
+            (date(2025, m, 1), date(2025 + (m == 12), m % 12 + 1, 1))
+            for m in range(1, 13)
+        ]
+        periodos += [
+            (date(2024, 3, 15), date(2024, 4, 20)),
+            (date(2025, 2, 1), date(2025, 2, 2)),
+        ]
+        for inicio, fim in periodos:
+            vendas = session.exec(
+                select(Venda).where(Venda.data >= inicio, Venda.data < fim)
+            ).all()
+            esperado = calculate_report_metrics(vendas) if vendas else None
+            assert get_report_data(inicio, fim, session) == esperado, (inicio, fim)
+
+
+def test_cache_de_relatorio_invalidado_por_nova_venda():
+    _registrar_vendas_feira([("2025-10-04", 1000.0, 100.0, 20.0)])
+    hits, misses = report_cache.hits, report_cache.misses
+
+    with Session(engine) as session:
+        outubro = get_report_data(date(2025, 10, 1), date(2025, 11, 1), session)
+        novembro = get_report_data(date(2025, 11, 1), date(2025, 12, 1), session)
+        assert get_report_data(date(2025, 10, 1), date(2025, 11, 1), session) == (
+            outubro
+        )
+        assert get_report_data(date(2025, 11, 1), date(2025, 12, 1), session) is None
+    assert report_cache.misses - misses == 2
+    assert report_cache.hits - hits == 2
+
+    # Venda em novembro invalida só o período que a contém
+    client.post(
+        "/registrar_venda",
+        data={
+            "data": "2025-11-08",
+            "produto_id": 1,
+            "tipo_venda": "feira",
+            "total": 300.0,
+            "cartao": 300.0,
+            "dinheiro": 0.0,
+            "pix": 0.0,
+        },
+    )
+    with Session(engine) as session:
+        assert get_report_data(date(2025, 10, 1), date(2025, 11, 1), session) == (
+            outubro
+        )
+        novembro = get_report_data(date(2025, 11, 1), date(2025, 12, 1), session)
+    assert novembro["receita_bruta"] == 300.0
+    assert report_cache.misses - misses == 3
+    assert report_cache.hits - hits == 3
+
+    response = client.get("/relatorios/cache")
+    assert response.status_code == 200
+    assert response.json()["hits"] == report_cache.hits
+
+
+# --- Teste de Concorrência ---
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+CONSULTA_LENTA = text(
+    "WITH RECURSIVE n(i) AS "
+    "(SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 3000000) "
+    "SELECT count(*) FROM n"
+)
+
+
+def _relatorio_lento(inicio, fim, sess):
+    """Simula um relatório pesado executando uma consulta demorada no banco."""
+    sess.exec(CONSULTA_LENTA).one()
+    return None
+
+
+@pytest.mark.anyio
+@patch("app.main.validator.validate", return_value=True)
+@patch("app.main.get_report_data", side_effect=_relatorio_lento)
+async def test_relatorio_lento_nao_bloqueia_outras_requisicoes(
+    mock_get_report, mock_validate
+):
+    """Uma consulta de relatório demorada não deve atrasar o GET /produtos."""
+    with Session(engine) as session:
+        session.add(
+            Produto(
+                nome="Chopp Pilsen",
+                preco_venda_litro=15.0,
+                preco_venda_barril_fechado=500.0,
+            )
+        )
+        session.commit()
+
+    concluidas = []
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://test",
+        auth=("admin", "admin"),
+    ) as ac:
+
+        async def relatorio():
+            response = await ac.post(
+                "/whatsapp/webhook", data={"Body": "relatorio 1 2024"}
+            )
+            concluidas.append(("relatorio", response.status_code))
+
+        async def produtos():
+            # Garante que o relatório já começou a executar a consulta lenta
+            await anyio.sleep(0.05)
+            response = await ac.get("/produtos")
+            concluidas.append(("produtos", response.status_code))
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(relatorio)
+            tg.start_soon(produtos)
+
+    assert concluidas == [("produtos", 200), ("relatorio", 200)]
+    mock_get_report.assert_called()
+
+
+@pytest.mark.anyio
+@patch("app.main.validator.validate", return_value=True)
+@patch("app.main.get_report_data", return_value=None)
+async def test_webhook_modo_diferido_responde_vazio_e_envia_depois(
+    mock_get_report, mock_validate
+):
+    """No modo diferido o webhook só enfileira; o relatório chega pelo enviador."""
+    enviador = EnviadorLocal()
+    fila = FilaRespostas(responder_comando, enviador, backoff=0)
+
+    with patch("app.main.fila_respostas", fila):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as ac:
+            response = await ac.post(
+                "/whatsapp/webhook",
+                data={"Body": "relatorio 1 2024", "From": "whatsapp:+5511999999999"},
+            )
+            assert response.status_code == 200
+            assert "<Message>" not in response.text
+            assert fila.stats()["profundidade"] == 1
+            mock_get_report.assert_not_called()
+
+            fila.iniciar()
+            await fila.aguardar()
+            await fila.parar()
+
+            response = await ac.get("/whatsapp/fila", auth=("admin", "admin"))
+
+    assert enviador.enviadas == [
+        (
+            "whatsapp:+5511999999999",
+            "Nenhum registro de vendas encontrado para 1/2024.",
+        )
+    ]
+    assert response.json()["modo"] == "diferido"
+    assert response.json()["enviadas"] == 1
+
+
+# --- Testes de Vendas em Lote ---
+
+VENDAS_LOTE = [
+    {
+        "data": "2024-06-01",
+        "produto_id": 1,
+        "tipo_venda": "feira",
+        "total": 400.0,
+        "cartao": 300.0,
+        "dinheiro": 100.0,
+        "pix": 0.0,
+        "custo_func": 80.0,
+        "custo_copos": 12.5,
+        "custo_boleto": 0.0,
+    },
+    {
+        "data": "2024-06-01",
+        "produto_id": 2,
+        "tipo_venda": "barril_festas",
+        "quantidade_barris_vendidos": 2,
+        "cartao": 0.0,
+        "dinheiro": 0.0,
+        "pix": 1500.0,
+    },
+    {
+        "data": "2024-06-02",
+        "produto_id": 1,
+        "tipo_venda": "feira",
+        "total": 250.0,
+        "cartao": 0.0,
+        "dinheiro": 0.0,
+        "pix": 250.0,
+        "custo_func": 60.0,
+    },
+    {
+        "data": "2024-07-01",
+        "produto_id": 2,
+        "tipo_venda": "barril_festas",
+        "quantidade_barris_vendidos": 1,
+        "cartao": 750.0,
+        "dinheiro": 0.0,
+        "pix": 0.0,
+    },
+]
+
+
+def _preparar_produtos_lote():
+    client.auth = ("admin", "admin")
+    for nome, preco_barril, preco_litro in (
+        ("Pilsen", 600.0, 20.0),
+        ("IPA", 750.0, 25.0),
+    ):
+        client.post(
+            "/produtos",
+            data={
+                "nome": nome,
+                "preco_venda_barril_fechado": preco_barril,
+                "preco_venda_litro": preco_litro,
+            },
+        )
+    for produto_id, custo in ((1, 280.0), (2, 310.0), (2, 335.5)):
+        client.post(
+            "/estoque/entrada",
+            data={
+                "produto_id": produto_id,
+                "quantidade": 5,
+                "custo_unitario": custo,
+                "data_movimento": "2024-05-30",
+            },
+        )
+
+
+def _estado_do_banco():
+    """Vendas, movimentos, saldos e resumos, sem os ids gerados."""
+    with Session(engine) as session:
+        return [
+            [
+                {k: v for k, v in linha.model_dump().items() if k != "id"}
+                for linha in session.exec(select(modelo)).all()
+            ]
+            for modelo in (
+                Venda,
+                MovimentoEstoque,
+                SaldoEstoque,
+                ResumoVendaDiario,
+                ResumoVendaMensal,
+            )
+        ]
+
+
+def test_vendas_lote_igual_a_vendas_individuais():
+    """O lote grava exatamente o mesmo que as vendas enviadas uma a uma."""
+    _preparar_produtos_lote()
+    for venda in VENDAS_LOTE:
+        response = client.post("/registrar_venda", data=venda)
+        assert response.status_code == 200
+    individuais = _estado_do_banco()
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    _preparar_produtos_lote()
+    response = client.post("/vendas/lote", json=VENDAS_LOTE)
+
+    assert response.status_code == 200
+    resultado = response.json()
+    assert resultado["registradas"] == 4
+    assert [item["id"] for item in resultado["itens"]] == [1, 2, 3, 4]
+    assert resultado["itens"][1]["total"] == 1500.0
+    assert resultado["itens"][1]["lucro"] == pytest.approx(1500.0 - 2 * 322.75)
+    assert _estado_do_banco() == individuais
+
+
+def test_vendas_lote_com_item_invalido_nao_grava_nada():
+    _preparar_produtos_lote()
+    antes = _estado_do_banco()
+    itens = [
+        VENDAS_LOTE[0],
+        {"data": "2024-06-01", "produto_id": 99, "tipo_venda": "feira", "total": 1},
+        {"data": "2024-06-01", "produto_id": 1, "tipo_venda": "feira"},
+        {"data": "2024-06-01", "produto_id": 1, "tipo_venda": "chopp"},
+    ]
+    response = client.post("/vendas/lote", json=itens)
+
+    assert response.status_code == 422
+    assert response.json() == {
+        "registradas": 0,
+        "itens": [
+            {"indice": 0, "ok": True},
+            {"indice": 1, "ok": False, "erro": "Produto não encontrado."},
+            {
+                "indice": 2,
+                "ok": False,
+                "erro": "Total da venda é obrigatório para vendas de feira.",
+            },
+            {
+                "indice": 3,
+                "ok": False,
+                "erro": "Tipo de venda inválido. Use 'feira' ou 'barril_festas'.",
+            },
+        ],
+    }
+    assert _estado_do_banco() == antes
+
+
+def test_vendas_lote_vazio():
+    _preparar_produtos_lote()
+    antes = _estado_do_banco()
+    response = client.post("/vendas/lote", json=[])
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "O lote não tem nenhuma venda."}
+    assert _estado_do_banco() == antes
+
+
+# --- Réplica de leitura ---
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """
+    Simula a réplica de leitura com um segundo arquivo SQLite. A replicação é
+    uma cópia do banco principal, feita quando o teste chama `replicar()`.
+    """
+    principal = make_url(DATABASE_URL).database
+    caminho = tmp_path / "replica.db"
+    replica_engine = criar_async_engine(
+        f"sqlite:///{caminho}", somente_leitura=True, poolclass=NullPool
+    )
+
+    async def get_replica_session():
+        async with AsyncSession(replica_engine, expire_on_commit=False) as session:
+            yield session
+
+    def replicar():
+        origem, destino = sqlite3.connect(principal), sqlite3.connect(caminho)
+        origem.backup(destino)
+        origem.close()
+        destino.close()
+        report_cache.clear()
+
+    replicar()
+    app.dependency_overrides[get_async_read_session] = get_replica_session
+    yield replicar
+    app.dependency_overrides[get_async_read_session] = get_async_session_override
+
+
+def test_consultas_usam_a_replica_de_leitura(replica):
+    client.auth = ("admin", "admin")
+    client.post(
+        "/produtos", data={"nome": "Chopp IPA", "preco_venda_barril_fechado": 750.0}
+    )
+
+    # A escrita foi para o principal; a réplica ainda não recebeu o produto
+    assert client.get("/produtos").json() == []
+    assert client.get("/estoque").json() == {}
+
+    replica()
+    assert [p["nome"] for p in client.get("/produtos").json()] == ["Chopp IPA"]
+    assert list(client.get("/estoque").json()) == ["Chopp IPA"]
+
+
+@patch("app.main.validator.validate", return_value=True)
+def test_relatorio_do_whatsapp_le_da_replica(mock_validate, replica):
+    _registrar_vendas_feira([("2025-10-04", 1000.0, 100.0, 20.0)])
+
+    response = client.post("/whatsapp/webhook", data={"Body": "relatorio 10 2025"})
+    assert "Nenhum registro de vendas encontrado para 10/2025" in response.text
+
+    replica()
+    response = client.post("/whatsapp/webhook", data={"Body": "relatorio 10 2025"})
+    assert "Nenhum registro" not in response.text
+    assert "Receita bruta: R$ 1000.00" in response.text
+
+
+# --- Métricas ---
+
+
+def _amostra(nome, **rotulos):
+    return metricas.registro.get_sample_value(nome, rotulos) or 0.0
+
+
+def _requisicoes(metodo, rota, comando="", status="200"):
+    return _amostra(
+        "chopp_requisicao_duracao_segundos_count",
+        metodo=metodo,
+        rota=rota,
+        comando=comando,
+        status=status,
+    )
+
+
+def test_metrics_exige_autenticacao():
+    client.auth = None
+    assert client.get("/metrics").status_code == 401
+
+
+def test_rotulo_comando_do_whatsapp():
+    assert rotulo_comando("Relatório anual 2025") == "relatorio anual"
+    assert rotulo_comando("melhores dias 10 2025") == "melhores dias"
+    assert rotulo_comando("comparar 1 2025 2 2025") == "comparar"
+    assert rotulo_comando("oi, tudo bem?") == "desconhecido"
+    assert rotulo_comando("   ") == "desconhecido"
+
+
+@patch("app.main.validator.validate", return_value=True)
+def test_metrics_por_rota_comando_e_banco(mock_validate):
+    metricas.monitorar_engine(async_engine.sync_engine)
+    client.auth = ("admin", "admin")
+    webhook = ("POST", "/whatsapp/webhook")
+    antes = {
+        "produtos": _requisicoes("GET", "/produtos"),
+        "relatorio": _requisicoes(*webhook, comando="relatorio"),
+        "ajuda": _requisicoes(*webhook, comando="ajuda"),
+        "inexistente": _requisicoes("GET", "nao_encontrada", status="404"),
+        "sql": _amostra(
+            "chopp_sql_comandos_por_requisicao_sum", metodo="GET", rota="/produtos"
+        ),
+    }
+
+    client.get("/produtos")
+    client.post("/whatsapp/webhook", data={"Body": "relatorio 10 2025"})
+    client.post("/whatsapp/webhook", data={"Body": "relatorio 11 2025"})
+    client.post("/whatsapp/webhook", data={"Body": "ajuda"})
+    client.get("/nao-existe/123")
+
+    assert _requisicoes("GET", "/produtos") == antes["produtos"] + 1
+    assert _requisicoes(*webhook, comando="relatorio") == antes["relatorio"] + 2
+    assert _requisicoes(*webhook, comando="ajuda") == antes["ajuda"] + 1
+    # URLs sem rota ficam todas na mesma série
+    assert (
+        _requisicoes("GET", "nao_encontrada", status="404") == antes["inexistente"] + 1
+    )
+    # A listagem de produtos faz ao menos um SELECT
+    assert (
+        _amostra(
+            "chopp_sql_comandos_por_requisicao_sum", metodo="GET", rota="/produtos"
+        )
+        > antes["sql"]
+    )
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # A própria coleta está em andamento
+    assert "chopp_requisicoes_em_andamento 1.0" in response.text
+    assert (
+        'chopp_whatsapp_comando_duracao_segundos_count{comando="relatorio"}'
+        in response.text
+    )
+    assert "chopp_sql_tempo_por_requisicao_segundos_bucket" in response.text
+
+
+# --- Orçamento de comandos SQL ---
+
+
+def _webhook(comando):
+    # Mede a consulta ao banco, não o cache de relatórios
+    report_cache.clear()
+    return client.post("/whatsapp/webhook", data={"Body": comando})
+
+
+# Endpoint -> (requisição, máximo de comandos SQL), independente do catálogo
+ORCAMENTOS_SQL = {
+    "GET /": (lambda: client.get("/"), 1),
+    "GET /produtos": (lambda: client.get("/produtos"), 1),
+    "POST /produtos": (
+        lambda: client.post(
+            "/produtos", data={"nome": "Weiss", "preco_venda_barril_fechado": 700.0}
+        ),
+        3,
+    ),
+    "POST /registrar_venda feira": (
+        lambda: client.post(
+            "/registrar_venda",
+            data={
+                "data": "2024-06-01",
+                "produto_id": 1,
+                "tipo_venda": "feira",
+                "total": 500.0,
+                "cartao": 500.0,
+                "dinheiro": 0.0,
+                "pix": 0.0,
+            },
+        ),
+        7,
+    ),
+    "POST /registrar_venda barril": (
+        lambda: client.post(
+            "/registrar_venda",
+            data={
+                "data": "2024-06-02",
+                "produto_id": 1,
+                "tipo_venda": "barril_festas",
+                "quantidade_barris_vendidos": 1,
+                "cartao": 0.0,
+                "dinheiro": 0.0,
+                "pix": 600.0,
+            },
+        ),
+        8,
+    ),
+    "POST /vendas/lote": (
+        lambda: client.post("/vendas/lote", json=[VENDAS_LOTE[0], VENDAS_LOTE[2]]),
+        9,
+    ),
+    "GET /relatorios/cache": (lambda: client.get("/relatorios/cache"), 0),
+    "GET /metrics": (lambda: client.get("/metrics"), 0),
+    "GET /whatsapp/fila": (lambda: client.get("/whatsapp/fila"), 0),
+    "webhook relatorio": (lambda: _webhook("relatorio 6 2024"), 2),
+    "webhook relatorio anual": (lambda: _webhook("relatorio anual 2024"), 1),
+    "webhook comparar": (lambda: _webhook("comparar 5 2024 6 2024"), 2),
+    "webhook melhores dias": (lambda: _webhook("melhores dias 6 2024"), 1),
+    "webhook ajuda": (lambda: _webhook("ajuda"), 0),
+}
+
+
+@pytest.mark.parametrize("endpoint", ORCAMENTOS_SQL)
+@patch("app.main.validator.validate", return_value=True)
+def test_orcamento_sql_constante_com_o_catalogo(
+    mock_validate, endpoint, limite_sql, completar_catalogo
+):
+    requisicao, maximo = ORCAMENTOS_SQL[endpoint]
+    client.auth = ("admin", "admin")
+    completar_catalogo(engine, 1)
+    # Vendas já registradas: os relatórios têm o que somar e as novas vendas
+    # caem em dias que já têm resumo
+    client.post("/vendas/lote", json=[VENDAS_LOTE[0], VENDAS_LOTE[2]])
+    contagens = []
+    for produtos in (1, 10, 100):
+        completar_catalogo(engine, produtos)
+        with limite_sql(maximo, engine, async_engine) as comandos:
+            response = requisicao()
+        assert response.status_code == 200, response.text
+        contagens.append(len(comandos))
+    # Sem N+1: a quantidade de comandos não cresce com o número de produtos
+    assert contagens == [contagens[0]] * 3
@@ -0,0 +1,92 @@
+import sys
+import os
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.mensagens import Enviador, EnviadorLocal, FilaRespostas, criar_fila
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def _eco(comando: str) -> str:
+    return f"resposta: {comando}"
+
+
+@pytest.mark.anyio
+async def test_fila_envia_respostas_na_ordem():
+    enviador = EnviadorLocal()
+    fila = FilaRespostas(_eco, enviador, workers=1, backoff=0)
+    fila.enfileirar("whatsapp:+5511", "ajuda")
+    fila.enfileirar("whatsapp:+5522", "relatorio 1 2024")
+    assert fila.stats()["profundidade"] == 2
+
+    fila.iniciar()
+    await fila.aguardar()
+    await fila.parar()
+
+    assert enviador.enviadas == [
+        ("whatsapp:+5511", "resposta: ajuda"),
+        ("whatsapp:+5522", "resposta: relatorio 1 2024"),
+    ]
+    stats = fila.stats()
+    assert stats["profundidade"] == 0
+    assert stats["profundidade_maxima"] == 2
+    assert stats["enviadas"] == 2
+
+
+@pytest.mark.anyio
+async def test_fila_tenta_novamente_apos_falha_no_envio():
+    enviador = EnviadorLocal(falhas=2)
+    fila = FilaRespostas(_eco, enviador, max_tentativas=3, backoff=0)
+    fila.iniciar()
+    fila.enfileirar("whatsapp:+5511", "ajuda")
+    await fila.aguardar()
+    await fila.parar()
+
+    assert enviador.enviadas == [("whatsapp:+5511", "resposta: ajuda")]
+    assert fila.stats()["retentativas"] == 2
+    assert fila.stats()["falhas"] == 0
+
+
+@pytest.mark.anyio
+async def test_fila_desiste_apos_esgotar_tentativas():
+    enviador = EnviadorLocal(falhas=5)
+    fila = FilaRespostas(_eco, enviador, max_tentativas=3, backoff=0)
+    fila.iniciar()
+    fila.enfileirar("whatsapp:+5511", "ajuda")
+    await fila.aguardar()
+    await fila.parar()
+
+    assert enviador.enviadas == []
+    assert fila.stats()["retentativas"] == 2
+    assert fila.stats()["falhas"] == 1
+
+
+@pytest.mark.anyio
+async def test_fila_cheia_recusa_comando():
+    fila = FilaRespostas(_eco, EnviadorLocal(), maxsize=1)
+    assert fila.enfileirar("whatsapp:+5511", "ajuda")
+    assert not fila.enfileirar("whatsapp:+5511", "ajuda")
+    assert fila.stats()["descartadas"] == 1
+
+
+def test_criar_fila_por_variavel_de_ambiente(monkeypatch):
+    monkeypatch.delenv("WHATSAPP_MODO_RESPOSTA", raising=False)
+    assert criar_fila(_eco) is None
+
+    monkeypatch.setenv("WHATSAPP_MODO_RESPOSTA", "diferido")
+    monkeypatch.setenv("WHATSAPP_ENVIADOR", "local")
+    fila = criar_fila(_eco)
+    assert isinstance(fila.enviador, EnviadorLocal)
+
+
+def test_enviador_sem_enviar_nao_pode_ser_criado():
+    class SemEnvio(Enviador):
+        nome = "incompleto"
+
+    with pytest.raises(TypeError):
+        SemEnvio()
@@ -0,0 +1,145 @@
+import hashlib
+import shutil
+import sys
+import os
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlmodel import SQLModel
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import run_etl
+from etl import clean_data, origem
+
+
+class Planilhas(BaseHTTPRequestHandler):
+    """Servidor local no lugar do Google Sheets, com ETag e Last-Modified."""
+
+    conteudo = b""
+    validadores = True
+    requisicoes: list = []
+
+    def do_GET(self):
+        etag = f'"{hashlib.sha256(self.conteudo).hexdigest()[:16]}"'
+        modificado = formatdate(1_700_000_000 + len(self.conteudo), usegmt=True)
+        self.requisicoes.append(dict(self.headers))
+        if self.validadores and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.conteudo)))
+        if self.validadores:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", modificado)
+        self.end_headers()
+        self.wfile.write(self.conteudo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def banco():
+    """O registro das cargas fica no banco de teste, limpo a cada teste."""
+    SQLModel.metadata.create_all(run_etl.engine)
+    yield
+    SQLModel.metadata.drop_all(run_etl.engine)
+
+
+@pytest.fixture
+def servidor(tmp_path, monkeypatch):
+    monkeypatch.setattr(origem, "ETL_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(Planilhas, "conteudo", b"planilha v1")
+    monkeypatch.setattr(Planilhas, "validadores", True)
+    monkeypatch.setattr(Planilhas, "requisicoes", [])
+    http = ThreadingHTTPServer(("127.0.0.1", 0), Planilhas)
+    thread = threading.Thread(target=http.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{http.server_address[1]}/export?format=xlsx"
+    http.shutdown()
+    http.server_close()
+
+
+def test_download_fica_em_cache_e_e_revalidado(servidor):
+    primeira = origem.criar_origem(servidor).obter()
+    assert primeira.baixada
+    assert primeira.caminho.read_bytes() == b"planilha v1"
+
+    segunda = origem.criar_origem(servidor).obter()
+    assert not segunda.baixada
+    assert segunda.sha256 == primeira.sha256
+    assert Planilhas.requisicoes[-1]["If-None-Match"]
+    assert Planilhas.requisicoes[-1]["If-Modified-Since"]
+
+    Planilhas.conteudo = b"planilha v2"
+    terceira = origem.criar_origem(servidor).obter()
+    assert terceira.baixada
+    assert terceira.sha256 != primeira.sha256
+    assert terceira.caminho.read_bytes() == b"planilha v2"
+
+
+def test_servidor_sem_validadores_usa_hash_do_conteudo(servidor):
+    Planilhas.validadores = False
+    primeira = origem.criar_origem(servidor).obter()
+    segunda = origem.criar_origem(servidor).obter()
+    assert primeira.baixada and segunda.baixada
+    assert "If-None-Match" not in Planilhas.requisicoes[-1]
+    assert segunda.sha256 == primeira.sha256
+
+
+def test_origem_local(tmp_path):
+    caminho = tmp_path / "planilha.xlsx"
+    caminho.write_bytes(b"local")
+    planilha = origem.criar_origem(str(caminho)).obter()
+    assert planilha.caminho == caminho
+    assert planilha.sha256 == origem.hash_arquivo(caminho)
+
+
+def test_run_etl_termina_cedo_com_planilha_inalterada(servidor, monkeypatch, tmp_path):
+    chamadas = []
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", servidor)
+    monkeypatch.setattr(
+        run_etl,
+        "clean_master",
+        lambda destino, caminho: chamadas.append(("clean", caminho)),
+    )
+    monkeypatch.setattr(run_etl, "load", lambda: chamadas.append(("load",)))
+    relatorio = ["--relatorio", str(tmp_path / "relatorio.json")]
+
+    assert run_etl.main(relatorio) == 0
+    assert [c[0] for c in chamadas] == ["clean", "load"]
+
+    # Mesma planilha: nem limpeza nem carga
+    chamadas.clear()
+    assert run_etl.main(relatorio) == 0
+    assert chamadas == []
+
+    # A última carga fica no banco: sem o cache local (outro host), a planilha
+    # é baixada de novo mas continua reconhecida como inalterada
+    shutil.rmtree(tmp_path / "cache")
+    assert run_etl.main(relatorio) == 0
+    assert chamadas == []
+
+    assert run_etl.main(["--forcar", *relatorio]) == 0
+    assert [c[0] for c in chamadas] == ["clean", "load"]
+
+    chamadas.clear()
+    Planilhas.conteudo = b"planilha v2"
+    assert run_etl.main(relatorio) == 0
+    assert [c[0] for c in chamadas] == ["clean", "load"]
+
+
+def test_run_etl_nao_registra_carga_que_falhou(servidor, monkeypatch, tmp_path):
+    monkeypatch.setattr(clean_data, "SHEETS_XLSX_URL", servidor)
+    monkeypatch.setattr(run_etl, "clean_master", lambda destino, caminho: None)
+
+    def falhar():
+        raise RuntimeError("banco fora do ar")
+
+    monkeypatch.setattr(run_etl, "load", falhar)
+    assert run_etl.main(["--relatorio", str(tmp_path / "relatorio.json")]) == 1
+    assert origem.EstadoCargas(run_etl.engine).ultima() is None
@@ -0,0 +1,51 @@
+import sys
+import os
+import gzip
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.paginas import PaginaTemplate, escolher_codificacao, etag_corresponde
+
+
+def test_escolher_codificacao():
+    disponiveis = {None, "gzip", "br"}
+    assert escolher_codificacao("", disponiveis) is None
+    assert escolher_codificacao("gzip, deflate, br", disponiveis) == "br"
+    assert escolher_codificacao("gzip, br;q=0", disponiveis) == "gzip"
+    assert escolher_codificacao("br;q=0.5, gzip", disponiveis) == "gzip"
+    assert escolher_codificacao("*", {None, "gzip"}) == "gzip"
+    assert escolher_codificacao("identity", disponiveis) is None
+
+
+def test_etag_corresponde():
+    assert etag_corresponde('"abc"', '"abc"')
+    assert etag_corresponde('"x", W/"abc"', '"abc"')
+    assert etag_corresponde("*", '"abc"')
+    assert not etag_corresponde('"abcd"', '"abc"')
+
+
+def test_template_renderizado_e_comprimido_uma_vez_por_conteudo(tmp_path):
+    (tmp_path / "pagina.html").write_text("<p>{{ nome }}</p>", encoding="utf-8")
+    pagina = PaginaTemplate("pagina.html", diretorio=tmp_path)
+
+    primeiro = pagina.renderizar(nome="<IPA>")
+    assert primeiro.corpos[None] == b"<p>&lt;IPA&gt;</p>"
+    assert gzip.decompress(primeiro.corpos["gzip"]) == primeiro.corpos[None]
+    # Mesmo resultado: reaproveita as variantes já comprimidas
+    assert pagina.renderizar(nome="<IPA>") is primeiro
+    assert pagina.renderizar(nome="Pilsen").etags[None] != primeiro.etags[None]
+
+
+def test_template_recarrega_quando_arquivo_muda(tmp_path):
+    arquivo = tmp_path / "pagina.html"
+    arquivo.write_text("<p>v1</p>", encoding="utf-8")
+    fixa = PaginaTemplate("pagina.html", diretorio=tmp_path)
+    dev = PaginaTemplate("pagina.html", diretorio=tmp_path, reload=True)
+    assert fixa.renderizar().corpos[None] == b"<p>v1</p>"
+    assert dev.renderizar().corpos[None] == b"<p>v1</p>"
+
+    arquivo.write_text("<p>v2</p>", encoding="utf-8")
+    os.utime(arquivo, ns=(0, 10**18))
+
+    assert fixa.renderizar().corpos[None] == b"<p>v1</p>"
+    assert dev.renderizar().corpos[None] == b"<p>v2</p>"